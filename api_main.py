@@ -91,6 +91,7 @@ async def upload_document(file: UploadFile = File(...)):
 
     # 2. Define the generator that yields status updates
     async def event_generator():
+        processor = None
         try:
             processor = DocumentProcessor()
             # Pass the physical file path instead of raw bytes
@@ -100,6 +101,8 @@ async def upload_document(file: UploadFile = File(...)):
             logger.error(f"Upload stream error: {e}")
             yield f"data: {json.dumps({'error': str(e)})}\n\n"
         finally:
+            if processor is not None:
+                processor.close()
             if os.path.exists(temp_path):
                 try:
                     os.remove(temp_path)
@@ -24,7 +24,13 @@ class Settings(BaseSettings):
     OLLAMA_URL: str = "http://localhost:11434"
     OLLAMA_LLM_MODEL: str = "llama3.1:8b"
     OLLAMA_EMBEDDING_MODEL: str = "nomic-embed-text"
+    OLLAMA_EMBED_BATCH_SIZE: int = 64
+    OLLAMA_EMBED_CONCURRENCY: int = 4
+    EMBED_BATCH_WINDOW_MS: float = 3.0  # Micro-batching window for query embeddings
+    EMBED_MAX_BATCH_SIZE: int = 32
     os.environ["OLLAMA_API_KEY"] = "ollama"
+    STREAM_GENERATION: bool = True  # Forward answer tokens as SSE 'token' events as Ollama produces them
+    STREAM_MODES: List[str] = ["fast", "graph"]  # Adding "deep" streams it too, guard-checked afterwards but without a rationale
 
     # Vector Store
     CHROMADB_PATH: str = "./data/chroma"
@@ -39,11 +45,50 @@ class Settings(BaseSettings):
     ENABLE_QUERY_EXPANSION: bool = True
     HYBRID_SEARCH_ALPHA: float = 0.5  # Weight for semantic
     RERANK_TOP_K: int = 10
+    RERANK_BATCH_SIZE: int = 32  # Pairs per CrossEncoder forward pass
+    RERANK_BATCH_WINDOW_MS: float = 2.0  # Pooling window for pairs from concurrent requests
+    RERANK_THREADS: Optional[int] = None  # torch intra-op threads for the reranker thread (None: torch default)
+    INFERENCE_BACKEND: str = "torch"  # CrossEncoder / chunking model: "torch", "onnx" or "onnx-int8" (CPU)
+    ONNX_CACHE_DIR: str = "./data/onnx"  # Exported (and quantized) graphs, built on first use
+    ONNX_THREADS: Optional[int] = None  # onnxruntime intra-op threads (None: all cores)
+    FUSION_METHOD: str = "rrf"  # "rrf" (rank based) or "score" (min-max normalized scores)
+    RRF_K: int = 60
+    RETRIEVAL_CANDIDATE_FACTOR: int = 20  # Per-backend fetch = top_k * factor
+    FUSION_CANDIDATE_FACTOR: int = 3  # Fused ids fetched for re-ranking = top_k * factor
+    # Per-backend retrieval timeouts (seconds); a late backend is left out of fusion
+    VECTOR_SEARCH_TIMEOUT: float = 3.0
+    BM25_SEARCH_TIMEOUT: float = 1.0
+    GRAPH_SEARCH_TIMEOUT: float = 2.0
+    # Retrieve for the raw question while routing / rewriting run; kept if the final query is this similar
+    SPECULATIVE_RETRIEVAL: bool = True
+    SPECULATION_SIMILARITY: float = 0.8  # Term overlap (Jaccard) between the raw and rewritten query
+    
+    # Adaptive routing: local nearest-centroid router over query embeddings, LLM router below the threshold
+    LOCAL_ROUTER_ENABLED: bool = True
+    ROUTER_MODEL_PATH: str = "./data/router.json"  # Built by train_router.py
+    ROUTER_LOG_PATH: str = "./data/routing_log.jsonl"  # LLM routing decisions, the router's training data
+    ROUTER_CONFIDENCE_THRESHOLD: float = 0.6
+    ROUTER_TEMPERATURE: float = 0.05  # Softmax temperature over centroid cosine similarities
+    
+    # CRAG relevance grading
+    CRAG_GRADING_MODE: str = "batch"  # "batch" (one LLM call), "concurrent", "serial" or "cross_encoder" (no LLM)
+    CRAG_MAX_CONCURRENCY: int = 4  # In-flight LLM calls for "concurrent"
+    CRAG_RELEVANCE_THRESHOLD: float = 0.0  # Cross-encoder logit a chunk must clear in "cross_encoder" mode
+    CRAG_COMPARE_SAMPLE_RATE: float = 0.0  # Share of requests re-graded with every mode in the background
+    
+    # Hallucination guard (deep mode); the LLM guard only runs when the NLI verdict is not confident
+    GUARD_NLI_MODEL: str = "cross-encoder/nli-deberta-v3-xsmall"  # Empty: embedding check only
+    GUARD_ENTAILMENT_THRESHOLD: float = 0.7
+    GUARD_CONTRADICTION_THRESHOLD: float = 0.7
     
     # BM25
     BM25_K1: float = 1.5
     BM25_B: float = 0.75
-    BM25_SHARD_SIZE: int = 10000
+    BM25_SHARD_SIZE: int = 10000  # DistributedBM25 only (library use; RAGService does not shard)
+    BM25_COMPACTION_RATIO: float = 0.2  # Tombstoned share of the index that triggers compaction
+    BM25_MAX_DELTAS: int = 8  # Upload delta segments kept before they are merged into the base index
+    BM25_GENERATION_BACKEND: str = "file"  # "file" or "redis" (REDIS_URL)
+    BM25_REFRESH_INTERVAL: float = 0.5  # Seconds between background generation checks
     BM25_USE_ELASTICSEARCH: bool = False
     ELASTICSEARCH_URL: Optional[str] = None
     
@@ -53,13 +98,19 @@ class Settings(BaseSettings):
     ENABLE_SEMANTIC_CHUNKING: bool = True
     SEMANTIC_CHUNK_THRESHOLD: float = 0.7
     
-    # Context Compression
+    # Context Compression (extractive: query-relevant sentences packed into a token budget)
     ENABLE_CONTEXT_COMPRESSION: bool = True
-    CONTEXT_COMPRESSION_RATIO: float = 0.5
-    MAX_CONTEXT_LENGTH: int = 8192
+    CONTEXT_COMPRESSION_RATIO: float = 0.5  # Budget = ratio * context tokens ...
+    MAX_CONTEXT_LENGTH: int = 8192  # ... capped at this many tokens
+    CONTEXT_COMPRESSION_MIN_TOKENS: int = 512  # Smaller contexts are left alone; the budget never drops below
+    CONTEXT_DEDUP_THRESHOLD: float = 0.92  # Sentence cosine above which overlapping chunks count as repeats
+    COMPRESSION_TOKENIZER: Optional[str] = "NousResearch/Meta-Llama-3.1-8B-Instruct"  # Tokenizer of OLLAMA_LLM_MODEL
     
     # Advanced Quantization & vLLM Compression
     QUANTIZATION_BITS: int = 3
+    POLARQUANT_ROTATION: str = "hadamard"  # "hadamard" (O(d log d)) or "random_gaussian" (dense QR)
+    QUANTIZER_SHARED_MEMORY: bool = False  # Map quantizer matrices from shared memory across worker processes
+    VECTOR_INDEX_REFRESH_INTERVAL: float = 0.5  # Seconds between checks for writes from other processes
     USE_TURBOQUANT: bool = True
     KV_CACHE_QUANT: bool = True
     LEGACY_FLOAT32_MODE: bool = False
@@ -68,6 +119,13 @@ class Settings(BaseSettings):
     REDIS_URL: str = "redis://localhost:6379"
     CACHE_TTL: int = 3600
     EMBEDDING_CACHE_SIZE: int = 100000
+    STAGE_CACHE_MAX_ENTRIES: int = 4096  # Per stage: route, rewrite, candidates
+    SEMANTIC_CACHE_ENABLED: bool = True  # Answer cache keyed by query-embedding similarity
+    SEMANTIC_CACHE_BACKEND: str = "redis"  # "redis" (shared, REDIS_URL) or "memory" (per process)
+    SEMANTIC_CACHE_THRESHOLD: float = 0.95
+    SEMANTIC_CACHE_MAX_ENTRIES: int = 10000
+    SEMANTIC_CACHE_POLICY: str = "lru"  # "lru" or "lfu"
+    SEMANTIC_CACHE_BITS: int = 8
     
     # Background Processing
     CELERY_BROKER_URL: str = "redis://localhost:6379/0"
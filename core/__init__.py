@@ -1,6 +1,8 @@
 from .cache.quantized_redis import RedisCache, EmbeddingCache
+from .cache.semantic import SemanticCache
 from .chunkers import SemanticChunker, ParentChildChunker
-from .retrievers import PersistedBM25Retriever, reciprocal_rank_fusion
+from .retrievers import BM25Retriever, DistributedBM25, PersistedBM25Retriever, reciprocal_rank_fusion
+from .fusion import fuse, hybrid_weights
 from .security import SecurityValidator
 from .circuit_breaker import CircuitBreaker
 
@@ -0,0 +1,10 @@
+from .generation import FileGeneration, RedisGeneration, generation_store
+from .inverted_index import CollectionStats, InvertedIndex
+from .segment import MmapIndex, write_index, write_tombstones
+from .segmented import SegmentedIndex, merge_segments
+
+__all__ = [
+    "CollectionStats", "InvertedIndex", "MmapIndex", "write_index", "write_tombstones",
+    "SegmentedIndex", "merge_segments",
+    "FileGeneration", "RedisGeneration", "generation_store",
+]
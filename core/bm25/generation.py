@@ -0,0 +1,44 @@
+import logging
+import os
+
+from core.locking import FileGeneration
+
+logger = logging.getLogger(__name__)
+
+class RedisGeneration:
+    """
+    Generation mirrored to a Redis key, for workers that should not poll the
+    filesystem (e.g. index on shared storage). The local file stays the source of
+    truth and the stand-in whenever Redis is unreachable.
+    """
+    def __init__(self, redis_url: str, key: str, local: FileGeneration):
+        import redis
+        self.client = redis.Redis.from_url(redis_url, socket_timeout=0.5, socket_connect_timeout=0.5)
+        self.key = key
+        self.local = local
+
+    def get(self) -> int:
+        local = self.local.get()
+        try:
+            value = self.client.get(self.key)
+        except Exception:
+            return local
+        # A bump whose Redis publish failed leaves Redis behind the file; never report less
+        return max(int(value), local) if value is not None else local
+
+    def bump(self) -> int:
+        generation = self.local.bump()
+        try:
+            self.client.set(self.key, generation)
+        except Exception as e:
+            logger.warning(f"Could not publish BM25 generation to Redis ({e}); readers fall back to the local file")
+        return generation
+
+def generation_store(index_path: str, backend: str = "file", redis_url: str = None):
+    local = FileGeneration(index_path + ".gen")
+    if backend == "redis" and redis_url:
+        try:
+            return RedisGeneration(redis_url, f"rag:bm25:generation:{os.path.basename(index_path)}", local)
+        except ImportError:
+            logger.warning("redis not installed; using the local BM25 generation file")
+    return local
@@ -0,0 +1,468 @@
+import numpy as np
+from array import array
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+# Doc-number range covered by one block-max entry
+BLOCK_DOCS = 1024
+# Below this many postings an exhaustive vectorized pass beats block pruning
+EXHAUSTIVE_POSTINGS = 20000
+# Highest-bound blocks scored up front to seed the top-k threshold
+SEED_BLOCKS = 8
+
+@dataclass
+class CollectionStats:
+    """Corpus-wide BM25 statistics; shards scored with the same stats rank exactly like one index"""
+    n_docs: int = 0
+    total_len: int = 0
+    df: Dict[str, int] = field(default_factory=dict)
+
+    @property
+    def avgdl(self) -> float:
+        return self.total_len / self.n_docs if self.n_docs else 0.0
+
+    @classmethod
+    def merge(cls, parts: Iterable["CollectionStats"]) -> "CollectionStats":
+        merged = cls()
+        for part in parts:
+            merged.n_docs += part.n_docs
+            merged.total_len += part.total_len
+            for term, df in part.df.items():
+                merged.df[term] = merged.df.get(term, 0) + df
+        return merged
+
+class InvertedIndex:
+    """
+    Incremental BM25 inverted index.
+    Postings are per-term append-only uint32 arrays (doc numbers ascending, term
+    frequencies alongside), so adding documents costs O(new tokens) and scoring
+    only touches the postings of the query terms.
+
+    Each term also keeps block-max metadata per BLOCK_DOCS range of doc numbers
+    (posting offset, max tf, min dl/tf), giving an avgdl-independent score upper
+    bound per block so top-k search can skip blocks and terms that cannot qualify.
+
+    Deletes are tombstones: a doc number, or a whole source, is marked in O(1),
+    queries skip tombstoned documents and score with live statistics, and
+    compact() rewrites the postings without them.
+    """
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.vocab: Dict[str, int] = {}   # term -> term id
+        self.postings_docs: List[array] = []
+        self.postings_tfs: List[array] = []
+        self.block_ids: List[array] = []
+        self.block_start: List[array] = []
+        self.block_max_tf: List[array] = []
+        self.block_min_ratio: List[array] = []
+        self.doc_ids: List[str] = []
+        self.doc_len = array('I')
+        self.total_len = 0
+        self.sources: Dict[str, int] = {}   # source name -> source id
+        self.doc_source = array('I')
+        self.deleted_docs: Set[int] = set()
+        self.deleted_sources: Set[int] = set()
+        self._docnos: Optional[Dict[str, int]] = None   # doc id -> latest doc number, built on demand
+        self._live = None   # cached tombstone mask and live statistics
+
+    @property
+    def n_docs(self) -> int:
+        return len(self.doc_ids)
+
+    @property
+    def n_live(self) -> int:
+        live = self._tombstones()
+        return live[1] if live else self.n_docs
+
+    @property
+    def avgdl(self) -> float:
+        live = self._tombstones()
+        n_docs, total_len = live[1:3] if live else (self.n_docs, self.total_len)
+        return total_len / n_docs if n_docs else 0.0
+
+    @property
+    def tombstone_ratio(self) -> float:
+        return 1.0 - self.n_live / self.n_docs if self.n_docs else 0.0
+
+    def add(self, doc_ids: List[str], token_lists: List[List[str]], sources: List[str] = None):
+        """Append documents; re-added ids replace (tombstone) their previous version"""
+        docnos = self._doc_numbers()
+        for i, (doc_id, tokens) in enumerate(zip(doc_ids, token_lists)):
+            docno = len(self.doc_ids)
+            if doc_id in docnos:
+                self.deleted_docs.add(docnos[doc_id])
+            docnos[doc_id] = docno
+            self.doc_source.append(self._source_id(sources[i] if sources else ""))
+            block = docno // BLOCK_DOCS
+            dl = float(len(tokens))
+            for term, tf in Counter(tokens).items():
+                tid = self.vocab.get(term)
+                if tid is None:
+                    tid = len(self.postings_docs)
+                    self.vocab[term] = tid
+                    for lists in (self.postings_docs, self.postings_tfs, self.block_ids,
+                                  self.block_start, self.block_max_tf):
+                        lists.append(array('I'))
+                    self.block_min_ratio.append(array('d'))
+                blocks = self.block_ids[tid]
+                if not blocks or blocks[-1] != block:
+                    blocks.append(block)
+                    self.block_start[tid].append(len(self.postings_docs[tid]))
+                    self.block_max_tf[tid].append(tf)
+                    self.block_min_ratio[tid].append(dl / tf)
+                else:
+                    self.block_max_tf[tid][-1] = max(self.block_max_tf[tid][-1], tf)
+                    self.block_min_ratio[tid][-1] = min(self.block_min_ratio[tid][-1], dl / tf)
+                self.postings_docs[tid].append(docno)
+                self.postings_tfs[tid].append(tf)
+            self.doc_ids.append(doc_id)
+            self.doc_len.append(len(tokens))
+            self.total_len += len(tokens)
+        self._live = None
+
+    def _doc_numbers(self) -> Dict[str, int]:
+        if self._docnos is None:
+            docnos = {}
+            for docno, doc_id in enumerate(self.doc_ids):
+                if doc_id in docnos:
+                    self.deleted_docs.add(docnos[doc_id]) # Older duplicate of an id
+                docnos[doc_id] = docno
+            self._docnos = docnos
+        return self._docnos
+
+    def _source_id(self, source: str) -> int:
+        sid = self.sources.get(source)
+        if sid is None:
+            sid = self.sources[source] = len(self.sources)
+        elif sid in self.deleted_sources:
+            # Source re-added after a delete: pin the tombstone to its old documents
+            old = np.flatnonzero(np.frombuffer(self.doc_source, dtype=np.uint32)[:self.n_docs] == sid)
+            self.deleted_docs.update(old.tolist())
+            self.deleted_sources.discard(sid)
+            self._live = None
+        return sid
+
+    def delete(self, doc_ids: Iterable[str]) -> int:
+        """Tombstone documents by id -> number newly deleted"""
+        docnos = self._doc_numbers()
+        hits = {docnos[d] for d in doc_ids if d in docnos} - self.deleted_docs
+        self.deleted_docs.update(hits)
+        if hits:
+            self._live = None
+        return len(hits)
+
+    def delete_source(self, source: str) -> bool:
+        """Tombstone every document of a source"""
+        sid = self.sources.get(source)
+        if sid is None or sid in self.deleted_sources:
+            return False
+        self.deleted_sources.add(sid)
+        self._live = None
+        return True
+
+    def _tombstones(self):
+        """(deleted mask, live doc count, live total length, live df cache), or None without deletes"""
+        if not self.deleted_docs and not self.deleted_sources:
+            return None
+        live = self._live
+        if live is None or len(live[0]) != self.n_docs:
+            mask = np.zeros(self.n_docs, dtype=bool)
+            mask[np.fromiter(self.deleted_docs, dtype=np.int64, count=len(self.deleted_docs))] = True
+            if self.deleted_sources:
+                doc_source = np.frombuffer(self.doc_source, dtype=np.uint32)[:self.n_docs]
+                mask |= np.isin(doc_source, list(self.deleted_sources))
+            dl = np.frombuffer(self.doc_len, dtype=np.uint32)
+            live = self._live = (mask, int(self.n_docs - mask.sum()),
+                                 int(self.total_len - dl[mask].sum(dtype=np.int64)), {})
+        return live
+
+    def _drop_deleted(self, docs: np.ndarray, scores: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        live = self._tombstones()
+        if live is None:
+            return docs, scores
+        keep = ~live[0][docs]
+        return docs[keep], scores[keep]
+
+    def df(self, term: str) -> int:
+        """Live document frequency"""
+        tid = self.vocab.get(term)
+        if tid is None:
+            return 0
+        live = self._tombstones()
+        if live is None:
+            return len(self.postings_docs[tid])
+        if tid not in live[3]:
+            docs = np.frombuffer(self.postings_docs[tid], dtype=np.uint32)
+            live[3][tid] = int(len(docs) - live[0][docs].sum())
+        return live[3][tid]
+
+    def idf(self, df, n_docs: int = None) -> float:
+        # Lucene-style BM25 idf: never negative, so very common terms still count a little
+        n_docs = self.n_docs if n_docs is None else n_docs
+        return np.log(1.0 + (n_docs - df + 0.5) / (df + 0.5))
+
+    def stats(self, terms: Iterable[str]) -> CollectionStats:
+        """This index's live statistics for the given terms"""
+        live = self._tombstones()
+        n_docs, total_len = live[1:3] if live else (self.n_docs, self.total_len)
+        return CollectionStats(n_docs, total_len, {t: self.df(t) for t in set(terms)})
+
+    def _query_weights(self, query_tokens: List[str], stats: Optional[CollectionStats]):
+        """[(term id, query tf, idf)] for query terms present here, and the avgdl to score with"""
+        stats = stats or self.stats(query_tokens)
+        # Repeated query tokens add up, as with BM25Okapi.get_scores
+        weights = [(self.vocab[t], qtf, self.idf(stats.df.get(t, 0), stats.n_docs))
+                   for t, qtf in Counter(query_tokens).items() if t in self.vocab]
+        return weights, stats.avgdl or 1.0
+
+    def postings(self, term: str) -> Tuple[np.ndarray, np.ndarray]:
+        tid = self.vocab.get(term)
+        if tid is None:
+            return np.zeros(0, dtype=np.uint32), np.zeros(0, dtype=np.uint32)
+        return self._postings(tid)
+
+    def _postings(self, tid: int) -> Tuple[np.ndarray, np.ndarray]:
+        return (np.frombuffer(self.postings_docs[tid], dtype=np.uint32),
+                np.frombuffer(self.postings_tfs[tid], dtype=np.uint32))
+
+    def score(self, query_tokens: List[str], stats: CollectionStats = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        BM25 scores for every document matching at least one query term -> (doc numbers, scores).
+        `stats` overrides the local corpus statistics (e.g. global ones across shards).
+        """
+        if not self.n_docs:
+            return np.zeros(0, dtype=np.uint32), np.zeros(0)
+        dl = np.frombuffer(self.doc_len, dtype=np.uint32)
+        weights, avgdl = self._query_weights(query_tokens, stats)
+
+        all_docs, all_scores = [], []
+        for tid, qtf, idf in weights:
+            docs, tfs = self._postings(tid)
+            all_docs.append(docs)
+            all_scores.append(qtf * idf * self._term_saturation(tfs, dl[docs], avgdl))
+
+        if not all_docs:
+            return np.zeros(0, dtype=np.uint32), np.zeros(0)
+        if len(all_docs) == 1:
+            return self._drop_deleted(all_docs[0], all_scores[0])
+        docs, inverse = np.unique(np.concatenate(all_docs), return_inverse=True)
+        return self._drop_deleted(docs, np.bincount(inverse, weights=np.concatenate(all_scores)))
+
+    def _term_saturation(self, tfs: np.ndarray, dls: np.ndarray, avgdl: float) -> np.ndarray:
+        tfs = tfs.astype(np.float64)
+        return tfs * (self.k1 + 1.0) / (tfs + self.k1 * (1.0 - self.b + self.b * dls / avgdl))
+
+    def block_upper_bounds(self, term: str, stats: CollectionStats = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        (block ids, per-block BM25 upper bound) for one term.
+        tf-saturation is (k1+1) / (1 + k1*(1-b)/tf + k1*b*(dl/tf)/avgdl), so max tf and
+        min dl/tf over a block bound it for any avgdl.
+        """
+        weights, avgdl = self._query_weights([term], stats)
+        if not weights or not self.n_docs:
+            return np.zeros(0, dtype=np.uint32), np.zeros(0)
+        tid, _, idf = weights[0]
+        return self._block_bounds(tid, idf, avgdl)
+
+    def _block_bounds(self, tid: int, idf: float, avgdl: float) -> Tuple[np.ndarray, np.ndarray]:
+        blocks = np.frombuffer(self.block_ids[tid], dtype=np.uint32)
+        max_tf = np.frombuffer(self.block_max_tf[tid], dtype=np.uint32).astype(np.float64)
+        min_ratio = np.frombuffer(self.block_min_ratio[tid], dtype=np.float64)
+        saturation = (self.k1 + 1.0) / (1.0 + self.k1 * (1.0 - self.b) / max_tf
+                                        + self.k1 * self.b * min_ratio / avgdl)
+        return blocks, idf * saturation
+
+    def term_upper_bound(self, term: str, stats: CollectionStats = None) -> float:
+        """Max-score bound of a term over the whole index"""
+        _, bounds = self.block_upper_bounds(term, stats)
+        return float(bounds.max()) if len(bounds) else 0.0
+
+    def _block_postings(self, tid: int, positions: np.ndarray) -> np.ndarray:
+        """Posting offsets covered by the given entries of a term's block table"""
+        starts = np.frombuffer(self.block_start[tid], dtype=np.uint32).astype(np.int64)
+        ends = np.append(starts[1:], len(self.postings_docs[tid]))
+        lens = ends[positions] - starts[positions]
+        offsets = np.repeat(starts[positions] - np.concatenate(([0], np.cumsum(lens)[:-1])), lens)
+        return offsets + np.arange(lens.sum())
+
+    def _score_postings(self, terms: list, selected: np.ndarray, dl: np.ndarray,
+                        avgdl: float) -> Tuple[np.ndarray, np.ndarray]:
+        """Summed scores from the given terms' postings that fall in selected blocks (bool per block)"""
+        all_docs, all_scores = [], []
+        for tid, qtf, idf, blocks, _ in terms:
+            positions = np.flatnonzero(selected[blocks])
+            if not len(positions):
+                continue
+            offsets = self._block_postings(tid, positions)
+            docs = np.frombuffer(self.postings_docs[tid], dtype=np.uint32)[offsets]
+            tfs = np.frombuffer(self.postings_tfs[tid], dtype=np.uint32)[offsets]
+            all_docs.append(docs)
+            all_scores.append(qtf * idf * self._term_saturation(tfs, dl[docs], avgdl))
+        if not all_docs:
+            return np.zeros(0, dtype=np.uint32), np.zeros(0)
+        docs, inverse = np.unique(np.concatenate(all_docs), return_inverse=True)
+        return docs, np.bincount(inverse, weights=np.concatenate(all_scores))
+
+    def search(self, query_tokens: List[str], k: int = 10,
+               stats: CollectionStats = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Exact top-k with block-max / MaxScore pruning -> (doc numbers, scores), best first.
+        1. Score the SEED_BLOCKS blocks with the highest bounds; the k-th score is a threshold.
+        2. Drop blocks whose bound cannot beat it, and treat the lowest-bound terms whose bounds
+           sum below it as non-essential: only essential postings produce candidates, and
+           non-essential terms are looked up for surviving candidates by binary search.
+        Cost follows query selectivity and k rather than corpus size.
+        """
+        empty = (np.zeros(0, dtype=np.uint32), np.zeros(0))
+        if not self.n_docs or k <= 0:
+            return empty
+        stats = stats or self.stats(query_tokens)
+        weights, avgdl = self._query_weights(query_tokens, stats)
+        if not weights:
+            return empty
+        if sum(len(self.postings_docs[tid]) for tid, _, _ in weights) <= EXHAUSTIVE_POSTINGS:
+            docs, scores = self.score(query_tokens, stats)
+            return self._best(docs, scores, k)
+
+        dl = np.frombuffer(self.doc_len, dtype=np.uint32)
+        upper = np.zeros((self.n_docs + BLOCK_DOCS - 1) // BLOCK_DOCS)
+        terms = []
+        for tid, qtf, idf in weights:
+            blocks, bounds = self._block_bounds(tid, idf, avgdl)
+            upper[blocks] += qtf * bounds
+            terms.append((tid, qtf, idf, blocks, qtf * bounds.max()))
+
+        seed = np.zeros(len(upper), dtype=bool)
+        seed[np.argsort(-upper, kind="stable")[:SEED_BLOCKS]] = True
+        best_docs, best_scores = self._best(*self._drop_deleted(*self._score_postings(terms, seed, dl, avgdl)), k)
+        threshold = best_scores[-1] if len(best_docs) >= k else 0.0
+
+        live = (upper > threshold) & ~seed
+        if not live.any():
+            return best_docs, best_scores
+
+        terms.sort(key=lambda t: t[4])
+        prefix = np.cumsum([t[4] for t in terms])
+        n_lazy = int(np.searchsorted(prefix, threshold, side="right"))
+        lazy, essential = terms[:n_lazy], terms[n_lazy:]
+
+        docs, scores = self._drop_deleted(*self._score_postings(essential, live, dl, avgdl))
+        if lazy:
+            # Candidates that cannot pass even with every non-essential term at its bound
+            keep = scores + prefix[n_lazy - 1] > threshold
+            docs, scores = docs[keep], scores[keep]
+            for tid, qtf, idf, _, _ in lazy:
+                term_docs = np.frombuffer(self.postings_docs[tid], dtype=np.uint32)
+                pos = np.minimum(np.searchsorted(term_docs, docs), len(term_docs) - 1)
+                hit = term_docs[pos] == docs
+                tfs = np.frombuffer(self.postings_tfs[tid], dtype=np.uint32)[pos[hit]]
+                scores[hit] += qtf * idf * self._term_saturation(tfs, dl[docs[hit]], avgdl)
+        return self._best(np.concatenate((best_docs, docs)), np.concatenate((best_scores, scores)), k)
+
+    @staticmethod
+    def _best(docs: np.ndarray, scores: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        if k < len(docs):
+            top = np.argpartition(-scores, k - 1)[:k]
+        else:
+            top = np.arange(len(docs))
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return docs[top], scores[top]
+
+    def top_k(self, query_tokens: List[str], k: int = 10,
+              stats: CollectionStats = None) -> List[Tuple[str, float]]:
+        docs, scores = self.search(query_tokens, k, stats)
+        return [(self.doc_ids[d], float(s)) for d, s in zip(docs, scores) if s > 0]
+
+    def to_state(self) -> dict:
+        """Compact picklable state (uint32 buffers, no per-token Python objects)"""
+        return {
+            'k1': self.k1, 'b': self.b,
+            'terms': list(self.vocab),
+            'postings_docs': [p.tobytes() for p in self.postings_docs],
+            'postings_tfs': [p.tobytes() for p in self.postings_tfs],
+            'blocks': [(i.tobytes(), st.tobytes(), mt.tobytes(), md.tobytes()) for i, st, mt, md in
+                       zip(self.block_ids, self.block_start, self.block_max_tf, self.block_min_ratio)],
+            'doc_ids': self.doc_ids,
+            'doc_len': self.doc_len.tobytes(),
+            'total_len': self.total_len,
+            'sources': list(self.sources),
+            'doc_source': self.doc_source.tobytes(),
+            'deleted_docs': sorted(self.deleted_docs),
+            'deleted_sources': sorted(self.deleted_sources),
+        }
+
+    @classmethod
+    def from_state(cls, state: dict) -> "InvertedIndex":
+        index = cls(k1=state['k1'], b=state['b'])
+        index.vocab = {term: tid for tid, term in enumerate(state['terms'])}
+        for docs, tfs in zip(state['postings_docs'], state['postings_tfs']):
+            index.postings_docs.append(array('I', docs))
+            index.postings_tfs.append(array('I', tfs))
+        index.doc_ids = list(state['doc_ids'])
+        index.doc_len = array('I', state['doc_len'])
+        index.total_len = state['total_len']
+        if 'blocks' in state:
+            for ids, starts, max_tf, min_ratio in state['blocks']:
+                index.block_ids.append(array('I', ids))
+                index.block_start.append(array('I', starts))
+                index.block_max_tf.append(array('I', max_tf))
+                index.block_min_ratio.append(array('d', min_ratio))
+        else:
+            index._rebuild_blocks()
+        if 'doc_source' in state:
+            index.sources = {name: sid for sid, name in enumerate(state['sources'])}
+            index.doc_source = array('I', state['doc_source'])
+            index.deleted_docs = set(state['deleted_docs'])
+            index.deleted_sources = set(state['deleted_sources'])
+        else:
+            index.set_sources([""] * index.n_docs)
+        return index
+
+    def set_sources(self, sources: List[str]):
+        """Assign a source to every document (indexes built before sources were tracked)"""
+        self.sources, self.doc_source = {}, array('I')
+        for source in sources:
+            self.doc_source.append(self._source_id(source))
+
+    def compact(self) -> "InvertedIndex":
+        """New index holding only live documents (doc numbers renumbered, no tombstones)"""
+        index = InvertedIndex(k1=self.k1, b=self.b)
+        live = self._tombstones()
+        keep = ~live[0] if live else np.ones(self.n_docs, dtype=bool)
+        renumber = (np.cumsum(keep) - 1).astype(np.uint32)
+
+        for tid, term in enumerate(self.vocab): # Iteration order is term id order
+            docs, tfs = self._postings(tid)
+            kept = keep[docs]
+            if not kept.any():
+                continue
+            index.vocab[term] = len(index.postings_docs)
+            index.postings_docs.append(array('I', renumber[docs[kept]].tobytes()))
+            index.postings_tfs.append(array('I', np.ascontiguousarray(tfs[kept]).tobytes()))
+
+        dl = np.frombuffer(self.doc_len, dtype=np.uint32)
+        doc_source = np.frombuffer(self.doc_source, dtype=np.uint32)
+        index.doc_ids = [doc_id for doc_id, ok in zip(self.doc_ids, keep) if ok]
+        index.doc_len = array('I', dl[keep].tobytes())
+        index.total_len = int(dl[keep].sum(dtype=np.int64))
+        index.sources = dict(self.sources)
+        index.doc_source = array('I', doc_source[keep].tobytes())
+        index._rebuild_blocks()
+        return index
+
+    def _rebuild_blocks(self):
+        """Derive block-max tables from the postings (states saved before they were kept)"""
+        dl = np.frombuffer(self.doc_len, dtype=np.uint32)
+        self.block_ids, self.block_start, self.block_max_tf, self.block_min_ratio = [], [], [], []
+        for tid in range(len(self.postings_docs)):
+            docs, tfs = (np.frombuffer(self.postings_docs[tid], dtype=np.uint32),
+                         np.frombuffer(self.postings_tfs[tid], dtype=np.uint32))
+            blocks = docs // BLOCK_DOCS
+            starts = np.flatnonzero(np.diff(blocks, prepend=-1)) if len(docs) else np.zeros(0, dtype=np.int64)
+            self.block_ids.append(array('I', blocks[starts].astype(np.uint32).tobytes()))
+            self.block_start.append(array('I', starts.astype(np.uint32).tobytes()))
+            self.block_max_tf.append(array('I', np.maximum.reduceat(tfs, starts).astype(np.uint32).tobytes() if len(docs) else b''))
+            ratio = dl[docs] / tfs.astype(np.float64)
+            self.block_min_ratio.append(array('d', np.minimum.reduceat(ratio, starts).tobytes() if len(docs) else b''))
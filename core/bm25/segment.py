@@ -0,0 +1,263 @@
+import json
+import mmap
+import os
+import struct
+import uuid
+from bisect import bisect_left
+from collections.abc import Mapping, Sequence
+from functools import lru_cache
+from typing import Tuple
+
+import numpy as np
+
+from .inverted_index import InvertedIndex
+
+# File layout: [MAGIC][u32 header length][JSON header][8-byte aligned columns]
+# The header records k1, b, counts and the (offset, dtype, count) of every column:
+#   terms / term_off        utf-8 blob + offsets, sorted, so term id = rank
+#   docs / docs_off         varint doc-number deltas per term
+#   tfs / tfs_off           varint term frequencies per term
+#   block_* / block_off     block-max tables (see InvertedIndex)
+#   doc_len                 uint32 per doc
+#   ids / ids_off           utf-8 blob + offsets, doc number -> doc id
+#   doc_source, src/src_off source id per doc, source names
+#   deleted_docs / deleted_sources  tombstones at write time
+# Tombstones added later go to a small JSON sidecar (<path>.del) tied to the file's uid.
+MAGIC = b"HBM25\x00"
+FORMAT_VERSION = 1
+
+def encode_varints(values: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """LEB128 varints of non-negative ints -> (uint8 bytes, bytes used per value)"""
+    v = np.asarray(values, dtype=np.uint64)
+    nbytes = np.ones(len(v), dtype=np.int64)
+    rest = v >> np.uint64(7)
+    while rest.any():
+        nbytes += rest > 0
+        rest >>= np.uint64(7)
+    total = int(nbytes.sum())
+    owner = np.repeat(np.arange(len(v)), nbytes)
+    pos = np.arange(total) - np.repeat(np.cumsum(nbytes) - nbytes, nbytes)
+    out = ((v[owner] >> (np.uint64(7) * pos.astype(np.uint64))) & np.uint64(0x7F)).astype(np.uint8)
+    out[pos < nbytes[owner] - 1] |= 0x80
+    return out, nbytes
+
+def decode_varints(buf: np.ndarray) -> np.ndarray:
+    """Inverse of encode_varints, vectorized over the whole buffer -> uint64"""
+    buf = np.asarray(buf, dtype=np.uint8)
+    if not len(buf):
+        return np.zeros(0, dtype=np.uint64)
+    ends = np.flatnonzero(buf < 0x80)
+    starts = np.concatenate(([0], ends[:-1] + 1))
+    pos = np.arange(len(buf)) - np.repeat(starts, ends - starts + 1)
+    vals = (buf & 0x7F).astype(np.uint64) << (np.uint64(7) * pos.astype(np.uint64))
+    return np.add.reduceat(vals, starts)
+
+def _strings(items) -> Tuple[bytes, np.ndarray]:
+    encoded = [s.encode("utf-8") for s in items]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.uint64)
+    offsets[1:] = np.cumsum([len(e) for e in encoded])
+    return b"".join(encoded), offsets
+
+def _flat(arrays, dtype) -> Tuple[np.ndarray, np.ndarray]:
+    """Concatenate per-term arrays -> (values, n_terms + 1 boundaries)"""
+    values = np.frombuffer(b"".join(a.tobytes() for a in arrays), dtype=dtype)
+    bounds = np.zeros(len(arrays) + 1, dtype=np.uint64)
+    bounds[1:] = np.cumsum([len(a) for a in arrays])
+    return values, bounds
+
+def write_index(path: str, index: InvertedIndex):
+    """Serialize an index to the columnar format (atomically, via a temp file)"""
+    terms = list(index.vocab)
+    order = sorted(range(len(terms)), key=terms.__getitem__)
+    pick = lambda lists: [lists[index.vocab[terms[i]]] for i in order]
+
+    docs, bounds = _flat(pick(index.postings_docs), np.uint32)
+    tfs, _ = _flat(pick(index.postings_tfs), np.uint32)
+    deltas = np.diff(docs.astype(np.int64), prepend=0)
+    starts = bounds[:-1][bounds[:-1] < bounds[1:]].astype(np.int64)
+    deltas[starts] = docs[starts] # First posting of every term is absolute
+    docs_bytes, docs_n = encode_varints(deltas)
+    tfs_bytes, tfs_n = encode_varints(tfs)
+    byte_ends = lambda n: np.concatenate(([0], np.cumsum(n))).astype(np.uint64)[bounds.astype(np.int64)]
+
+    block_ids, block_off = _flat(pick(index.block_ids), np.uint32)
+    term_blob, term_off = _strings(terms[i] for i in order)
+    id_blob, id_off = _strings(index.doc_ids)
+    src_blob, src_off = _strings(index.sources)
+    columns = {
+        "terms": np.frombuffer(term_blob, dtype=np.uint8), "term_off": term_off,
+        "docs": docs_bytes, "docs_off": byte_ends(docs_n),
+        "tfs": tfs_bytes, "tfs_off": byte_ends(tfs_n),
+        "block_ids": block_ids, "block_off": block_off,
+        "block_start": _flat(pick(index.block_start), np.uint32)[0],
+        "block_max_tf": _flat(pick(index.block_max_tf), np.uint32)[0],
+        "block_min_ratio": _flat(pick(index.block_min_ratio), np.float64)[0],
+        "doc_len": np.frombuffer(index.doc_len, dtype=np.uint32),
+        "ids": np.frombuffer(id_blob, dtype=np.uint8), "ids_off": id_off,
+        "doc_source": np.frombuffer(index.doc_source, dtype=np.uint32)[:index.n_docs],
+        "src": np.frombuffer(src_blob, dtype=np.uint8), "src_off": src_off,
+        "deleted_docs": np.array(sorted(index.deleted_docs), dtype=np.uint32),
+        "deleted_sources": np.array(sorted(index.deleted_sources), dtype=np.uint32),
+    }
+
+    header = {"version": FORMAT_VERSION, "uid": uuid.uuid4().hex, "k1": index.k1, "b": index.b, "n_docs": index.n_docs,
+              "n_terms": len(terms), "total_len": index.total_len, "columns": {}}
+    offset = 0
+    for name, col in columns.items():
+        header["columns"][name] = [offset, col.dtype.str, len(col)]
+        offset += (col.nbytes + 7) // 8 * 8
+    header_bytes = json.dumps(header).encode("utf-8")
+    base = (len(MAGIC) + 4 + len(header_bytes) + 7) // 8 * 8
+
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(MAGIC + struct.pack("<I", len(header_bytes)) + header_bytes)
+        for name, col in columns.items():
+            f.seek(base + header["columns"][name][0])
+            f.write(col.tobytes())
+        f.truncate(base + offset)
+    os.replace(tmp_path, path)
+
+def write_tombstones(path: str, index: "MmapIndex"):
+    """Persist the tombstones of a mapped index to its sidecar, without rewriting the index"""
+    names = list(index.sources)
+    sidecar = {"uid": index.uid, "docs": sorted(index.deleted_docs),
+               "sources": [names[sid] for sid in sorted(index.deleted_sources)]}
+    tmp_path = path + ".del.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(sidecar, f)
+    os.replace(tmp_path, path + ".del")
+
+class _StringTable(Sequence):
+    def __init__(self, blob: np.ndarray, offsets: np.ndarray):
+        self._blob, self._off = blob, offsets
+
+    def __len__(self):
+        return len(self._off) - 1
+
+    def __iter__(self):
+        return (self[i] for i in range(len(self)))
+
+    def __getitem__(self, i):
+        return self._blob[int(self._off[i]):int(self._off[i + 1])].tobytes().decode("utf-8")
+
+class _Vocab(Mapping):
+    """term -> term id by binary search over the sorted term table"""
+    def __init__(self, terms: _StringTable):
+        self._terms = terms
+
+    def __getitem__(self, term):
+        i = bisect_left(self._terms, term)
+        if i < len(self._terms) and self._terms[i] == term:
+            return i
+        raise KeyError(term)
+
+    def __iter__(self):
+        return iter(self._terms)
+
+    def __len__(self):
+        return len(self._terms)
+
+class _Column(Sequence):
+    """Per-term slices of a flat column, optionally varint decoded"""
+    def __init__(self, values: np.ndarray, bounds: np.ndarray, decode=None, cache_size: int = 0):
+        self._values, self._bounds, self._decode = values, bounds, decode
+        if cache_size:
+            self._get = lru_cache(maxsize=cache_size)(self._get)
+
+    def __len__(self):
+        return len(self._bounds) - 1
+
+    def _get(self, tid: int) -> np.ndarray:
+        chunk = self._values[int(self._bounds[tid]):int(self._bounds[tid + 1])]
+        return self._decode(chunk) if self._decode else chunk
+
+    def __iter__(self):
+        return (self[tid] for tid in range(len(self)))
+
+    def __getitem__(self, tid):
+        return self._get(tid)
+
+class MmapIndex(InvertedIndex):
+    """
+    Read-only InvertedIndex over a memory-mapped index file.
+    Opening maps the file and parses a small header, so it costs milliseconds at
+    any size, and the page cache shares one copy between all worker processes.
+    Postings are decoded per term on first use (bounded LRU). Tombstones can be
+    added in memory and persisted with write_tombstones().
+    """
+    POSTINGS_CACHE = 4096
+
+    def __init__(self, path: str):
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._mmap[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"{path} is not a BM25 index file")
+        (header_len,) = struct.unpack_from("<I", self._mmap, len(MAGIC))
+        header = json.loads(self._mmap[len(MAGIC) + 4:len(MAGIC) + 4 + header_len])
+        if header["version"] != FORMAT_VERSION:
+            raise ValueError(f"Unsupported BM25 index format version: {header['version']}")
+        super().__init__(k1=header["k1"], b=header["b"])
+        self.path = path
+        self.uid = header.get("uid", "")
+
+        base = (len(MAGIC) + 4 + header_len + 7) // 8 * 8
+        col = {name: np.frombuffer(self._mmap, dtype=np.dtype(dtype), count=count, offset=base + offset)
+               for name, (offset, dtype, count) in header["columns"].items()}
+        decode_docs = lambda chunk: np.cumsum(decode_varints(chunk)).astype(np.uint32)
+        decode_tfs = lambda chunk: decode_varints(chunk).astype(np.uint32)
+
+        self.vocab = _Vocab(_StringTable(col["terms"], col["term_off"]))
+        self.postings_docs = _Column(col["docs"], col["docs_off"], decode_docs, self.POSTINGS_CACHE)
+        self.postings_tfs = _Column(col["tfs"], col["tfs_off"], decode_tfs, self.POSTINGS_CACHE)
+        self.block_ids = _Column(col["block_ids"], col["block_off"])
+        self.block_start = _Column(col["block_start"], col["block_off"])
+        self.block_max_tf = _Column(col["block_max_tf"], col["block_off"])
+        self.block_min_ratio = _Column(col["block_min_ratio"], col["block_off"])
+        self.doc_ids = _StringTable(col["ids"], col["ids_off"])
+        self.doc_len = col["doc_len"]
+        self.total_len = header["total_len"]
+        if "doc_source" in col:
+            self.sources = {name: sid for sid, name in enumerate(_StringTable(col["src"], col["src_off"]))}
+            self.doc_source = col["doc_source"]
+            self.deleted_docs = set(col["deleted_docs"].tolist())
+            self.deleted_sources = set(col["deleted_sources"].tolist())
+        else:
+            self.set_sources([""] * self.n_docs)
+        self._load_sidecar()
+
+    def _load_sidecar(self):
+        try:
+            with open(self.path + ".del") as f:
+                sidecar = json.load(f)
+        except (OSError, ValueError):
+            return
+        if sidecar.get("uid") != self.uid:
+            return # Left over from an older file at this path
+        self.deleted_docs.update(sidecar["docs"])
+        self.deleted_sources.update(self.sources[name] for name in sidecar["sources"] if name in self.sources)
+
+    def close(self):
+        """
+        Release the mapping. The index must no longer be queried; if arrays sliced
+        from it are still referenced elsewhere, the mapping goes when they do.
+        """
+        mapping, self._mmap = self._mmap, None
+        if mapping is None:
+            return
+        for name in ("vocab", "postings_docs", "postings_tfs", "block_ids", "block_start", "block_max_tf",
+                     "block_min_ratio", "doc_ids", "doc_len", "doc_source"):
+            view = self.__dict__.pop(name, None)
+            # Columns reference themselves through their LRU-wrapped getter
+            getattr(view, "__dict__", {}).clear()
+        try:
+            mapping.close()
+        except BufferError:
+            pass
+
+    def add(self, doc_ids, token_lists, sources=None):
+        raise TypeError("MmapIndex is read-only; use to_inverted() to get a mutable copy")
+
+    def to_inverted(self) -> InvertedIndex:
+        """Fully decoded, mutable copy (for writers)"""
+        return InvertedIndex.from_state(self.to_state())
@@ -0,0 +1,74 @@
+import heapq
+from array import array
+from itertools import islice
+from typing import Dict, List, Sequence, Tuple
+
+import numpy as np
+
+from .inverted_index import CollectionStats, InvertedIndex
+
+class SegmentedIndex:
+    """
+    Read-only view of a base index plus append-only delta segments.
+    Every segment is scored with the statistics of all segments together and the
+    per-segment top-k lists are merged, so results rank as a single index over the
+    live documents would. A re-added id must be tombstoned in the segment holding
+    its older copy (writers do this before publishing the delta).
+    """
+    def __init__(self, segments: Sequence[InvertedIndex]):
+        self.segments = list(segments)
+
+    @property
+    def n_docs(self) -> int:
+        return sum(segment.n_docs for segment in self.segments)
+
+    @property
+    def n_live(self) -> int:
+        return sum(segment.n_live for segment in self.segments)
+
+    @property
+    def tombstone_ratio(self) -> float:
+        n_docs = self.n_docs
+        return 1.0 - self.n_live / n_docs if n_docs else 0.0
+
+    def stats(self, terms) -> CollectionStats:
+        terms = list(terms)
+        return CollectionStats.merge(segment.stats(terms) for segment in self.segments)
+
+    def top_k(self, query_tokens: List[str], k: int = 10,
+              stats: CollectionStats = None) -> List[Tuple[str, float]]:
+        stats = stats or self.stats(query_tokens)
+        hits = [segment.top_k(query_tokens, k, stats) for segment in self.segments]
+        return list(islice(heapq.merge(*hits, key=lambda hit: -hit[1]), k))
+
+    def close(self):
+        for segment in self.segments:
+            if hasattr(segment, "close"):
+                segment.close()
+
+def merge_segments(segments: Sequence[InvertedIndex]) -> InvertedIndex:
+    """Live documents of all segments, in segment order, as one index without tombstones"""
+    parts = [segment.compact() for segment in segments]
+    merged = InvertedIndex(k1=parts[0].k1, b=parts[0].b)
+    postings: Dict[str, Tuple[list, list]] = {}
+    offset = 0
+    for part in parts:
+        for tid, term in enumerate(part.vocab): # Iteration order is term id order
+            docs, tfs = part._postings(tid)
+            entry = postings.setdefault(term, ([], []))
+            entry[0].append(docs.astype(np.uint32) + np.uint32(offset))
+            entry[1].append(tfs)
+        names = list(part.sources)
+        source_ids = np.array([merged._source_id(name) for name in names] or [0], dtype=np.uint32)
+        merged.doc_ids.extend(part.doc_ids)
+        merged.doc_len.extend(part.doc_len)
+        merged.total_len += part.total_len
+        merged.doc_source.frombytes(source_ids[np.frombuffer(part.doc_source, dtype=np.uint32)].tobytes())
+        offset += part.n_docs
+
+    for term, (docs, tfs) in postings.items():
+        merged.vocab[term] = len(merged.postings_docs)
+        merged.postings_docs.append(array('I', np.concatenate(docs).astype(np.uint32).tobytes()))
+        merged.postings_tfs.append(array('I', np.concatenate(tfs).astype(np.uint32).tobytes()))
+    merged._rebuild_blocks()
+    return merged
@@ -4,6 +4,7 @@ import hashlib
 from typing import Optional, Any, List
 from tenacity import retry, stop_after_attempt, wait_exponential
 import asyncio
+from config import settings
 
 class RedisCache:
     """Production-ready Redis cache with async support"""
@@ -55,6 +56,16 @@ class EmbeddingCache:
         self.cache = RedisCache(redis_url)
         self.lock = asyncio.Lock()
     
+    def _polar(self):
+        """Shared, process-wide quantizer (built once, not per call)"""
+        from core.quantization import get_polar_quant
+        return get_polar_quant(
+            dim=768,
+            bits=settings.QUANTIZATION_BITS,
+            rotation=settings.POLARQUANT_ROTATION,
+            shared_memory=settings.QUANTIZER_SHARED_MEMORY
+        )
+
     def _hash_text(self, text: str) -> str:
         return hashlib.blake2b(text.encode(), digest_size=16).hexdigest()
     
@@ -63,21 +74,21 @@ class EmbeddingCache:
         async with self.lock:
             hex_data = await self.cache.get(f"emb:{key}")
             if hex_data:
-                from core.quantization import PolarQuant
-                import numpy as np
-                pq = PolarQuant(dim=768)
-                approx = pq.decode_approximate(bytes.fromhex(hex_data))
+                pq = self._polar()
+                try:
+                    approx = pq.decode_approximate(bytes.fromhex(hex_data))
+                except ValueError:
+                    return None # Encoded with another rotation; treat as a miss
                 return approx.tolist()
             return None
     
     async def set(self, text: str, embedding: List[float]):
         key = self._hash_text(text)
         async with self.lock:
-            from core.quantization import PolarQuant
             import numpy as np
-            pq = PolarQuant(dim=768)
+            pq = self._polar()
             hex_data = pq.encode(np.array(embedding, dtype=np.float32)).hex()
-            # 6x capacity from 100k -> 600k (Redis size dramatically bounded!)
+            # Bit-packed 3-bit code: 294 bytes vs 3072 for raw float32 (~10x capacity)
             await self.cache.set(f"emb:{key}", hex_data, ttl=7200)  # 2 hours
     
     async def get_or_create(self, text: str, embed_fn: callable) -> List[float]:
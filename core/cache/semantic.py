@@ -0,0 +1,242 @@
+import hashlib
+import json
+import logging
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from core.quantization import QJLCodeIndex, get_polar_quant, get_qjl
+from observability.metrics import stage_cache_requests
+
+logger = logging.getLogger(__name__)
+
+@dataclass
+class _Entry:
+    code: bytes # PolarQuant code of the query embedding
+    scope: str
+    payload: Any # None when the payload lives in Redis
+    expires: float
+    hits: int = 0
+
+class SemanticCache:
+    """
+    Answer cache keyed by query-embedding similarity.
+    Each entry keeps the query embedding as a PolarQuant code (plus its 1-bit QJL
+    signs for the candidate scan), the payload and the corpus version it was built
+    against. A lookup scans the QJL signs, re-checks the best few candidates by
+    cosine on the decoded codes and hits above `threshold` within the same version.
+    A `scope` (e.g. the request's mode and top_k) partitions entries within a
+    version: each scope has its own candidate index, and switching scopes
+    keeps every other scope's entries.
+
+    With a redis_url, entries are shared through Redis and every process keeps a
+    local mirror of the codes, synced incrementally through an insertion log.
+    If Redis is unreachable the cache keeps working in-process.
+
+    Codes default to 8 bits: the decoded cosine is within ~0.002 of the original
+    (3-bit codes lose ~0.2, far too much for a 0.95 threshold) at a quarter of
+    the float32 size.
+    """
+    PREFIX = "rag:semcache"
+    REDIS_RETRY_SECONDS = 30.0
+
+    def __init__(self, dim: int = 768, threshold: float = 0.95, max_entries: int = 10000, ttl: int = 3600,
+                 policy: str = "lru", redis_url: Optional[str] = None, bits: int = 8, rotation: str = "hadamard",
+                 jl_dim: int = 256, candidates: int = 8):
+        if policy not in ("lru", "lfu"):
+            raise ValueError(f"Unknown eviction policy: {policy}")
+        self.dim = dim
+        self.threshold = threshold
+        self.max_entries = max(1, max_entries)
+        self.ttl = ttl
+        self.policy = policy
+        self.candidates = max(1, candidates)
+        self.pq = get_polar_quant(dim=dim, bits=bits, rotation=rotation)
+        self.qjl = get_qjl(dim=dim, jl_dim=jl_dim)
+
+        self.jl_dim = jl_dim
+        self._indexes: Dict[str, QJLCodeIndex] = {} # scope -> candidate index
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict() # LRU order: oldest first
+        self._version: Optional[str] = None
+        self.redis_url = redis_url
+        self._redis = None
+        self._redis_retry_at = 0.0
+        self._synced_seq = 0.0
+        self.stats = {"hits": 0, "misses": 0}
+
+    # --- encoding ---
+    def _encode(self, embedding: List[float]) -> Tuple[bytes, bytes]:
+        vector = np.asarray(embedding, dtype=np.float64)[None, :]
+        signs = np.packbits(np.dot(vector, self.qjl.J) > 0, axis=1)[0].tobytes()
+        return self.pq.encode_batch(vector)[0], signs
+
+    def _key(self, version: str, scope: str, code: bytes) -> str:
+        return f"{version}:{scope}:{hashlib.blake2b(code, digest_size=12).hexdigest()}"
+
+    def _use_version(self, version: str):
+        """The local index only ever holds entries of the current corpus version"""
+        if version != self._version:
+            self._version = version
+            self._entries.clear()
+            self._indexes.clear()
+            self._synced_seq = 0.0
+
+    # --- local store ---
+    def _index(self, scope: str) -> QJLCodeIndex:
+        if scope not in self._indexes:
+            self._indexes[scope] = QJLCodeIndex(n_bits=self.jl_dim)
+        return self._indexes[scope]
+
+    def _add_local(self, key: str, scope: str, code: bytes, signs: bytes, payload: Any):
+        if key not in self._entries and len(self._entries) >= self.max_entries:
+            self._drop_local(self._victim())
+        self._entries[key] = _Entry(code, scope, payload, time.time() + self.ttl)
+        self._entries.move_to_end(key)
+        self._index(scope).upsert([key], [signs])
+
+    def _drop_local(self, key: str):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._index(entry.scope).remove([key])
+
+    def _victim(self) -> str:
+        if self.policy == "lfu":
+            return min(self._entries, key=lambda key: self._entries[key].hits)
+        return next(iter(self._entries))
+
+    def _touch_local(self, key: str):
+        entry = self._entries[key]
+        entry.hits += 1
+        self._entries.move_to_end(key)
+
+    def _best_match(self, embedding: List[float], signs: bytes, scope: str) -> List[Tuple[str, float]]:
+        """Candidates of the scope above the threshold, best first, re-scored on the decoded codes"""
+        if scope not in self._indexes:
+            return []
+        keys, _ = self._indexes[scope].search(signs, k=self.candidates)
+        keys = [key for key in keys if key in self._entries]
+        if not keys:
+            return []
+        decoded = self.pq.decode_batch([self._entries[key].code for key in keys])
+        query = np.asarray(embedding, dtype=np.float64)
+        norms = np.linalg.norm(decoded, axis=1) * np.linalg.norm(query)
+        sims = decoded @ query / np.where(norms > 0, norms, 1.0)
+        ranked = sorted(zip(keys, sims.tolist()), key=lambda item: item[1], reverse=True)
+        return [(key, sim) for key, sim in ranked if sim >= self.threshold]
+
+    # --- redis store ---
+    @property
+    def shared(self) -> bool:
+        """Whether Redis is in use right now (False while backing off after an error)"""
+        return bool(self.redis_url) and time.time() >= self._redis_retry_at
+
+    async def _client(self):
+        if self._redis is None:
+            from redis import asyncio as aioredis
+            self._redis = aioredis.from_url(self.redis_url, socket_timeout=0.5, socket_connect_timeout=0.5)
+        return self._redis
+
+    def _redis_down(self, e: Exception):
+        logger.warning(f"Semantic cache: Redis unavailable ({e}); continuing in-process for {self.REDIS_RETRY_SECONDS:.0f}s")
+        self._redis_retry_at = time.time() + self.REDIS_RETRY_SECONDS
+        self._redis = None
+
+    async def _sync(self):
+        """Pull codes inserted by other processes since the last sync"""
+        client = await self._client()
+        new = await client.zrangebyscore(f"{self.PREFIX}:log", f"({self._synced_seq}", "+inf", withscores=True)
+        prefix = f"{self._version}:"
+        keys = [key.decode() for key, _ in new if key.decode().startswith(prefix)]
+        if new:
+            self._synced_seq = max(seq for _, seq in new)
+        if not keys:
+            return
+        for key, value in zip(keys, await client.hmget(f"{self.PREFIX}:codes", keys)):
+            if value is not None and key not in self._entries:
+                code, signs = value.split(b"|")
+                scope = key[len(prefix):].rsplit(":", 1)[0]
+                self._add_local(key, scope, bytes.fromhex(code.decode()), bytes.fromhex(signs.decode()), None)
+
+    async def _load_payload(self, key: str) -> Any:
+        """Payload of a hit from Redis (None once it expired or was evicted elsewhere)"""
+        client = await self._client()
+        raw = await client.get(f"{self.PREFIX}:entry:{key}")
+        if raw is None:
+            return None
+        if self.policy == "lfu":
+            await client.zincrby(f"{self.PREFIX}:rank", 1, key)
+        else:
+            await client.zadd(f"{self.PREFIX}:rank", {key: time.time()})
+        return json.loads(raw)
+
+    async def _store_redis(self, key: str, code: bytes, signs: bytes, payload: Any):
+        client = await self._client()
+        seq = await client.incr(f"{self.PREFIX}:seq")
+        pipe = client.pipeline()
+        pipe.set(f"{self.PREFIX}:entry:{key}", json.dumps(payload), ex=self.ttl)
+        pipe.hset(f"{self.PREFIX}:codes", key, f"{code.hex()}|{signs.hex()}")
+        pipe.zadd(f"{self.PREFIX}:log", {key: seq})
+        pipe.zadd(f"{self.PREFIX}:rank", {key: 0 if self.policy == "lfu" else time.time()})
+        pipe.zcard(f"{self.PREFIX}:rank")
+        size = (await pipe.execute())[-1]
+        if size > self.max_entries:
+            # Lowest rank goes first: least recently used, or least frequently used
+            evicted = [k.decode() for k, _ in await client.zpopmin(f"{self.PREFIX}:rank", size - self.max_entries)]
+            pipe = client.pipeline()
+            pipe.delete(*[f"{self.PREFIX}:entry:{k}" for k in evicted])
+            pipe.hdel(f"{self.PREFIX}:codes", *evicted)
+            pipe.zrem(f"{self.PREFIX}:log", *evicted)
+            await pipe.execute()
+
+    # --- public API ---
+    async def get(self, embedding: List[float], version: str, scope: str = "") -> Optional[Tuple[Any, float]]:
+        """(payload, similarity) of the closest cached query in the scope, or None"""
+        self._use_version(version)
+        if self.shared:
+            try:
+                await self._sync()
+            except Exception as e:
+                self._redis_down(e)
+        _, signs = self._encode(embedding)
+        for key, sim in self._best_match(embedding, signs, scope):
+            entry = self._entries[key]
+            payload = entry.payload
+            if payload is None and self.shared:
+                try:
+                    payload = await self._load_payload(key)
+                except Exception as e:
+                    self._redis_down(e)
+            if payload is None or entry.expires < time.time():
+                self._drop_local(key)
+                continue
+            self._touch_local(key)
+            self.stats["hits"] += 1
+            stage_cache_requests.labels(stage="answer", result="hit").inc()
+            return payload, sim
+        self.stats["misses"] += 1
+        stage_cache_requests.labels(stage="answer", result="miss").inc()
+        return None
+
+    async def set(self, embedding: List[float], version: str, payload: Any, scope: str = ""):
+        self._use_version(version)
+        code, signs = self._encode(embedding)
+        key = self._key(version, scope, code)
+        if self.shared:
+            try:
+                await self._store_redis(key, code, signs, payload)
+                self._add_local(key, scope, code, signs, None)
+                return
+            except Exception as e:
+                self._redis_down(e)
+        self._add_local(key, scope, code, signs, payload)
+
+    def hit_rate(self) -> float:
+        total = self.stats["hits"] + self.stats["misses"]
+        return self.stats["hits"] / total if total else 0.0
+
+    async def close(self):
+        if self._redis is not None:
+            await self._redis.close()
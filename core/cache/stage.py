@@ -0,0 +1,60 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, Iterable, Optional
+
+from observability.metrics import stage_cache_requests
+
+def normalize_query(text: str) -> str:
+    """Case and whitespace folded, trailing punctuation dropped: 'What is RAG? ' -> 'what is rag'"""
+    return " ".join(text.lower().split()).rstrip("?!.")
+
+def history_key(turns: Iterable[str]) -> str:
+    return hashlib.blake2b("\x1e".join(turns).encode("utf-8"), digest_size=16).hexdigest()
+
+class StageCache:
+    """
+    Exact-match LRU cache for one pipeline stage (route, rewrite, candidates).
+    Every entry belongs to a corpus version; the first lookup under a new
+    version drops everything, so reindexing or deleting a document invalidates
+    the stage without any explicit hook. Hits and misses are exported per stage.
+    """
+    def __init__(self, stage: str, max_entries: int = 4096, ttl: float = 3600):
+        self.stage = stage
+        self.max_entries = max(1, max_entries)
+        self.ttl = ttl
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict() # key -> (expires, value)
+        self._version: Optional[str] = None
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0}
+
+    def _use_version(self, version: str):
+        if version != self._version:
+            self._version = version
+            self._entries.clear()
+
+    def get(self, key: Hashable, version: str) -> Optional[Any]:
+        with self._lock:
+            self._use_version(version)
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] < time.time():
+                del self._entries[key]
+                entry = None
+            self.stats["misses" if entry is None else "hits"] += 1
+            if entry is not None:
+                self._entries.move_to_end(key)
+        stage_cache_requests.labels(stage=self.stage, result="miss" if entry is None else "hit").inc()
+        return None if entry is None else entry[1]
+
+    def set(self, key: Hashable, version: str, value: Any):
+        with self._lock:
+            self._use_version(version)
+            self._entries[key] = (time.time() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def hit_rate(self) -> float:
+        total = self.stats["hits"] + self.stats["misses"]
+        return self.stats["hits"] / total if total else 0.0
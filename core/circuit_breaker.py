@@ -15,30 +15,40 @@ class CircuitBreaker:
         self.state = "CLOSED"  # CLOSED, OPEN, HALF-OPEN
         self.lock = threading.Lock()
 
+    # before_call / record_success / record_failure are also used directly by
+    # callers that cannot be wrapped, e.g. async generators streaming LLM tokens
+    def before_call(self):
+        with self.lock:
+            if self.state == "OPEN":
+                # Exponential Backoff Calculation
+                current_timeout = min(300, self.base_timeout * (2 ** (self.failures - self.failure_threshold)))
+                if time.time() - self.last_failure_time > current_timeout:
+                    self.state = "HALF-OPEN"
+                else:
+                    raise CircuitBreakerOpenException("Circuit is open. Request blocked.")
+
+    def record_success(self):
+        with self.lock:
+            if self.state == "HALF-OPEN":
+                self.state = "CLOSED"
+                self.failures = 0
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            self.last_failure_time = time.time()
+            if self.failures >= self.failure_threshold:
+                self.state = "OPEN"
+
     def __call__(self, func: Callable) -> Callable:
         @wraps(func)
         def wrapper(*args, **kwargs) -> Any:
-            with self.lock:
-                if self.state == "OPEN":
-                    # Exponential Backoff Calculation
-                    current_timeout = min(300, self.base_timeout * (2 ** (self.failures - self.failure_threshold)))
-                    if time.time() - self.last_failure_time > current_timeout:
-                        self.state = "HALF-OPEN"
-                    else:
-                        raise CircuitBreakerOpenException("Circuit is open. Request blocked.")
-
+            self.before_call()
             try:
                 result = func(*args, **kwargs)
-                with self.lock:
-                    if self.state == "HALF-OPEN":
-                        self.state = "CLOSED"
-                        self.failures = 0
+                self.record_success()
                 return result
             except Exception as e:
-                with self.lock:
-                    self.failures += 1
-                    self.last_failure_time = time.time()
-                    if self.failures >= self.failure_threshold:
-                        self.state = "OPEN"
+                self.record_failure()
                 raise e
-        return wrapper
\ No newline at end of file
+        return wrapper
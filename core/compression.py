@@ -0,0 +1,126 @@
+import logging
+import math
+import re
+import threading
+import time
+from dataclasses import dataclass
+from typing import Callable, List, Optional, Sequence
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Sentence ends, plus blank lines (headings, list blocks and table rows from PDFs carry no punctuation)
+_SENTENCE_BREAK = re.compile(r"(?<=[.!?])\s+|\n\s*\n")
+
+def split_chunk(text: str) -> List[str]:
+    return [s.strip() for s in _SENTENCE_BREAK.split(text or "") if s.strip()]
+
+def load_token_counter(name: Optional[str] = None, fallback_tokenizer=None) -> Callable[[str], int]:
+    """
+    Token count function for prompt budgeting: the named Hugging Face tokenizer
+    (the generation model's own, ideally), else `fallback_tokenizer` (e.g. the
+    sentence encoder's), else a 4-characters-per-token estimate
+    """
+    if name:
+        try:
+            from transformers import AutoTokenizer
+            tokenizer = AutoTokenizer.from_pretrained(name)
+            return lambda text: len(tokenizer.encode(text, add_special_tokens=False, verbose=False))
+        except Exception as e:
+            logger.warning(f"Tokenizer {name} unavailable ({e})")
+    if fallback_tokenizer is not None and hasattr(fallback_tokenizer, "encode"):
+        logger.warning("Counting context tokens with the sentence encoder's tokenizer")
+        return lambda text: len(fallback_tokenizer.encode(text, add_special_tokens=False, verbose=False))
+    logger.warning("No tokenizer available; estimating context tokens from characters")
+    return lambda text: math.ceil(len(text) / 4)
+
+def lazy_token_counter(name: Optional[str] = None, fallback_tokenizer=None) -> Callable[[str], int]:
+    """load_token_counter deferred to the first count, so building a compressor never downloads a tokenizer"""
+    counter: Optional[Callable[[str], int]] = None
+    lock = threading.Lock()
+
+    def count(text: str) -> int:
+        nonlocal counter
+        if counter is None:
+            with lock:
+                if counter is None:
+                    counter = load_token_counter(name, fallback_tokenizer)
+        return counter(text)
+    return count
+
+@dataclass
+class CompressionResult:
+    chunks: List[str] # Compressed chunks, in input order; chunks with nothing selected are dropped
+    tokens_before: int
+    tokens_after: int
+    sentences_before: int
+    sentences_after: int
+    duplicates: int # Sentences dropped as (near) duplicates of a selected one
+    elapsed: float
+
+    @property
+    def ratio(self) -> float:
+        return self.tokens_after / self.tokens_before if self.tokens_before else 1.0
+
+class ContextCompressor:
+    """
+    Extractive context compression ahead of generation.
+    - Chunks are split into sentences; query and sentences are embedded in one call
+    - Sentences are taken best-first by cosine to the query; a sentence too close to
+      one already taken (overlapping chunks repeat text) is dropped as a duplicate
+    - Taken sentences are packed until the token budget, counted with a real tokenizer:
+      min(max_tokens, ratio * context tokens), never below min_tokens; sentences
+      under min_relevance are not used as filler
+    - Kept sentences stay in their chunk and in their original order
+    Contexts already within min_tokens are returned as they are.
+    """
+    def __init__(self, encoder, count_tokens: Callable[[str], int], ratio: float = 0.5,
+                 max_tokens: int = 8192, min_tokens: int = 512, dedup_threshold: float = 0.92,
+                 min_relevance: float = 0.1):
+        self.encoder = encoder
+        self.count_tokens = count_tokens
+        self.ratio = ratio
+        self.max_tokens = max_tokens
+        self.min_tokens = min_tokens
+        self.dedup_threshold = dedup_threshold
+        self.min_relevance = min_relevance
+
+    def budget(self, total_tokens: int) -> int:
+        return max(self.min_tokens, min(self.max_tokens, math.ceil(self.ratio * total_tokens)))
+
+    def compress(self, query: str, chunks: Sequence[str]) -> CompressionResult:
+        start = time.perf_counter()
+        chunks = list(chunks)
+        sentences = [(i, s) for i, chunk in enumerate(chunks) for s in split_chunk(chunk)]
+        tokens = [self.count_tokens(s) for _, s in sentences]
+        total = sum(self.count_tokens(chunk) for chunk in chunks)
+        if total <= self.min_tokens or not sentences:
+            return CompressionResult(chunks, total, total, len(sentences), len(sentences), 0, time.perf_counter() - start)
+
+        vectors = np.asarray(self.encoder.encode([query] + [s for _, s in sentences]), dtype=np.float64)
+        vectors /= np.clip(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12, None)
+        relevance = vectors[1:] @ vectors[0]
+
+        budget = self.budget(total)
+        selected: List[int] = []
+        used, duplicates = 0, 0
+        for j in np.argsort(-relevance, kind="stable"):
+            if relevance[j] < self.min_relevance and selected:
+                break
+            if selected and float((vectors[1:][selected] @ vectors[1 + j]).max()) >= self.dedup_threshold:
+                duplicates += 1
+                continue
+            if used + tokens[j] > budget:
+                continue # A shorter, less relevant sentence may still fit
+            selected.append(int(j))
+            used += tokens[j]
+
+        kept = set(selected)
+        packed = [[] for _ in chunks]
+        for j, (i, sentence) in enumerate(sentences):
+            if j in kept:
+                packed[i].append(sentence)
+        out = [" ".join(parts) for parts in packed if parts]
+        return CompressionResult(out, total, sum(self.count_tokens(c) for c in out), len(sentences), len(selected),
+                                 duplicates, time.perf_counter() - start)
@@ -0,0 +1,41 @@
+import asyncio
+import logging
+import time
+from dataclasses import dataclass
+from typing import Any, Awaitable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+@dataclass
+class BackendResult:
+    name: str
+    value: Any
+    status: str  # "ok", "timeout" or "error"
+    elapsed: float
+    error: Optional[str] = None
+
+async def fan_out(backends: Dict[str, Awaitable], timeouts: Dict[str, float] = None,
+                  default: Any = None) -> Dict[str, BackendResult]:
+    """
+    Run independent backends concurrently, each under its own timeout.
+    A backend that times out or raises yields `default` (an empty list if None)
+    instead of failing the stage, so the stage costs the slowest healthy backend
+    (capped by its timeout) rather than the sum of all of them.
+    """
+    timeouts = timeouts or {}
+
+    async def run(name: str, awaitable: Awaitable) -> BackendResult:
+        start = time.perf_counter()
+        try:
+            value = await asyncio.wait_for(awaitable, timeout=timeouts.get(name))
+            return BackendResult(name, value, "ok", time.perf_counter() - start)
+        except asyncio.TimeoutError:
+            logger.warning(f"{name} retrieval timed out after {timeouts.get(name)}s; continuing without it")
+            status, error = "timeout", None
+        except Exception as e:
+            logger.warning(f"{name} retrieval failed: {e}; continuing without it")
+            status, error = "error", str(e)
+        return BackendResult(name, [] if default is None else default, status, time.perf_counter() - start, error)
+
+    results = await asyncio.gather(*(run(name, aw) for name, aw in backends.items()))
+    return {result.name: result for result in results}
@@ -0,0 +1,46 @@
+import heapq
+from typing import Dict, List, Optional, Sequence, Tuple
+
+Ranked = Sequence[Tuple[str, float]]
+
+def hybrid_weights(alpha: float) -> Dict[str, float]:
+    """HYBRID_SEARCH_ALPHA split: alpha for semantic (vector), the rest for keyword (bm25)"""
+    alpha = min(max(alpha, 0.0), 1.0)
+    return {"vector": alpha, "bm25": 1.0 - alpha}
+
+def _rrf(results: Ranked, k: int) -> List[float]:
+    return [1.0 / (k + rank + 1) for rank in range(len(results))]
+
+def _min_max(results: Ranked) -> List[float]:
+    """Scores rescaled to [0, 1] within one list (a constant list maps to 1.0)"""
+    scores = [score for _, score in results]
+    lo, hi = min(scores), max(scores)
+    if hi <= lo:
+        return [1.0] * len(scores)
+    span = hi - lo
+    return [(score - lo) / span for score in scores]
+
+def fuse(ranked_lists: Dict[str, Ranked], weights: Optional[Dict[str, float]] = None,
+         method: str = "rrf", k: int = 60, top_n: Optional[int] = None) -> List[Tuple[str, float]]:
+    """
+    Fuse any number of ranked (id, score) lists into one ranking.
+    - method "rrf": weight / (k + rank), scores ignored
+    - method "score": weight * min-max normalized score, so score gaps count
+    Lists without a weight get 1.0. With top_n only the best top_n are selected
+    (heapq.nlargest, no full sort). Ties keep first-seen order.
+    """
+    if method not in ("rrf", "score"):
+        raise ValueError(f"Unknown fusion method: {method}")
+    weights = weights or {}
+    fused: Dict[str, float] = {}
+    for name, results in ranked_lists.items():
+        weight = weights.get(name, 1.0)
+        if not results or weight <= 0:
+            continue
+        contributions = _rrf(results, k) if method == "rrf" else _min_max(results)
+        for (doc_id, _), value in zip(results, contributions):
+            fused[doc_id] = fused.get(doc_id, 0.0) + weight * value
+
+    if top_n is not None and top_n < len(fused):
+        return heapq.nlargest(top_n, fused.items(), key=lambda item: item[1])
+    return sorted(fused.items(), key=lambda item: item[1], reverse=True)
@@ -0,0 +1,40 @@
+import re
+from concurrent.futures import ThreadPoolExecutor
+from itertools import combinations
+from typing import Callable, Dict, List, Optional, Sequence
+
+GRADING_MODES = ("batch", "concurrent", "serial", "cross_encoder")
+
+_VERDICT = re.compile(r"\b(yes|no)\b", re.IGNORECASE)
+
+def format_chunks(chunks: Sequence[str], max_chars: int = 1500) -> str:
+    """Numbered chunk list for a single grading prompt"""
+    return "\n\n".join(f"[{i}] {chunk[:max_chars]}" for i, chunk in enumerate(chunks, 1))
+
+def parse_verdicts(text: str, n: int) -> Optional[List[bool]]:
+    """'1: Yes, 2: No, ...' -> [True, False, ...]; None unless there is exactly one verdict per chunk"""
+    verdicts = [v.lower() == "yes" for v in _VERDICT.findall(text or "")]
+    return verdicts if len(verdicts) == n else None
+
+def grade_concurrently(grade: Callable[[str], bool], chunks: Sequence[str], max_workers: int = 4) -> List[bool]:
+    """One grading call per chunk with at most max_workers in flight; a failed call keeps the chunk"""
+    def safe(chunk):
+        try:
+            return grade(chunk)
+        except Exception:
+            return True
+    if len(chunks) <= 1 or max_workers <= 1:
+        return [safe(chunk) for chunk in chunks]
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(chunks)), thread_name_prefix="crag-grade") as pool:
+        return list(pool.map(safe, chunks))
+
+def threshold_grades(scores: Sequence[float], threshold: float) -> List[bool]:
+    """Zero-LLM grading: a chunk is relevant when its cross-encoder score clears the threshold"""
+    return [float(score) > threshold for score in scores]
+
+def agreement(grades: Dict[str, List[bool]]) -> Dict[str, float]:
+    """Pairwise share of chunks on which two grading modes agree, e.g. {'batch/serial': 0.75}"""
+    out = {}
+    for (a, ga), (b, gb) in combinations(grades.items(), 2):
+        out[f"{a}/{b}"] = sum(x == y for x, y in zip(ga, gb)) / len(ga) if ga else 1.0
+    return out
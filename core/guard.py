@@ -0,0 +1,128 @@
+import logging
+import re
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import List, Optional, Sequence
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+
+def split_sentences(text: str, min_words: int = 3) -> List[str]:
+    """Answer claims to check; fragments shorter than min_words carry no checkable fact"""
+    return [s.strip() for s in _SENTENCE_END.split(text or "") if len(s.split()) >= min_words]
+
+@dataclass
+class GuardVerdict:
+    supported: Optional[bool] # None: not confident either way, escalate to the LLM guard
+    method: str
+    elapsed: float
+    entailment: List[float] = field(default_factory=list) # Best entailment per answer sentence
+    contradiction: List[float] = field(default_factory=list)
+
+class GuardEngine:
+    """
+    Local hallucination check for generated answers.
+    Each answer sentence is scored against every context chunk by a small NLI
+    cross-encoder on CPU, max_pairs pairs per batch; a sentence is entailed (or contradicted)
+    by its best-matching chunk. All sentences entailed -> supported, any
+    contradicted -> unsupported, anything else -> None so the caller can escalate.
+
+    Without an NLI model the engine falls back to embedding agreement between the
+    answer and the context, using embeddings the caller already has where it can.
+    """
+    # Label order of the cross-encoder/nli-* models when the config does not say
+    DEFAULT_LABELS = ("contradiction", "entailment", "neutral")
+
+    def __init__(self, model_name: Optional[str] = "cross-encoder/nli-deberta-v3-xsmall",
+                 entail_threshold: float = 0.7, contradict_threshold: float = 0.7,
+                 embedding_threshold: float = 0.6, max_pairs: int = 64, model=None):
+        self.model_name = model_name
+        self.entail_threshold = entail_threshold
+        self.contradict_threshold = contradict_threshold
+        self.embedding_threshold = embedding_threshold
+        self.max_pairs = max_pairs
+        self._model = model
+        self._labels = None
+        self._load_lock = threading.Lock()
+        self._load_failed = model is None and not model_name
+
+    def _nli(self):
+        """The NLI cross-encoder, loaded on first use (None when unavailable)"""
+        if self._model is not None or self._load_failed:
+            return self._model
+        with self._load_lock:
+            if self._model is None and not self._load_failed:
+                try:
+                    from sentence_transformers import CrossEncoder
+                    self._model = CrossEncoder(self.model_name, device="cpu", max_length=512)
+                    logger.info(f"Loaded NLI guard model {self.model_name}")
+                except Exception as e:
+                    logger.warning(f"NLI guard model unavailable ({e}); using the embedding check")
+                    self._load_failed = True
+        return self._model
+
+    @property
+    def has_nli(self) -> bool:
+        return self._nli() is not None
+
+    def _label_index(self, model) -> dict:
+        if self._labels is None:
+            config = getattr(getattr(model, "model", None), "config", None)
+            id2label = getattr(config, "id2label", None) or dict(enumerate(self.DEFAULT_LABELS))
+            self._labels = {str(label).lower(): int(i) for i, label in id2label.items()}
+        return self._labels
+
+    def check(self, context_chunks: Sequence[str], answer: str, answer_embedding: Sequence[float] = None,
+              context_embeddings: Sequence[Sequence[float]] = None, context_fidelity: float = 1.0) -> GuardVerdict:
+        """
+        context_fidelity: expected cosine between the given context embeddings and the exact
+        ones, below 1.0 for quantized reconstructions (PolarQuant.fidelity)
+        """
+        start = time.perf_counter()
+        sentences = split_sentences(answer)
+        chunks = [c for c in context_chunks if c.strip()]
+        if not sentences or not chunks:
+            return GuardVerdict(not sentences, "empty", time.perf_counter() - start)
+
+        model = self._nli()
+        if model is not None:
+            return self._check_nli(model, sentences, chunks, start)
+        if answer_embedding is not None and context_embeddings is not None and len(context_embeddings):
+            return self._check_embeddings(answer_embedding, context_embeddings, start, context_fidelity)
+        return GuardVerdict(None, "none", time.perf_counter() - start)
+
+    def _check_nli(self, model, sentences: List[str], chunks: List[str], start: float) -> GuardVerdict:
+        # Every pair is scored (dropping chunks would drop evidence); max_pairs bounds each batch
+        pairs = [(chunk, sentence) for sentence in sentences for chunk in chunks]
+        probs = np.asarray(model.predict(pairs, batch_size=self.max_pairs, apply_softmax=True, show_progress_bar=False))
+        probs = probs.reshape(len(sentences), len(chunks), -1)
+        labels = self._label_index(model)
+        entail = probs[:, :, labels["entailment"]]
+        best = entail.argmax(axis=1)
+        entailment = entail.max(axis=1)
+        # Contradiction as judged by the chunk the sentence is closest to
+        contradiction = probs[np.arange(len(sentences)), best, labels["contradiction"]]
+
+        if (contradiction >= self.contradict_threshold).any():
+            supported = False
+        elif (entailment >= self.entail_threshold).all():
+            supported = True
+        else:
+            supported = None
+        return GuardVerdict(supported, "nli", time.perf_counter() - start, entailment.tolist(), contradiction.tolist())
+
+    def _check_embeddings(self, answer_embedding, context_embeddings, start: float,
+                          fidelity: float = 1.0) -> GuardVerdict:
+        # Coarse signal only: confident when clearly aligned, otherwise escalate
+        a = np.asarray(answer_embedding, dtype=np.float64)
+        c = np.atleast_2d(np.asarray(context_embeddings, dtype=np.float64))
+        norms = np.linalg.norm(c, axis=1) * np.linalg.norm(a)
+        # Quantization noise is uncorrelated with the answer, so a reconstruction's cosine is the
+        # exact one scaled by the fidelity; undo that to compare with the exact-embedding threshold
+        sim = float((c @ a / np.where(norms > 0, norms, 1.0)).max()) / fidelity
+        return GuardVerdict(True if sim >= self.embedding_threshold else None, "embedding",
+                            time.perf_counter() - start, [sim])
@@ -0,0 +1,91 @@
+import os
+import time
+
+# Cross-process coordination through the filesystem, shared by the BM25 index
+# and the vector store adapter (services/quantized_chroma.py)
+
+# --- CROSS-PLATFORM FILE LOCKING ---
+class FileLock:
+    def __init__(self, filename):
+        self.filename = filename
+        self.handle = None
+
+    def acquire(self):
+        if os.name == 'nt':  # Windows
+            import msvcrt
+            self.handle = open(self.filename, 'w')
+            # Lock the first byte of the file
+            try:
+                msvcrt.locking(self.handle.fileno(), msvcrt.LK_NBLCK, 1)
+            except IOError:
+                # If already locked, wait and retry (simple spinlock)
+                time.sleep(0.1)
+                try:
+                    msvcrt.locking(self.handle.fileno(), msvcrt.LK_NBLCK, 1)
+                except IOError:
+                    raise BlockingIOError("Resource locked")
+        else:  # Linux/Mac
+            import fcntl
+            self.handle = open(self.filename, 'w')
+            fcntl.flock(self.handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+
+    def release(self):
+        if self.handle:
+            if os.name == 'nt':
+                import msvcrt
+                self.handle.seek(0)
+                msvcrt.locking(self.handle.fileno(), msvcrt.LK_UNLCK, 1)
+            else:
+                import fcntl
+                fcntl.flock(self.handle, fcntl.LOCK_UN)
+            self.handle.close()
+            self.handle = None
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.release()
+
+def acquire_lock(lock: FileLock, timeout: float = 10.0) -> bool:
+    """Wait up to `timeout` seconds for a non-blocking FileLock"""
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            lock.acquire()
+            return True
+        except BlockingIOError:
+            if lock.handle:
+                lock.handle.close()
+                lock.handle = None
+            if time.monotonic() > deadline:
+                return False
+            time.sleep(0.05)
+
+class FileGeneration:
+    """
+    Monotonic generation number in a small file next to the data it versions.
+    Writers bump it under a FileLock after the new data is complete, so a reader
+    that sees generation N can load a fully written snapshot.
+    """
+    def __init__(self, path: str):
+        self.path = path
+
+    def get(self) -> int:
+        try:
+            with open(self.path) as f:
+                return int(f.read().strip() or 0)
+        except (OSError, ValueError):
+            return 0
+
+    def set(self, generation: int):
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as f:
+            f.write(str(generation))
+        os.replace(tmp_path, self.path)
+
+    def bump(self) -> int:
+        generation = self.get() + 1
+        self.set(generation)
+        return generation
@@ -1,4 +1,6 @@
 from .polar_quant import PolarQuant
 from .qjl import QJLRetriever
+from .qjl_index import QJLCodeIndex
+from .registry import get_polar_quant, get_qjl, unlink_shared
 
-__all__ = ["PolarQuant", "QJLRetriever"]
+__all__ = ["PolarQuant", "QJLRetriever", "QJLCodeIndex", "get_polar_quant", "get_qjl", "unlink_shared"]
@@ -1,48 +1,194 @@
 import numpy as np
+from typing import Dict, List, Tuple
+
+# Code layout, version 2: [version u8][rotation << 4 | bits u8][norm f32][bit-packed bucket indices]
+# Version 1 (legacy, no header): [norm f32][one uint8 per dimension]
+CODE_VERSION = 2
+_HEADER_BYTES = 6
+ROTATION_IDS = {"random_gaussian": 0, "hadamard": 1, "identity": 2}
+# Also the POLARQUANT_ROTATION setting's default
+DEFAULT_ROTATION = "hadamard"
+
+def fwht(x: np.ndarray) -> np.ndarray:
+    """Orthonormal fast Walsh-Hadamard transform along the last axis of (n, p), p a power of two"""
+    n, p = x.shape
+    y = np.array(x, dtype=np.float64, copy=True)
+    h = 1
+    while h < p:
+        # In-place butterflies: (a, b) -> (a + b, a - b)
+        v = y.reshape(n, p // (2 * h), 2, h)
+        a, b = v[:, :, 0, :], v[:, :, 1, :]
+        t = a.copy()
+        a += b
+        np.subtract(t, b, out=b)
+        h *= 2
+    y *= 1.0 / np.sqrt(p)
+    return y
+
+def pack_codes(codes: np.ndarray, bits: int) -> np.ndarray:
+    """
+    Bit-pack bucket indices: (n, dim) uint8 in [0, 2**bits) -> (n, ceil(dim * bits / 8)) uint8.
+    For bits=3 that is 8 codes in 3 bytes.
+    """
+    codes = np.atleast_2d(codes).astype(np.uint8, copy=False)
+    n, dim = codes.shape
+    planes = np.unpackbits(codes[..., None], axis=-1)[..., 8 - bits:]
+    return np.packbits(planes.reshape(n, dim * bits), axis=1)
+
+def unpack_codes(packed: np.ndarray, bits: int, dim: int) -> np.ndarray:
+    """Inverse of pack_codes: (n, n_bytes) uint8 -> (n, dim) uint8"""
+    packed = np.atleast_2d(packed).astype(np.uint8, copy=False)
+    n = packed.shape[0]
+    planes = np.unpackbits(packed, axis=1)[:, :dim * bits].reshape(n, dim, bits)
+    weights = (1 << np.arange(bits - 1, -1, -1)).astype(np.uint8)
+    return (planes * weights).sum(axis=2, dtype=np.uint8)
 
 class PolarQuant:
-    def __init__(self, dim=768, bits=3, rotation="random_gaussian"):
+    def __init__(self, dim=768, bits=3, rotation=DEFAULT_ROTATION, seed=42, rotation_matrix: np.ndarray = None):
+        if rotation not in ROTATION_IDS:
+            raise ValueError(f"Unknown PolarQuant rotation '{rotation}'; expected one of {sorted(ROTATION_IDS)}")
         self.dim = dim
         self.bits = bits
-        self.rotation_matrix = self._init_rotation(rotation, dim)
-        
+        self.rotation = rotation
+        self.seed = seed
+        self.rotation_id = ROTATION_IDS[rotation]
+        self._fidelity = None
+        # A prebuilt dense matrix (e.g. mapped from shared memory) skips the QR
+        self.rotation_matrix = rotation_matrix if rotation_matrix is not None else self._init_rotation(rotation, dim)
+
     def _init_rotation(self, rotation: str, dim: int) -> np.ndarray:
-        np.random.seed(42) # For reproducibility
+        if rotation == "hadamard":
+            # Randomized Hadamard: sign flips + FWHT, no dense matrix.
+            # Non power-of-two dims use two overlapping power-of-two blocks (e.g. 768 -> [0:512], [256:768]).
+            rng = np.random.default_rng(self.seed)
+            self._block = 1 << (dim.bit_length() - 1)
+            self._signs = rng.choice(np.array([-1.0, 1.0]), size=(2, dim))
+            return None
         if rotation == "random_gaussian":
-            H = np.random.randn(dim, dim)
+            # Private RandomState: same matrix as the old global np.random.seed(42), without touching global RNG state
+            H = np.random.RandomState(self.seed).randn(dim, dim)
             Q, _ = np.linalg.qr(H)
             return Q
         return np.eye(dim)
-    
+
+    def rotate(self, vectors: np.ndarray) -> np.ndarray:
+        """Apply the rotation to an (n, dim) array"""
+        x = np.atleast_2d(vectors).astype(np.float64)
+        if self.rotation_matrix is not None:
+            return np.dot(x, self.rotation_matrix)
+        p = self._block
+        x = x * self._signs[0]
+        x[:, :p] = fwht(x[:, :p])
+        if p < self.dim:
+            x = x * self._signs[1]
+            x[:, -p:] = fwht(x[:, -p:])
+        return x
+
+    def unrotate(self, rotated: np.ndarray) -> np.ndarray:
+        """Inverse of rotate (every step is orthonormal and self-inverse)"""
+        x = np.atleast_2d(rotated).astype(np.float64)
+        if self.rotation_matrix is not None:
+            return np.dot(x, self.rotation_matrix.T)
+        p = self._block
+        if p < self.dim:
+            x[:, -p:] = fwht(x[:, -p:])
+            x = x * self._signs[1]
+        x[:, :p] = fwht(x[:, :p])
+        return x * self._signs[0]
+
+    @property
+    def fidelity(self) -> float:
+        """Expected cosine between a vector and its decoded code, estimated once on random vectors"""
+        if self._fidelity is None:
+            x = np.random.default_rng(0).standard_normal((256, self.dim))
+            approx = self.decode_batch(self.encode_batch(x))
+            cos = np.sum(x * approx, axis=1) / (np.linalg.norm(x, axis=1) * np.linalg.norm(approx, axis=1))
+            self._fidelity = float(cos.mean())
+        return self._fidelity
+
+    @property
+    def code_size(self) -> int:
+        """Bytes per encoded vector in the current format"""
+        return _HEADER_BYTES + (self.dim * self.bits + 7) // 8
+
     def encode(self, vector: np.ndarray) -> bytes:
         """
         1. Rotate
         2. Cartesian to Polar (pairwise)
         3. Recursive polar transform
-        4. Quantize to 3-bit
+        4. Quantize to `bits` bits and bit-pack
         """
-        rotated = np.dot(vector, self.rotation_matrix)
-        norm = np.linalg.norm(rotated)
-        if norm > 0:
-            rotated = rotated / norm
-            
-        # 3-bit quantization: 8 buckets
-        quantized = np.clip(np.round((rotated + 1.0) * 3.5), 0, 7).astype(np.uint8)
-        
-        norm_bytes = np.array([norm], dtype=np.float32).tobytes()
-        quantized_bytes = quantized.tobytes()
-        return norm_bytes + quantized_bytes
-    
+        return self.encode_batch(np.asarray(vector)[None, :])[0]
+
+    def encode_batch(self, vectors: np.ndarray) -> List[bytes]:
+        """Vectorized encode of an (n, dim) array"""
+        rotated = self.rotate(vectors)
+        norms = np.linalg.norm(rotated, axis=1)
+        safe = np.where(norms > 0, norms, 1.0)
+        rotated = rotated / safe[:, None]
+
+        # 2**bits buckets over [-1, 1]
+        half = ((1 << self.bits) - 1) / 2.0
+        quantized = np.clip(np.round((rotated + 1.0) * half), 0, (1 << self.bits) - 1).astype(np.uint8)
+        packed = pack_codes(quantized, self.bits)
+
+        header = bytes([CODE_VERSION, self.rotation_id << 4 | self.bits])
+        norm_bytes = norms.astype(np.float32)
+        return [header + norm_bytes[i:i + 1].tobytes() + packed[i].tobytes() for i in range(len(packed))]
+
     def decode_approximate(self, quantized_bytes: bytes) -> np.ndarray:
         """
         Fast approximate decode for similarity scoring
         """
-        norm = np.frombuffer(quantized_bytes[:4], dtype=np.float32)[0]
-        quantized = np.frombuffer(quantized_bytes[4:], dtype=np.uint8)
-        
-        approx_rotated = (quantized / 3.5) - 1.0
-        if norm > 0:
-            approx_rotated = approx_rotated * norm
-            
-        approx_vector = np.dot(approx_rotated, self.rotation_matrix.T)
-        return approx_vector
+        return self.decode_batch([quantized_bytes])[0]
+
+    def decode_batch(self, codes: List[bytes]) -> np.ndarray:
+        """
+        Vectorized decode of packed (or legacy unpacked) codes -> (n, dim).
+        Every code carries its own layout, so a batch may mix versions, bit widths and
+        rotations; codes of another rotation decode with the registry's quantizer for it.
+        """
+        if not codes:
+            return np.zeros((0, self.dim))
+        groups: Dict[Tuple[int, int, bool], List[int]] = {}
+        for i, code in enumerate(codes):
+            groups.setdefault(self._layout(code), []).append(i)
+
+        out = np.empty((len(codes), self.dim))
+        for (rotation_id, bits, legacy), rows in groups.items():
+            norms, quantized = self._split([codes[i] for i in rows], bits, legacy)
+            half = ((1 << bits) - 1) / 2.0
+            approx_rotated = (quantized / half) - 1.0
+            approx_rotated = approx_rotated * np.where(norms > 0, norms, 1.0)[:, None]
+            out[rows] = self._for_rotation(rotation_id).unrotate(approx_rotated)
+        return out
+
+    def _layout(self, code: bytes) -> Tuple[int, int, bool]:
+        """(rotation id, bits, legacy) of one code"""
+        if len(code) >= _HEADER_BYTES and code[0] == CODE_VERSION:
+            bits = code[1] & 0x0F
+            if bits and len(code) == _HEADER_BYTES + (self.dim * bits + 7) // 8:
+                return code[1] >> 4, bits, False
+        if len(code) == 4 + self.dim:
+            # Legacy version 1: one byte per code, fixed 3-bit buckets, Gaussian rotation
+            return ROTATION_IDS["random_gaussian"], 3, True
+        raise ValueError(f"Unsupported PolarQuant code: {len(code)} bytes, "
+                         f"version byte {code[0] if code else None}, dim {self.dim}")
+
+    def _for_rotation(self, rotation_id: int) -> "PolarQuant":
+        if rotation_id == self.rotation_id:
+            return self
+        names = {i: name for name, i in ROTATION_IDS.items()}
+        if rotation_id not in names:
+            raise ValueError(f"PolarQuant code was encoded with unknown rotation id {rotation_id}")
+        from .registry import get_polar_quant
+        return get_polar_quant(dim=self.dim, bits=self.bits, seed=self.seed, rotation=names[rotation_id])
+
+    def _split(self, codes: List[bytes], bits: int, legacy: bool) -> Tuple[np.ndarray, np.ndarray]:
+        """Parse codes sharing one layout into (norms, bucket indices)"""
+        raw = np.frombuffer(b"".join(codes), dtype=np.uint8).reshape(len(codes), -1)
+        if legacy:
+            norms = raw[:, :4].copy().view(np.float32)[:, 0]
+            return norms, raw[:, 4:]
+        norms = raw[:, 2:_HEADER_BYTES].copy().view(np.float32)[:, 0]
+        return norms, unpack_codes(raw[:, _HEADER_BYTES:], bits, self.dim)
@@ -1,27 +1,106 @@
 import numpy as np
+from typing import List, Union
+
+# Fallback popcount for NumPy < 2.0 (no np.bitwise_count)
+_POPCOUNT_LUT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+def popcount(words: np.ndarray) -> np.ndarray:
+    """Set bits per uint64 element (hardware popcount when NumPy provides it)"""
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(words)
+    flat = np.ascontiguousarray(words).reshape(-1)
+    counts = _POPCOUNT_LUT[flat.view(np.uint8).reshape(-1, 8)].sum(axis=1, dtype=np.uint8)
+    return counts.reshape(words.shape)
+
+def pack_words(codes: Union[bytes, List[bytes], np.ndarray]) -> np.ndarray:
+    """
+    Packed sign bytes -> uint64 words, zero-padded to a whole word.
+    A single code gives (n_words,), a list or 2-D uint8 array gives (n, n_words).
+    """
+    if isinstance(codes, (bytes, bytearray)):
+        return pack_words([codes])[0]
+    if isinstance(codes, np.ndarray) and codes.dtype == np.uint64:
+        return codes
+    if isinstance(codes, np.ndarray):
+        raw = np.atleast_2d(codes.astype(np.uint8, copy=False))
+    else:
+        n_bytes = max((len(c) for c in codes), default=0)
+        raw = np.frombuffer(b"".join(bytes(c).ljust(n_bytes, b"\0") for c in codes), dtype=np.uint8)
+        raw = raw.reshape(len(codes), n_bytes)
+    n_words = (raw.shape[1] + 7) // 8
+    padded = np.zeros((raw.shape[0], n_words * 8), dtype=np.uint8)
+    padded[:, :raw.shape[1]] = raw
+    return padded.view(np.uint64)
+
+def hamming_distance_batch(query_words: np.ndarray, code_words: np.ndarray, word_major: bool = False) -> np.ndarray:
+    """
+    Hamming distance from one packed query to every code, as int32.
+    code_words is (n, n_words), or (n_words, n) with word_major=True; the
+    word-major layout makes every XOR + popcount pass contiguous.
+    """
+    codes = code_words if word_major else code_words.T
+    dists = popcount(np.bitwise_xor(codes[0], query_words[0])).astype(np.int32)
+    for w in range(1, codes.shape[0]):
+        dists += popcount(np.bitwise_xor(codes[w], query_words[w]))
+    return dists
+
+def similarity_from_hamming(dists: np.ndarray, n_bits: int) -> np.ndarray:
+    """Angle estimate from sign agreement: cos(pi * hamming / n_bits)"""
+    return np.cos(np.pi * (dists / n_bits)).astype(np.float32)
 
 class QJLRetriever:
-    def __init__(self, dim=768, jl_dim=256):
+    def __init__(self, dim=768, jl_dim=256, seed=42):
         # Johnson-Lindenstrauss transform matrix
-        np.random.seed(42)  # For deterministic JL projection
-        self.J = np.random.randn(dim, jl_dim) / np.sqrt(jl_dim)
-    
+        # Private RandomState for a deterministic JL projection without reseeding the global RNG
+        self.dim = dim
+        self.jl_dim = jl_dim
+        self.seed = seed
+        self.J = np.random.RandomState(seed).randn(dim, jl_dim) / np.sqrt(jl_dim)
+
     def encode_residual(self, original: np.ndarray, polar_approx: np.ndarray) -> bytes:
         """1-bit sign of JL projection of error"""
         residual = original - polar_approx
         projected = np.sign(np.dot(residual, self.J))
         return self._pack_bits(projected)
-    
+
+    def encode_residual_batch(self, originals: np.ndarray, polar_approx: np.ndarray) -> List[bytes]:
+        """Vectorized encode_residual over (n, dim) arrays"""
+        projected = np.dot(np.atleast_2d(originals) - np.atleast_2d(polar_approx), self.J)
+        packed = np.packbits(projected > 0, axis=1)
+        return [row.tobytes() for row in packed]
+
     def _pack_bits(self, bit_array: np.ndarray) -> bytes:
         binary = (bit_array > 0).astype(np.uint8)
         return np.packbits(binary).tobytes()
-        
+
+    def encode_signs(self, vectors: np.ndarray) -> np.ndarray:
+        """Packed 1-bit JL signs of raw vectors: (n, dim) -> (n, n_words) uint64"""
+        projected = np.dot(np.atleast_2d(np.asarray(vectors, dtype=np.float32)), self.J)
+        return pack_words(np.packbits(projected > 0, axis=1))
+
     def estimate_similarity(self, query_jl_signs: bytes, residual_jl_signs: bytes) -> float:
         """Zero-overhead similarity estimation (Hamming distance approximation)"""
-        q_bits = np.unpackbits(np.frombuffer(query_jl_signs, dtype=np.uint8))
-        r_bits = np.unpackbits(np.frombuffer(residual_jl_signs, dtype=np.uint8))
-        
-        matches = np.sum(q_bits == r_bits)
-        total_bits = len(q_bits)
-        similarity = np.cos(np.pi * (1.0 - (matches / total_bits)))
-        return float(similarity)
+        n_bits = len(query_jl_signs) * 8
+        return float(self.estimate_similarity_batch(query_jl_signs, [residual_jl_signs], n_bits=n_bits)[0])
+
+    def estimate_similarity_batch(self, query_signs, code_matrix, n_bits: int = None, word_major: bool = False) -> np.ndarray:
+        """
+        One query against many codes in a single XOR + popcount kernel.
+        query_signs: packed bytes or (n_words,) uint64.
+        code_matrix: list of packed bytes, (n, n_bytes) uint8 or (n, n_words) uint64
+        ((n_words, n) with word_major=True).
+        Returns a float32 score vector ready for argpartition top-k.
+        """
+        q = pack_words(query_signs)
+        codes = pack_words(code_matrix) if not word_major else code_matrix
+        dists = hamming_distance_batch(q, codes, word_major=word_major)
+        return similarity_from_hamming(dists, n_bits or self.jl_dim)
+
+    def estimate_similarity_matrix(self, query_matrix, code_matrix, n_bits: int = None) -> np.ndarray:
+        """Many queries x many codes -> (n_queries, n_codes) float32 scores"""
+        queries = pack_words(query_matrix)
+        codes_t = np.ascontiguousarray(pack_words(code_matrix).T)
+        dists = np.zeros((queries.shape[0], codes_t.shape[1]), dtype=np.int32)
+        for w in range(codes_t.shape[0]):
+            dists += popcount(np.bitwise_xor(queries[:, w, None], codes_t[w][None, :]))
+        return similarity_from_hamming(dists, n_bits or self.jl_dim)
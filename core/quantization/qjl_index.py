@@ -0,0 +1,106 @@
+import threading
+import numpy as np
+from typing import Iterable, List, Tuple
+from .qjl import hamming_distance_batch, similarity_from_hamming
+
+class QJLCodeIndex:
+    """
+    Resident index of packed 1-bit QJL sign codes.
+    Codes live in one contiguous word-major uint64 matrix (n_words, capacity)
+    so a query is a vectorized XOR + popcount pass followed by an argpartition top-k.
+    """
+    def __init__(self, n_bits: int = 256, initial_capacity: int = 1024):
+        self.n_bits = n_bits
+        self.n_bytes = (n_bits + 7) // 8
+        self.n_words = (self.n_bytes + 7) // 8
+        self._codes = np.zeros((self.n_words, max(1, initial_capacity)), dtype=np.uint64)
+        self._ids: List[str] = []
+        self._rows = {}
+        self._lock = threading.RLock()
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def __contains__(self, doc_id: str) -> bool:
+        return doc_id in self._rows
+
+    def to_words(self, code: bytes) -> np.ndarray:
+        """Pad packed sign bytes to whole uint64 words (padding bits are zero on both sides)"""
+        buf = np.zeros(self.n_words * 8, dtype=np.uint8)
+        raw = np.frombuffer(code, dtype=np.uint8)[:self.n_bytes]
+        buf[:len(raw)] = raw
+        return buf.view(np.uint64)
+
+    def _grow(self, needed: int):
+        capacity = self._codes.shape[1]
+        if needed <= capacity:
+            return
+        while capacity < needed:
+            capacity *= 2
+        grown = np.zeros((self.n_words, capacity), dtype=np.uint64)
+        grown[:, :len(self._ids)] = self._codes[:, :len(self._ids)]
+        self._codes = grown
+
+    def upsert(self, ids: Iterable[str], codes: Iterable[bytes]):
+        """Insert new codes or overwrite existing rows in place"""
+        with self._lock:
+            for doc_id, code in zip(ids, codes):
+                words = self.to_words(code)
+                row = self._rows.get(doc_id)
+                if row is None:
+                    row = len(self._ids)
+                    self._grow(row + 1)
+                    self._ids.append(doc_id)
+                    self._rows[doc_id] = row
+                self._codes[:, row] = words
+
+    def remove(self, ids: Iterable[str]):
+        """O(1) per id: the last row is moved into the freed slot"""
+        with self._lock:
+            for doc_id in ids:
+                row = self._rows.pop(doc_id, None)
+                if row is None:
+                    continue
+                last = len(self._ids) - 1
+                if row != last:
+                    moved_id = self._ids[last]
+                    self._codes[:, row] = self._codes[:, last]
+                    self._ids[row] = moved_id
+                    self._rows[moved_id] = row
+                self._ids.pop()
+
+    def reset(self, ids: List[str], codes: List[bytes]):
+        """Replace the whole index contents atomically"""
+        matrix = np.zeros((max(1, len(ids)), self.n_words * 8), dtype=np.uint8)
+        if ids:
+            packed = b"".join(bytes(c[:self.n_bytes]).ljust(self.n_bytes, b"\0") for c in codes)
+            matrix[:len(ids), :self.n_bytes] = np.frombuffer(packed, dtype=np.uint8).reshape(len(ids), self.n_bytes)
+        matrix = np.ascontiguousarray(matrix.view(np.uint64).T)
+        rows = {doc_id: row for row, doc_id in enumerate(ids)}
+        with self._lock:
+            self._codes = matrix
+            self._ids = list(ids)
+            self._rows = rows
+
+    def search(self, query_code, k: int = 10) -> Tuple[List[str], np.ndarray]:
+        """
+        Top-k by Hamming distance. query_code is packed sign bytes or uint64 words.
+        Returns (ids, similarities) with similarity = cos(pi * hamming / n_bits),
+        the same estimator as QJLRetriever.estimate_similarity.
+        """
+        with self._lock:
+            n = len(self._ids)
+            if n == 0 or k <= 0:
+                return [], np.zeros(0, dtype=np.float32)
+            q = query_code if isinstance(query_code, np.ndarray) else self.to_words(query_code)
+            dists = hamming_distance_batch(q, self._codes[:, :n], word_major=True)
+
+            k = min(k, n)
+            if k < n:
+                top = np.argpartition(dists, k - 1)[:k]
+            else:
+                top = np.arange(n)
+            top = top[np.argsort(dists[top], kind="stable")]
+
+            sims = similarity_from_hamming(dists[top], self.n_bits)
+            return [self._ids[i] for i in top], sims
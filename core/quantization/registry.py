@@ -0,0 +1,130 @@
+import threading
+import logging
+import time
+import numpy as np
+from typing import Callable, Dict, Tuple
+from .polar_quant import DEFAULT_ROTATION, PolarQuant
+from .qjl import QJLRetriever
+
+logger = logging.getLogger(__name__)
+
+# Process-wide quantizers keyed by their full configuration.
+# Instances are immutable after construction (arrays are flagged read-only),
+# so they are shared freely across threads and requests.
+_LOCK = threading.Lock()
+_POLAR: Dict[Tuple, PolarQuant] = {}
+_QJL: Dict[Tuple, QJLRetriever] = {}
+
+# Named shared-memory segments kept open for the life of the process
+_SEGMENTS = []
+_READY = 1
+# How long an attacher waits for the creator to publish before treating the segment as stale
+_READY_TIMEOUT = 5.0
+
+def _wait_ready(shm) -> bool:
+    deadline = time.monotonic() + _READY_TIMEOUT
+    while shm.buf[0] != _READY:
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+def _shared_array(name: str, shape: Tuple[int, ...], build: Callable[[], np.ndarray]) -> np.ndarray:
+    """
+    Read-only float64 array backed by a named shared-memory segment, so uvicorn
+    workers and Celery processes on one host map a single copy of the matrix.
+    The first process to arrive builds it; the others attach. A segment of the
+    wrong size, or one whose creator died before publishing it, is replaced.
+    Falls back to a private copy when shared memory is unavailable.
+    """
+    from multiprocessing import shared_memory, resource_tracker
+
+    nbytes = int(np.prod(shape)) * 8
+    for _ in range(2):
+        try:
+            shm = shared_memory.SharedMemory(name=name, create=True, size=nbytes + 8)
+            data = np.ndarray(shape, dtype=np.float64, buffer=shm.buf, offset=8)
+            data[...] = build()
+            shm.buf[0] = _READY # Published only once fully written
+            break
+        except FileExistsError:
+            try:
+                shm = shared_memory.SharedMemory(name=name)
+            except FileNotFoundError:
+                continue # Unlinked in between; try creating it again
+            # Attachers must not unlink the segment when they exit
+            resource_tracker.unregister(shm._name, "shared_memory")
+            if shm.size >= nbytes + 8 and _wait_ready(shm):
+                data = np.ndarray(shape, dtype=np.float64, buffer=shm.buf, offset=8)
+                break
+            logger.warning(f"Shared quantizer segment {name} is stale (size {shm.size}, expected {nbytes + 8}, "
+                           f"ready={shm.buf[0] == _READY}); recreating it")
+            resource_tracker.register(shm._name, "shared_memory") # Balanced by unlink()
+            shm.unlink()
+            shm.close()
+        except OSError as e:
+            logger.warning(f"Shared memory unavailable for {name} ({e}); using a private copy")
+            return build()
+    else:
+        logger.warning(f"Shared quantizer segment {name} could not be set up; using a private copy")
+        return build()
+    _SEGMENTS.append(shm)
+    data.flags.writeable = False
+    return data
+
+def unlink_shared(name: str) -> bool:
+    """
+    Remove a named quantizer segment (e.g. after a deploy changes dim or seed) -> whether it existed.
+    Processes that mapped it keep their copy; the next one to start builds a new segment.
+    """
+    from multiprocessing import shared_memory
+    try:
+        shm = shared_memory.SharedMemory(name=name)
+    except FileNotFoundError:
+        return False
+    shm.unlink()
+    shm.close()
+    return True
+
+def _freeze(*arrays):
+    for arr in arrays:
+        if isinstance(arr, np.ndarray):
+            arr.flags.writeable = False
+
+def get_polar_quant(dim: int = 768, bits: int = 3, seed: int = 42,
+                    rotation: str = DEFAULT_ROTATION, shared_memory: bool = False) -> PolarQuant:
+    """Shared PolarQuant for (dim, bits, seed, rotation), built once per process"""
+    key = (dim, bits, seed, rotation)
+    pq = _POLAR.get(key)
+    if pq is not None:
+        return pq
+    with _LOCK:
+        pq = _POLAR.get(key)
+        if pq is None:
+            shared = None
+            if shared_memory and rotation == "random_gaussian":
+                # Map the matrix another process already built instead of repeating the QR
+                shared = _shared_array(
+                    f"hgpt_pq_{dim}_{seed}", (dim, dim),
+                    lambda: PolarQuant(dim=dim, bits=bits, rotation=rotation, seed=seed).rotation_matrix
+                )
+            pq = PolarQuant(dim=dim, bits=bits, rotation=rotation, seed=seed, rotation_matrix=shared)
+            _freeze(pq.rotation_matrix, getattr(pq, "_signs", None))
+            _POLAR[key] = pq
+    return pq
+
+def get_qjl(dim: int = 768, jl_dim: int = 256, seed: int = 42, shared_memory: bool = False) -> QJLRetriever:
+    """Shared QJLRetriever for (dim, jl_dim, seed), built once per process"""
+    key = (dim, jl_dim, seed)
+    qjl = _QJL.get(key)
+    if qjl is not None:
+        return qjl
+    with _LOCK:
+        qjl = _QJL.get(key)
+        if qjl is None:
+            qjl = QJLRetriever(dim=dim, jl_dim=jl_dim, seed=seed)
+            if shared_memory:
+                qjl.J = _shared_array(f"hgpt_qjl_{dim}_{jl_dim}_{seed}", qjl.J.shape, lambda: qjl.J)
+            _freeze(qjl.J)
+            _QJL[key] = qjl
+    return qjl
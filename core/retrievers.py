@@ -1,155 +1,501 @@
+import asyncio
+import heapq
+import json
 import pickle
 import os
+import threading
 import time
+import uuid
 import numpy as np
 import logging
 import sys
-from typing import List, Tuple
-from rank_bm25 import BM25Okapi
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from itertools import islice
+from typing import Dict, List, Optional, Tuple
 import re
 from config import settings
+from core.fusion import fuse
+from core.locking import FileLock, acquire_lock
+from core.bm25 import (CollectionStats, InvertedIndex, MmapIndex, SegmentedIndex, generation_store, merge_segments,
+                       write_index, write_tombstones)
 
 logger = logging.getLogger(__name__)
 
-# --- CROSS-PLATFORM FILE LOCKING ---
-class FileLock:
-    def __init__(self, filename):
-        self.filename = filename
-        self.handle = None
-
-    def acquire(self):
-        if os.name == 'nt':  # Windows
-            import msvcrt
-            self.handle = open(self.filename, 'w')
-            # Lock the first byte of the file
-            try:
-                msvcrt.locking(self.handle.fileno(), msvcrt.LK_NBLCK, 1)
-            except IOError:
-                # If already locked, wait and retry (simple spinlock)
-                time.sleep(0.1)
-                try:
-                    msvcrt.locking(self.handle.fileno(), msvcrt.LK_NBLCK, 1)
-                except IOError:
-                    raise BlockingIOError("Resource locked")
-        else:  # Linux/Mac
-            import fcntl
-            self.handle = open(self.filename, 'w')
-            fcntl.flock(self.handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
-
-    def release(self):
-        if self.handle:
-            if os.name == 'nt':
-                import msvcrt
-                self.handle.seek(0)
-                msvcrt.locking(self.handle.fileno(), msvcrt.LK_UNLCK, 1)
-            else:
-                import fcntl
-                fcntl.flock(self.handle, fcntl.LOCK_UN)
-            self.handle.close()
-            self.handle = None
-
-    def __enter__(self):
-        self.acquire()
-        return self
-
-    def __exit__(self, exc_type, exc_value, traceback):
-        self.release()
+def _tokenize(text: str) -> List[str]:
+    return re.findall(r'\b[a-zA-Z0-9]+\b', text.lower())
+
+def _source_of(doc_id: str) -> str:
+    # Chunk ids are "<source>_<n>" (see DocumentProcessor)
+    return doc_id.rsplit("_", 1)[0]
+
+class BM25Retriever:
+    """In-memory BM25 over an incremental inverted index"""
+    def __init__(self, k1: float = None, b: float = None):
+        self.index = InvertedIndex(
+            k1=k1 if k1 is not None else getattr(settings, 'BM25_K1', 1.5),
+            b=b if b is not None else getattr(settings, 'BM25_B', 0.75)
+        )
+
+    def tokenizer(self, text: str):
+        return _tokenize(text)
+
+    def fit(self, documents: List[str], doc_ids: List[str]):
+        self.index.add(doc_ids, [self.tokenizer(doc) for doc in documents])
+
+    def retrieve(self, query: str, top_k: int = 10) -> List[Tuple[str, float]]:
+        tokenized_query = self.tokenizer(query)
+        if not tokenized_query:
+            return []
+        return self.index.top_k(tokenized_query, top_k)
 
 class PersistedBM25Retriever:
-    def __init__(self, index_path: str = "./data/bm25_index.pkl"):
+    """
+    BM25 over memory-mapped index files shared by every worker process.
+    Queries run against immutable segments: a base MmapIndex plus the delta
+    segments appended by later uploads, listed in a small manifest. An upload
+    writes only its own documents as a new delta and bumps a shared generation
+    number, so its cost does not grow with the corpus. A background thread watches
+    the generation, maps the new snapshot and flips the index reference, so queries
+    never stat, reload or see a half-built index.
+    Deletes only write tombstone sidecars. Once BM25_MAX_DELTAS deltas pile up, or
+    BM25_COMPACTION_RATIO of the index is tombstoned, a background thread merges
+    the segments into a new base without the deleted chunks.
+    """
+    def __init__(self, index_path: str = "./data/bm25_index.bm25", auto_refresh: bool = True):
         self.index_path = index_path
+        # Published delta segments of the current base file
+        self.manifest_path = index_path + ".segments"
+        # Pickled index from older releases, migrated on first load
+        self.legacy_path = os.path.splitext(index_path)[0] + ".pkl"
         
         # --- ADD THIS LINE: Ensure directory exists before creating locks ---
         os.makedirs(os.path.dirname(self.index_path), exist_ok=True)
         
         self.k1 = getattr(settings, 'BM25_K1', 1.5)
         self.b = getattr(settings, 'BM25_B', 0.75)
-        self.corpus = []
-        self.doc_ids = []
-        self.bm25 = None
-        self.last_mtime = 0
-        
-        self.load_index_if_fresh()
+        self.index = InvertedIndex(k1=self.k1, b=self.b)
+        self._compactor: Optional[threading.Thread] = None
+        self._compactor_lock = threading.Lock()
+
+        self.generations = generation_store(
+            index_path,
+            backend=getattr(settings, 'BM25_GENERATION_BACKEND', 'file'),
+            redis_url=getattr(settings, 'REDIS_URL', None)
+        )
+        self._refresh_lock = threading.Lock()
+        # Read before loading: a write landing in between just triggers one more refresh
+        self.generation = self.generations.get()
+        self.load_index()
+
+        # Writer-only instances (upload handlers, workers) pass auto_refresh=False:
+        # index_documents() and delete_documents() refresh under the file lock anyway
+        self._stop = threading.Event()
+        self._watcher: Optional[threading.Thread] = None
+        if auto_refresh:
+            self._watcher = threading.Thread(target=self._watch, name="bm25-refresh", daemon=True)
+            self._watcher.start()
 
     def tokenizer(self, text: str):
-        return re.findall(r'\b[a-zA-Z0-9]+\b', text.lower())
+        return _tokenize(text)
 
-    def _get_file_mtime(self):
-        if os.path.exists(self.index_path):
-            return os.path.getmtime(self.index_path)
-        return 0
+    def refresh(self) -> bool:
+        """Swap to the latest published snapshot if the generation moved -> whether it did"""
+        with self._refresh_lock:
+            generation = self.generations.get()
+            if generation == self.generation:
+                return False
+            # Only map what was published; migrating here would publish under this lock
+            self._load_published()
+            self.generation = generation
+            return True
+
+    def _watch(self):
+        interval = getattr(settings, 'BM25_REFRESH_INTERVAL', 0.5)
+        while not self._stop.wait(interval):
+            try:
+                self.refresh()
+            except Exception as e:
+                logger.error(f"BM25 refresh failed: {e}")
+
+    def close(self):
+        """Stop the refresh thread and unmap the index; the retriever answers nothing afterwards"""
+        self._stop.set()
+        if self._watcher is not None and self._watcher is not threading.current_thread():
+            self._watcher.join()
+        with self._refresh_lock:
+            index, self.index = self.index, InvertedIndex(k1=self.k1, b=self.b)
+        if isinstance(index, (MmapIndex, SegmentedIndex)):
+            index.close()
+
+    def _publish(self):
+        """Announce the files just written (caller holds the file lock)"""
+        with self._refresh_lock:
+            self.generation = self.generations.bump()
 
-    def load_index_if_fresh(self):
-        current_mtime = self._get_file_mtime()
-        if current_mtime > self.last_mtime:
-            self.load_index()
-            self.last_mtime = current_mtime
+    def _segments(self) -> List[MmapIndex]:
+        """Mapped segments of the current snapshot, base first"""
+        if isinstance(self.index, SegmentedIndex):
+            return list(self.index.segments)
+        if not isinstance(self.index, MmapIndex):
+            # In-memory index of a migration that another worker published
+            self._load_published()
+        return [self.index]
 
-    def index_documents(self, documents: List[str], doc_ids: List[str]):
-        """Thread-safe indexing using cross-platform lock."""
+    @staticmethod
+    def _view(segments: List[MmapIndex]):
+        return segments[0] if len(segments) == 1 else SegmentedIndex(segments)
+
+    def _write_manifest(self, segments: List[MmapIndex]):
+        manifest = {"base": segments[0].uid, "deltas": [os.path.basename(s.path) for s in segments[1:]]}
+        tmp_path = self.manifest_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(manifest, f)
+        os.replace(tmp_path, self.manifest_path)
+
+    def _published_segments(self) -> List[MmapIndex]:
+        base = MmapIndex(self.index_path)
+        try:
+            with open(self.manifest_path) as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            return [base]
+        if manifest.get("base") != base.uid:
+            return [base] # Left over from an older base file
+        directory = os.path.dirname(self.index_path)
+        return [base] + [MmapIndex(os.path.join(directory, name)) for name in manifest["deltas"]]
+
+    def index_documents(self, documents: List[str], doc_ids: List[str], sources: List[str] = None):
+        """Thread-safe indexing using cross-platform lock. Re-indexed ids replace their old version."""
         lock_path = self.index_path + ".lock"
         
         try:
             with FileLock(lock_path):
-                # Reload explicitly to get latest state from other workers
-                self.load_index() 
+                # Pick up other workers' writes (no-op if we already hold the latest state)
+                self.refresh()
                 
-                # Update Memory
+                # O(new tokens): the new documents become their own segment
                 tokenized_docs = [self.tokenizer(doc) for doc in documents]
-                self.corpus.extend(tokenized_docs)
-                self.doc_ids.extend(doc_ids)
-                
-                # Re-calculate BM25
-                self.bm25 = BM25Okapi(self.corpus, k1=self.k1, b=self.b)
+                sources = sources or [_source_of(doc_id) for doc_id in doc_ids]
+                delta = InvertedIndex(k1=self.k1, b=self.b)
+                delta.add(doc_ids, tokenized_docs, sources)
                 
                 # Save
-                self.save_index()
+                if os.path.exists(self.index_path):
+                    self._append_delta(delta)
+                else:
+                    self._write_base(delta)
         except BlockingIOError:
             logger.warning("Could not acquire lock for BM25 index, skipping update this time.")
         except Exception as e:
             logger.error(f"Error updating BM25: {e}")
 
+        index = self.index
+        if isinstance(index, SegmentedIndex) and len(index.segments) - 1 > getattr(settings, 'BM25_MAX_DELTAS', 8):
+            self._start_compaction()
+
+    def _append_delta(self, delta: InvertedIndex):
+        """Publish `delta` as a new segment, tombstoning older copies of its ids (caller holds the file lock)"""
+        segments = self._segments()
+        # Chunk ids embed their source, so only segments that know one of the sources can hold an older copy
+        new_sources = set(delta.sources)
+        for i, segment in enumerate(segments):
+            if new_sources.isdisjoint(segment.sources):
+                continue
+            # Private copy: the published segment stays untouched for in-flight queries
+            copy = MmapIndex(segment.path)
+            if copy.delete(delta.doc_ids):
+                write_tombstones(copy.path, copy)
+                segments[i] = copy
+
+        path = f"{self.index_path}.{uuid.uuid4().hex[:12]}.delta"
+        write_index(path, delta)
+        segments.append(MmapIndex(path))
+        self._write_manifest(segments)
+        self.index = self._view(segments)
+        self._publish()
+
+    def _write_base(self, index: InvertedIndex, deltas: List[MmapIndex] = ()):
+        """Write `index` as the new base file, keeping `deltas` on top (caller holds the file lock)"""
+        write_index(self.index_path, index)
+        segments = [MmapIndex(self.index_path), *deltas]
+        self._write_manifest(segments)
+        self.index = self._view(segments)
+        self._publish()
+
     def retrieve(self, query: str, top_k: int = 10) -> List[Tuple[str, float]]:
-        self.load_index_if_fresh()
-        
-        if not self.bm25 or not self.corpus:
-            return []
-            
         tokenized_query = self.tokenizer(query)
         if not tokenized_query:
             return []
             
-        scores = self.bm25.get_scores(tokenized_query)
-        top_n = np.argsort(scores)[::-1][:top_k]
-        
-        results = []
-        for idx in top_n:
-            if scores[idx] > 0:
-                results.append((self.doc_ids[idx], float(scores[idx])))
-        return results
+        index = self.index
+        if not index.n_docs:
+            return []
+        return index.top_k(tokenized_query, top_k)
 
-    def save_index(self):
-        os.makedirs(os.path.dirname(self.index_path), exist_ok=True)
-        with open(self.index_path, 'wb') as f:
-            pickle.dump({
-                'corpus': self.corpus,
-                'doc_ids': self.doc_ids
-            }, f)
-        self.last_mtime = os.path.getmtime(self.index_path)
+    def delete_documents(self, doc_ids: List[str] = None, source: str = None) -> int:
+        """
+        Tombstone chunks by id and/or every chunk of a source -> number of chunks removed.
+        Only the small sidecars are written; the generation bump makes other workers swap
+        to the tombstoned snapshot in the background.
+        """
+        lock = FileLock(self.index_path + ".lock")
+        if not acquire_lock(lock):
+            logger.warning("Could not acquire lock for BM25 index, deletion skipped.")
+            return 0
+        removed = 0
+        try:
+            self.refresh()
+            if not os.path.exists(self.index_path):
+                return 0
+            segments = self._segments()
+            for i, segment in enumerate(segments):
+                # Private copy: the published segment stays untouched for in-flight queries
+                copy = MmapIndex(segment.path)
+                before = copy.n_live
+                copy.delete(doc_ids or [])
+                if source:
+                    copy.delete_source(source)
+                if copy.n_live < before:
+                    write_tombstones(copy.path, copy)
+                    removed += before - copy.n_live
+                    segments[i] = copy
+            if removed:
+                self.index = self._view(segments)
+                self._publish()
+        finally:
+            lock.release()
+
+        if self.index.tombstone_ratio >= getattr(settings, 'BM25_COMPACTION_RATIO', 0.2):
+            self._start_compaction()
+        return removed
+
+    def _start_compaction(self):
+        with self._compactor_lock:
+            if self._compactor is not None and self._compactor.is_alive():
+                return
+            self._compactor = threading.Thread(target=self.compact, name="bm25-compaction", daemon=True)
+            self._compactor.start()
+
+    def compact(self) -> bool:
+        """
+        Merge the base and its deltas into a new base without tombstoned chunks. The
+        merge runs on a snapshot without holding the file lock; readers keep querying
+        the old segments until the swap. Deltas appended meanwhile stay deltas.
+        """
+        segments = self._segments()
+        if not isinstance(segments[0], MmapIndex) or (len(segments) == 1 and not segments[0].tombstone_ratio):
+            return False
+        # Own mappings, so the full postings scan does not churn the query-path decode cache
+        snapshot = [MmapIndex(segment.path) for segment in segments]
+        started = time.time()
+        merged = merge_segments(snapshot)
+
+        lock = FileLock(self.index_path + ".lock")
+        if not acquire_lock(lock):
+            return False
+        try:
+            current = self._published_segments()
+            if [s.uid for s in current[:len(snapshot)]] != [s.uid for s in snapshot]:
+                logger.info("BM25 index changed during compaction; will retry after the next write")
+                return False
+            # Tombstones that arrived while merging
+            for old, now in zip(snapshot, current):
+                merged.delete(now.doc_ids[d] for d in now.deleted_docs - old.deleted_docs)
+                names = list(now.sources)
+                for sid in now.deleted_sources - old.deleted_sources:
+                    merged.delete_source(names[sid])
+            self._write_base(merged, current[len(snapshot):])
+        except Exception as e:
+            logger.error(f"BM25 compaction failed: {e}")
+            return False
+        finally:
+            lock.release()
+
+        for segment in snapshot[1:]:
+            # Readers still mapping a merged delta keep it until they swap
+            for path in (segment.path, segment.path + ".del"):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+        logger.info(f"Compacted BM25 index: {len(snapshot)} segments, "
+                    f"{sum(s.n_docs for s in snapshot)} -> {merged.n_live} docs in {time.time() - started:.2f}s")
+        return True
 
     def load_index(self):
-        if not os.path.exists(self.index_path):
-            return
         try:
-            with open(self.index_path, 'rb') as f:
-                data = pickle.load(f)
-                self.corpus = data.get('corpus', [])
-                self.doc_ids = data.get('doc_ids', [])
-                if self.corpus:
-                    self.bm25 = BM25Okapi(self.corpus, k1=self.k1, b=self.b)
+            if os.path.exists(self.index_path):
+                self._load_published()
+            elif os.path.exists(self.legacy_path):
+                self._migrate_legacy()
         except Exception as e:
             logger.error(f"Failed to load BM25 index: {e}")
 
+    def _load_published(self):
+        if os.path.exists(self.index_path):
+            self.index = self._view(self._published_segments())
+
+    def _migrate_legacy(self):
+        with open(self.legacy_path, 'rb') as f:
+            data = pickle.load(f)
+        if data.get('format') == 2:
+            index = InvertedIndex.from_state(data['index'])
+            index.set_sources([_source_of(doc_id) for doc_id in index.doc_ids])
+        else:
+            # Raw token lists: index them once
+            index = InvertedIndex(k1=self.k1, b=self.b)
+            doc_ids = data.get('doc_ids', [])
+            index.add(doc_ids, data.get('corpus', []), [_source_of(doc_id) for doc_id in doc_ids])
+        self.index = index
+        try:
+            with FileLock(self.index_path + ".lock"):
+                if not os.path.exists(self.index_path):
+                    self._write_base(index)
+                    logger.info(f"Migrated {self.legacy_path} to {self.index_path}")
+        except BlockingIOError:
+            pass # Another worker holds the lock and writes the file
+
+# Shard files mapped by this (worker) process: path -> index
+_SHARD_CACHE: Dict[str, MmapIndex] = {}
+
+def _mapped_shard(path: str, uid: str) -> MmapIndex:
+    shard = _SHARD_CACHE.get(path)
+    if shard is None or shard.uid != uid:
+        # The parent names the file version it expects, so no per-query stat()
+        shard = _SHARD_CACHE[path] = MmapIndex(path)
+    return shard
+
+def _shard_stats(path: str, uid: str, query_tokens: List[str]) -> CollectionStats:
+    """Process-pool task: one shard file's statistics for the query terms (df decodes their postings)"""
+    return _mapped_shard(path, uid).stats(query_tokens)
+
+def _search_shard(path: str, uid: str, query_tokens: List[str], top_k: int,
+                  stats: CollectionStats) -> List[Tuple[str, float]]:
+    """Process-pool task: top-k of one shard file under corpus-wide statistics"""
+    return _mapped_shard(path, uid).top_k(query_tokens, top_k, stats)
+
+class DistributedBM25:
+    """
+    BM25 partitioned into shards of `shard_size` documents (BM25_SHARD_SIZE).
+    Every shard is scored with corpus-wide statistics (doc count, average length,
+    per-term df), so the heap-merged per-shard top-k lists rank exactly as a single
+    index would.
+    - In memory (index_dir=None): shards are searched on a thread pool; the heavy
+      kernels are NumPy and release the GIL, and free-threaded builds scale fully.
+    - With index_dir: shards are mmap index files searched on a process pool; each
+      worker maps a shard once and the page cache shares it.
+    Per-shard statistics are gathered on the same pool before the search fan-out.
+    New ids fill the last shard; a re-added id tombstones its previous copy in
+    whichever shard holds it. Shards are never mutated in place: a write
+    publishes a new shard list.
+    Library component for single-process indexing and offline evaluation
+    (tests/bm25_benchmark.py): it has no cross-process refresh or deletes, so
+    RAGService and the upload path use PersistedBM25Retriever.
+    """
+    def __init__(self, shard_size: int = None, index_dir: str = None, max_workers: int = None,
+                 k1: float = None, b: float = None):
+        self.shard_size = max(1, shard_size or getattr(settings, 'BM25_SHARD_SIZE', 10000))
+        self.index_dir = index_dir
+        self.k1 = k1 if k1 is not None else getattr(settings, 'BM25_K1', 1.5)
+        self.b = b if b is not None else getattr(settings, 'BM25_B', 0.75)
+        self.shards: List[InvertedIndex] = []
+        self._write_lock = threading.Lock()
+        # doc id -> shard holding its latest copy, built on the first write
+        self._shard_of: Optional[Dict[str, int]] = None
+
+        max_workers = max_workers or os.cpu_count() or 1
+        if index_dir:
+            os.makedirs(index_dir, exist_ok=True)
+            paths = sorted(f for f in os.listdir(index_dir) if f.startswith("shard_") and f.endswith(".bm25"))
+            self.shards = [MmapIndex(os.path.join(index_dir, f)) for f in paths]
+            self._executor = ProcessPoolExecutor(max_workers=max_workers)
+        else:
+            self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="bm25-shard")
+
+    def _shard_path(self, i: int) -> str:
+        return os.path.join(self.index_dir, f"shard_{i:05d}.bm25")
+
+    @property
+    def n_docs(self) -> int:
+        return sum(shard.n_docs for shard in self.shards)
+
+    def _add(self, documents: List[str], doc_ids: List[str]):
+        # Within one call the last copy of an id wins
+        latest = {doc_id: i for i, doc_id in enumerate(doc_ids)}
+        if len(latest) < len(doc_ids):
+            keep = sorted(latest.values())
+            documents, doc_ids = [documents[i] for i in keep], [doc_ids[i] for i in keep]
+        tokenized = [_tokenize(doc) for doc in documents]
+        with self._write_lock:
+            shards = list(self.shards)
+            if self._shard_of is None:
+                self._shard_of = {doc_id: i for i, shard in enumerate(shards) for doc_id in shard.doc_ids}
+            shard_of = dict(self._shard_of)
+            touched = set()
+
+            def writable(i):
+                # Copy-on-write: queries may be reading the published shard
+                if i not in touched:
+                    shards[i] = InvertedIndex.from_state(shards[i].to_state())
+                    touched.add(i)
+                return shards[i]
+
+            stale: Dict[int, List[str]] = {}
+            for doc_id in doc_ids:
+                if doc_id in shard_of:
+                    stale.setdefault(shard_of[doc_id], []).append(doc_id)
+            for i, ids in stale.items():
+                writable(i).delete(ids)
+
+            pos = 0
+            while pos < len(tokenized):
+                if not shards or shards[-1].n_docs >= self.shard_size:
+                    shards.append(InvertedIndex(k1=self.k1, b=self.b))
+                    touched.add(len(shards) - 1)
+                room = self.shard_size - shards[-1].n_docs
+                writable(len(shards) - 1).add(doc_ids[pos:pos + room], tokenized[pos:pos + room])
+                shard_of.update((doc_id, len(shards) - 1) for doc_id in doc_ids[pos:pos + room])
+                pos += room
+
+            if self.index_dir:
+                for i in sorted(touched):
+                    write_index(self._shard_path(i), shards[i])
+                    shards[i] = MmapIndex(self._shard_path(i))
+            self.shards = shards
+            self._shard_of = shard_of
+
+    async def add_documents(self, documents: List[str], doc_ids: List[str]):
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, self._add, documents, doc_ids)
+
+    async def retrieve(self, query: str, top_k: int = 10) -> List[Tuple[str, float]]:
+        tokenized_query = _tokenize(query)
+        shards = self.shards
+        if not tokenized_query or not shards:
+            return []
+
+        loop = asyncio.get_running_loop()
+        # df decodes each query term's postings, so it runs per shard on the pool too
+        if self.index_dir:
+            parts = [loop.run_in_executor(self._executor, _shard_stats, self._shard_path(i), shard.uid, tokenized_query)
+                     for i, shard in enumerate(shards)]
+        else:
+            parts = [loop.run_in_executor(self._executor, shard.stats, tokenized_query) for shard in shards]
+        stats = CollectionStats.merge(await asyncio.gather(*parts))
+        if self.index_dir:
+            tasks = [loop.run_in_executor(self._executor, _search_shard, self._shard_path(i), shard.uid,
+                                          tokenized_query, top_k, stats)
+                     for i, shard in enumerate(shards)]
+        else:
+            tasks = [loop.run_in_executor(self._executor, shard.top_k, tokenized_query, top_k, stats)
+                     for shard in shards]
+        per_shard = await asyncio.gather(*tasks)
+        # Each list is already sorted best-first
+        return list(islice(heapq.merge(*per_shard, key=lambda r: -r[1]), top_k))
+
+    def close(self):
+        self._executor.shutdown(wait=False)
+
 class ElasticsearchHybridRetriever:
     """
     Connects to Elasticsearch for BM25 search combined with fast QJL signature pre-filtering.
@@ -160,8 +506,8 @@ class ElasticsearchHybridRetriever:
         self.index_name = index_name
         self.qjl = None
         try:
-            from core.quantization import QJLRetriever
-            self.qjl = QJLRetriever(dim=768)
+            from core.quantization import get_qjl
+            self.qjl = get_qjl(dim=768)
         except ImportError:
             pass
             
@@ -179,41 +525,32 @@ class ElasticsearchHybridRetriever:
         # Mocking ES Response for architecture design requirement
         mock_es_results = [] # [(doc_id, bm25_score_normalized, qjl_hex)]
         
-        final_scores = {}
-        for doc_id, bm25_score, qjl_hex in mock_es_results:
-            if not self.qjl or not qjl_hex:
-                final_scores[doc_id] = bm25_score
-                continue
-                
-            qjl_bytes = bytes.fromhex(qjl_hex)
+        if not mock_es_results:
+            return []
+
+        doc_ids = [r[0] for r in mock_es_results]
+        bm25_scores = np.array([r[1] for r in mock_es_results], dtype=np.float32)
+        has_sig = np.array([bool(r[2]) for r in mock_es_results])
+
+        final = bm25_scores.copy()
+        if self.qjl and query_qjl_hex and has_sig.any():
+            # Fast Hamming comparison: every signature in one XOR + popcount kernel
+            signed = np.flatnonzero(has_sig)
+            codes = [bytes.fromhex(mock_es_results[i][2]) for i in signed]
             query_bytes = bytes.fromhex(query_qjl_hex)
-            
-            # Fast Hamming comparison
-            sim = self.qjl.estimate_similarity(query_bytes, qjl_bytes)
-            
+            sims = self.qjl.estimate_similarity_batch(query_bytes, codes, n_bits=len(query_bytes) * 8)
+
             # Hybrid Boosting: If BM25 high AND QJL match
-            if sim > threshold:
-                final_scores[doc_id] = bm25_score * 1.5 + sim  # Boost priority
-            else:
-                final_scores[doc_id] = bm25_score * 0.5        # Penalize priority
-                
-        return sorted(final_scores.items(), key=lambda x: x[1], reverse=True)[:top_k]
+            boosted = np.where(sims > threshold, bm25_scores[signed] * 1.5 + sims, bm25_scores[signed] * 0.5)
+            final[signed] = boosted
+
+        top = np.argsort(-final, kind="stable")[:top_k]
+        return [(doc_ids[i], float(final[i])) for i in top]
 
 def reciprocal_rank_fusion(
     vector_results: List[Tuple[str, float]], 
     keyword_results: List[Tuple[str, float]], 
     k: int = 60
 ) -> List[Tuple[str, float]]:
-    fused_scores = {}
-    if not vector_results: vector_results = []
-    if not keyword_results: keyword_results = []
-
-    for rank, (doc_id, _) in enumerate(vector_results):
-        if doc_id not in fused_scores: fused_scores[doc_id] = 0
-        fused_scores[doc_id] += 1 / (k + rank + 1)
-        
-    for rank, (doc_id, _) in enumerate(keyword_results):
-        if doc_id not in fused_scores: fused_scores[doc_id] = 0
-        fused_scores[doc_id] += 1 / (k + rank + 1)
-    
-    return sorted(fused_scores.items(), key=lambda x: x[1], reverse=True)
\ No newline at end of file
+    """Unweighted two-list RRF; see core.fusion.fuse for weights, more lists and score fusion"""
+    return fuse({"vector": vector_results or [], "bm25": keyword_results or []}, k=k)
\ No newline at end of file
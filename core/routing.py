@@ -0,0 +1,171 @@
+import json
+import logging
+import os
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+ROUTES = ("fast", "deep", "agentic", "graph")
+
+# Labelled examples so every route has a centroid before any decision has been logged
+SEED_QUERIES: Dict[str, List[str]] = {
+    "fast": [
+        "What did Hemanth build?",
+        "What is knn?",
+        "Explain ChromaDB.",
+        "Which database stores the vectors?",
+        "What port does the API run on?",
+        "Who is the author of the report?",
+    ],
+    "deep": [
+        "Summarize the main contributions of the paper.",
+        "Compare the training approaches described in both documents.",
+        "Why does the model outperform the baseline, step by step?",
+        "What are the trade-offs between the proposed architectures?",
+        "Synthesize the findings into recommendations for a production system.",
+        "Explain how the sections on scaling and data relate to each other.",
+    ],
+    "agentic": [
+        "What is the weather in Tokyo today?",
+        "What is 17.5% of 2340?",
+        "Who won the latest Champions League final?",
+        "Search the web for the current price of bitcoin.",
+        "Calculate the compound interest on 10000 at 5% for 7 years.",
+        "What are today's top news headlines?",
+    ],
+    "graph": [
+        "How is HGPT connected to FastAPI and ChromaDB?",
+        "Which entities are related to the transformer architecture?",
+        "Show the relationships between the authors and their projects.",
+        "What depends on the embedding service?",
+        "Map the hierarchy of components in the system.",
+        "Which organizations are linked to Hemanth?",
+    ],
+}
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    vectors = np.atleast_2d(np.asarray(vectors, dtype=np.float64))
+    return vectors / np.clip(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12, None)
+
+class EmbeddingRouter:
+    """
+    Nearest-centroid query router over query embeddings.
+    Each route keeps the running sum of its (normalized) training embeddings;
+    a query goes to the route with the closest centroid, with a softmax over the
+    cosine similarities as confidence. Below the caller's threshold the LLM
+    router decides instead.
+    One matrix-vector product per query: well under a millisecond on CPU.
+    """
+    def __init__(self, temperature: float = 0.05, embedding_model: Optional[str] = None):
+        self.temperature = temperature
+        self.embedding_model = embedding_model
+        self.routes: List[str] = []
+        self._sums: Optional[np.ndarray] = None
+        self.counts: List[int] = []
+        self._centroids: Optional[np.ndarray] = None
+
+    @property
+    def ready(self) -> bool:
+        return self._centroids is not None and len(self.routes) > 1
+
+    def fit(self, embeddings: Sequence[Sequence[float]], labels: Sequence[str]) -> "EmbeddingRouter":
+        self.routes, self._sums, self.counts, self._centroids = [], None, [], None
+        return self.partial_fit(embeddings, labels)
+
+    def partial_fit(self, embeddings: Sequence[Sequence[float]], labels: Sequence[str]) -> "EmbeddingRouter":
+        if len(embeddings) != len(labels):
+            raise ValueError(f"{len(embeddings)} embeddings for {len(labels)} labels")
+        if not len(labels):
+            return self
+        vectors = _normalize(embeddings)
+        if self._sums is None:
+            self._sums = np.zeros((0, vectors.shape[1]))
+        for route in labels:
+            if route not in self.routes:
+                self.routes.append(route)
+                self.counts.append(0)
+                self._sums = np.vstack([self._sums, np.zeros(vectors.shape[1])])
+        for vector, route in zip(vectors, labels):
+            i = self.routes.index(route)
+            self._sums[i] += vector
+            self.counts[i] += 1
+        self._centroids = _normalize(self._sums)
+        return self
+
+    def _probs(self, embedding: Sequence[float]) -> np.ndarray:
+        sims = self._centroids @ _normalize(embedding)[0]
+        exp = np.exp((sims - sims.max()) / self.temperature)
+        return exp / exp.sum()
+
+    def scores(self, embedding: Sequence[float]) -> Dict[str, float]:
+        """Softmax-normalized route probabilities"""
+        return dict(zip(self.routes, self._probs(embedding).tolist()))
+
+    def predict(self, embedding: Sequence[float]) -> Tuple[str, float]:
+        """(route, confidence)"""
+        probs = self._probs(embedding)
+        best = int(np.argmax(probs))
+        return self.routes[best], float(probs[best])
+
+    # --- persistence ---
+    def save(self, path: str):
+        state = {
+            "embedding_model": self.embedding_model,
+            "temperature": self.temperature,
+            "routes": self.routes,
+            "counts": self.counts,
+            "sums": self._sums.tolist() if self._sums is not None else [],
+            "trained_at": time.time(),
+        }
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path + ".tmp", "w") as f:
+            json.dump(state, f)
+        os.replace(path + ".tmp", path)
+
+    @classmethod
+    def load(cls, path: str) -> "EmbeddingRouter":
+        with open(path) as f:
+            state = json.load(f)
+        router = cls(state.get("temperature", 0.05), state.get("embedding_model"))
+        router.routes = list(state["routes"])
+        router.counts = list(state["counts"])
+        if state["sums"]:
+            router._sums = np.asarray(state["sums"], dtype=np.float64)
+            router._centroids = _normalize(router._sums)
+        return router
+
+class RoutingLog:
+    """Append-only JSONL of routing decisions ({"question", "route", "source"}), the local router's training data"""
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def append(self, question: str, route: str, source: str = "llm"):
+        line = json.dumps({"question": question, "route": route, "source": source, "ts": time.time()})
+        try:
+            with self._lock:
+                os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+                with open(self.path, "a") as f:
+                    f.write(line + "\n")
+        except OSError as e:
+            logger.warning(f"Could not log routing decision: {e}")
+
+    def read(self, sources: Iterable[str] = ("llm",)) -> List[Tuple[str, str]]:
+        """(question, route) pairs, latest decision per question, routes outside ROUTES dropped"""
+        if not os.path.exists(self.path):
+            return []
+        sources = set(sources)
+        latest: Dict[str, str] = {}
+        with open(self.path) as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                if record.get("source") in sources and record.get("route") in ROUTES:
+                    latest[record["question"]] = record["route"]
+        return list(latest.items())
@@ -0,0 +1,54 @@
+import asyncio
+import logging
+from typing import Any, Awaitable, Optional
+
+from core.cache.stage import normalize_query
+from observability.metrics import speculative_retrieval
+
+logger = logging.getLogger(__name__)
+
+def query_similarity(a: str, b: str) -> float:
+    """Jaccard overlap of the normalized query terms (1.0 for queries that normalize the same)"""
+    a, b = normalize_query(a), normalize_query(b)
+    if a == b:
+        return 1.0
+    ta, tb = set(a.split()), set(b.split())
+    if not ta or not tb:
+        return 0.0
+    return len(ta & tb) / len(ta | tb)
+
+class Speculation:
+    """
+    Work started on a guessed input before the real one is known: retrieval on
+    the raw question while routing / rewriting are still in flight.
+    resolve(final_query) returns the speculative result when the final query is
+    close enough to the guess (>= threshold), otherwise cancels the work and
+    returns None so the caller runs it for the final query.
+    Outcomes are exported as hit / miss / failed.
+    """
+    def __init__(self, query: str, work: Awaitable[Any], threshold: float = 0.8):
+        self.query = query
+        self.threshold = threshold
+        self._task = asyncio.ensure_future(work)
+        # A failure nobody waits for (cancelled or missed speculation) is not worth a warning
+        self._task.add_done_callback(lambda task: task.cancelled() or task.exception())
+
+    async def resolve(self, final_query: str) -> Optional[Any]:
+        if query_similarity(self.query, final_query) < self.threshold:
+            self.cancel()
+            speculative_retrieval.labels(result="miss").inc()
+            return None
+        try:
+            result = await self._task
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning(f"Speculative work failed ({e}); running it again for the final query")
+            speculative_retrieval.labels(result="failed").inc()
+            return None
+        speculative_retrieval.labels(result="hit").inc()
+        return result
+
+    def cancel(self):
+        if not self._task.done():
+            self._task.cancel()
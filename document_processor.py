@@ -3,6 +3,7 @@ import re
 import logging
 import asyncio
 import chromadb
+import importlib.util
 from typing import List
 from langchain_core.documents import Document
 
@@ -12,11 +13,9 @@ from core.retrievers import PersistedBM25Retriever
 from core.chunkers import SemanticChunker # <--- CONNECTED NOW
 from core.cache.quantized_redis import EmbeddingCache   # <--- CONNECTED NOW
 
-try:
-    from sentence_transformers import SentenceTransformer
-    HAS_SENTENCE_TRANSFORMER = True
-except ImportError:
-    HAS_SENTENCE_TRANSFORMER = False
+# Checked without importing it; load_sentence_encoder imports it when the torch backend is used
+HAS_SENTENCE_TRANSFORMER = importlib.util.find_spec("sentence_transformers") is not None
+from services.onnx_backend import load_sentence_encoder
 
 # Try importing standard PDF library
 try:
@@ -42,8 +41,8 @@ class DocumentProcessor:
         raw_collection._embedding_function = ef
         self.collection = QuantizedChromaAdapter(raw_collection, dim=768)
         
-        # 2. Initialize Keyword DB
-        self.bm25_retriever = PersistedBM25Retriever()
+        # 2. Initialize Keyword DB (write-only here: no background refresh thread)
+        self.bm25_retriever = PersistedBM25Retriever(auto_refresh=False)
         
         # 3. Initialize Cache & Chunker
         self.embedding_cache = EmbeddingCache(redis_url=settings.REDIS_URL)
@@ -51,10 +50,13 @@ class DocumentProcessor:
         
         # 4. Load Embedding Model (Critical for Semantic Chunking)
         self.embed_model = None
-        if HAS_SENTENCE_TRANSFORMER:
-            logger.info("Loading SentenceTransformer for Semantic Chunking...")
+        if HAS_SENTENCE_TRANSFORMER or settings.INFERENCE_BACKEND != "torch":
+            logger.info(f"Loading SentenceTransformer for Semantic Chunking ({settings.INFERENCE_BACKEND})...")
             # Use a fast, small model for chunking decisions
-            self.embed_model = SentenceTransformer('all-MiniLM-L6-v2')
+            onnx_options = {} if settings.INFERENCE_BACKEND == "torch" else {
+                "cache_dir": settings.ONNX_CACHE_DIR, "num_threads": settings.ONNX_THREADS
+            }
+            self.embed_model = load_sentence_encoder('all-MiniLM-L6-v2', backend=settings.INFERENCE_BACKEND, **onnx_options)
             
             # --- THE FIX: Inject real embedding function into Chunker ---
             async def real_embed_fn(text: str) -> List[float]:
@@ -133,7 +135,9 @@ class DocumentProcessor:
         # 2. Update BM25 (Atomic Lock handled inside class)
         try:
             loop = asyncio.get_running_loop()
-            await loop.run_in_executor(None, self.bm25_retriever.index_documents, chunks, ids)
+            await loop.run_in_executor(
+                None, self.bm25_retriever.index_documents, chunks, ids, [filename] * len(chunks)
+            )
             logger.info(f"Successfully saved {len(chunks)} chunks from {filename}")
         except Exception as e:
             logger.error(f"Failed to update BM25 index: {e}. Rolling back ChromaDB insert.")
@@ -145,6 +149,9 @@ class DocumentProcessor:
 
         yield "done"
 
+    def close(self):
+        self.bm25_retriever.close()
+
     def _extract_text_from_pdf(self, file_path: str) -> str:
         if not pypdf: return ""
         try:
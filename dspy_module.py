@@ -6,9 +6,14 @@ from config import settings
 
 logger = logging.getLogger(__name__)
 
+import inspect
 import json
+import time
 import asyncio
 from core.mcp_client import mcp_registry
+from core.grading import agreement, format_chunks, grade_concurrently, parse_verdicts, threshold_grades
+from core.guard import GuardEngine
+from observability.metrics import crag_grading_latency, crag_grading_agreement, guard_checks
 
 # --- NEST_ASYNCIO FOR DSPY THREADS ---
 try:
@@ -132,6 +137,15 @@ class DocumentEvaluator(dspy.Signature):
     question = dspy.InputField()
     is_relevant = dspy.OutputField(desc="Exactly 'Yes' or 'No'")
 
+class BatchDocumentEvaluator(dspy.Signature):
+    """
+    Evaluate each numbered chunk in 'context_chunks' for relevance to the 'question'.
+    Output one verdict per chunk, in order, as a comma-separated list of 'Yes' or 'No'.
+    """
+    context_chunks = dspy.InputField(desc="Numbered chunks from the knowledge base: [1] ..., [2] ...")
+    question = dspy.InputField()
+    verdicts = dspy.OutputField(desc="Comma-separated 'Yes'/'No', exactly one per chunk, e.g. 'Yes, No, Yes'")
+
 class EntityExtractor(dspy.Signature):
     """
     Extract key entities and their relationships from the given text.
@@ -165,6 +179,14 @@ class RAGModule(dspy.Module):
         
         # 6. CRAG Evaluator
         self.doc_evaluator = dspy.Predict(DocumentEvaluator)
+        self.batch_evaluator = dspy.Predict(BatchDocumentEvaluator)
+        
+        # 5b. Local NLI guard; the LLM guard above only sees low-confidence verdicts
+        self.guard_engine = GuardEngine(
+            settings.GUARD_NLI_MODEL or None,
+            entail_threshold=settings.GUARD_ENTAILMENT_THRESHOLD,
+            contradict_threshold=settings.GUARD_CONTRADICTION_THRESHOLD
+        )
         
         # 7. Entity Extractor (GraphRAG)
         self.entity_extractor = dspy.Predict(EntityExtractor)
@@ -190,30 +212,157 @@ class RAGModule(dspy.Module):
         except Exception:
             return question
 
-    def route_query(self, question):
+    def classify_route(self, question):
+        """The LLM router's route, or None when it failed or gave no valid route"""
         try:
             pred = self.router(question=question)
             route = pred.route.strip().lower()
             for valid in ["fast", "deep", "agentic", "graph"]:
                 if valid in route:
                     return valid
-            return "deep"
+            return None
         except Exception as e:
             logger.error(f"Routing failed: {e}")
-            return "deep"
+            return None
+
+    def route_query(self, question):
+        return self.classify_route(question) or "deep"
 
-    def evaluate_context(self, question, context_chunks):
-        relevant = []
-        for chunk in context_chunks:
+    def _grade_chunk(self, question, chunk):
+        pred = self.doc_evaluator(context_chunk=chunk, question=question)
+        return "yes" in pred.is_relevant.lower()
+
+    def grade_context(self, question, context_chunks, mode="batch", scores=None):
+        """
+        Relevance verdict per chunk:
+        - batch: one LLM call grading every chunk (falls back to concurrent if the verdict list is malformed)
+        - concurrent: one call per chunk, at most CRAG_MAX_CONCURRENCY in flight
+        - serial: one call per chunk, in order
+        - cross_encoder: no LLM, scores above CRAG_RELEVANCE_THRESHOLD (needs `scores`)
+        """
+        if not context_chunks:
+            return []
+        start = time.perf_counter()
+        grade = lambda chunk: self._grade_chunk(question, chunk)
+        if mode == "cross_encoder":
+            if scores is None:
+                raise ValueError("cross_encoder grading needs cross-encoder scores")
+            grades = threshold_grades(scores, settings.CRAG_RELEVANCE_THRESHOLD)
+        elif mode == "batch":
+            grades = None
             try:
-                pred = self.doc_evaluator(context_chunk=chunk, question=question)
-                if "yes" in pred.is_relevant.lower():
-                    relevant.append(chunk)
-            except Exception:
-                relevant.append(chunk) # Default to keep if eval fails
-        return relevant
+                pred = self.batch_evaluator(context_chunks=format_chunks(context_chunks), question=question)
+                grades = parse_verdicts(pred.verdicts, len(context_chunks))
+            except Exception as e:
+                logger.warning(f"Batched CRAG grading failed: {e}")
+            if grades is None:
+                logger.warning("Batched CRAG grading gave no usable verdict list; grading per chunk")
+                grades = grade_concurrently(grade, context_chunks, settings.CRAG_MAX_CONCURRENCY)
+        elif mode == "concurrent":
+            grades = grade_concurrently(grade, context_chunks, settings.CRAG_MAX_CONCURRENCY)
+        elif mode == "serial":
+            grades = grade_concurrently(grade, context_chunks, max_workers=1)
+        else:
+            raise ValueError(f"Unknown CRAG grading mode: {mode}")
+        crag_grading_latency.labels(mode=mode).observe(time.perf_counter() - start)
+        return grades
+
+    def evaluate_context(self, question, context_chunks, mode=None, scores=None):
+        grades = self.grade_context(question, context_chunks, mode or settings.CRAG_GRADING_MODE, scores)
+        return [chunk for chunk, keep in zip(context_chunks, grades) if keep]
+
+    def compare_grading(self, question, context_chunks, scores=None, modes=("batch", "concurrent", "serial", "cross_encoder")):
+        """Run several grading modes on the same chunks -> latency, verdicts and pairwise agreement"""
+        latency, grades = {}, {}
+        for mode in modes:
+            if mode == "cross_encoder" and scores is None:
+                continue
+            start = time.perf_counter()
+            grades[mode] = self.grade_context(question, context_chunks, mode, scores)
+            latency[mode] = time.perf_counter() - start
+        pairs = agreement(grades)
+        for pair, value in pairs.items():
+            crag_grading_agreement.labels(pair=pair).set(value)
+        return {"latency": latency, "grades": grades, "agreement": pairs}
 
-    def forward(self, question, context, history_str="", mode="fast"):
+    def _guard_embeddings(self, chunks, answer, context_embeddings=None):
+        """(answer, context) embeddings for the embedding fallback; only computed when there is no NLI model"""
+        if self.guard_engine.has_nli:
+            return None, None
+        try:
+            from services.quantized_chroma import OllamaEmbeddingFunction
+            ef = OllamaEmbeddingFunction(model_name=settings.OLLAMA_EMBEDDING_MODEL, base_url=settings.OLLAMA_URL)
+            if context_embeddings is None:
+                # Embedded with the answer in one request, then reused by later attempts
+                *context_embeddings, answer_embedding = ef(list(chunks) + [answer])
+                return answer_embedding, context_embeddings
+            return ef([answer])[0], context_embeddings
+        except Exception as e:
+            logger.warning(f"Guard embeddings unavailable: {e}")
+            return None, None
+
+    def _apply_guard(self, pred, question, context, context_chunks=None, context_embeddings=None, context_fidelity=1.0):
+        """
+        Check pred.answer against the context; a flagged answer is regenerated (strictly grounded) up to 3 times.
+        context_fidelity: expected cosine of the given context embeddings to the exact ones (PolarQuant reconstructions).
+        """
+        chunks = context_chunks if context_chunks is not None else context.split("\n---\n")
+        if context_embeddings is None:
+            context_fidelity = 1.0 # Embedded exactly below
+        max_attempts = 3
+        attempts = 0
+        while attempts < max_attempts:
+            try:
+                # --- FAST PATH: local NLI, every answer sentence against every chunk ---
+                answer_embedding, context_embeddings = self._guard_embeddings(chunks, pred.answer, context_embeddings)
+                verdict = self.guard_engine.check(chunks, pred.answer, answer_embedding, context_embeddings,
+                                                  context_fidelity)
+                guard_checks.labels(method=verdict.method, verdict=str(verdict.supported)).inc()
+                if verdict.supported is True:
+                    logger.info(f"Guard ({verdict.method}) passed in {verdict.elapsed * 1000:.0f} ms")
+                    break
+                if verdict.supported is None:
+                    # --- SLOW PATH: LLM guard, only for low-confidence verdicts ---
+                    check = self.guard(context=context, question=question, answer=pred.answer)
+                    if "false" not in check.is_supported.lower():
+                        break # Validated!
+                    
+                logger.warning(f"Guardrail flagged hallucination (Attempt {attempts+1}/{max_attempts}). Retrying...")
+                attempts += 1
+                
+                # Strictly instruct it to ground itself
+                if attempts < max_attempts:
+                    stricter_question = f"{question} (Strictly base your answer ONLY on the context provided. Do not invent information.)"
+                    pred = self.fast_prog(context=context, question=stricter_question)
+            except Exception as e:
+                logger.error(f"Guardrail check failed: {e}")
+                break
+            
+        return pred
+
+    def chat_messages(self, question, context, history_str="", mode="fast"):
+        """
+        The fast / deep generation prompt as plain chat messages, for streaming
+        straight from Ollama (DSPy only returns a prediction once it is complete).
+        Compiled demos are not included.
+        """
+        signature = DeepSignature if mode == "deep" else FastSignature
+        user = f"Context:\n{context}\n\n"
+        if history_str:
+            user += f"Chat History:\n{history_str}\n\n"
+        user += f"Question: {question}\n\nAnswer:"
+        return [
+            {"role": "system", "content": inspect.cleandoc(signature.__doc__)},
+            {"role": "user", "content": user}
+        ]
+
+    def guard_answer(self, question, context, answer, context_chunks=None, context_embeddings=None, context_fidelity=1.0):
+        """Deep-mode guard for an answer generated outside forward() (streamed); returns the final Prediction"""
+        return self._apply_guard(dspy.Prediction(answer=answer), question, context, context_chunks, context_embeddings,
+                                 context_fidelity)
+
+    def forward(self, question, context, history_str="", mode="fast", context_chunks=None, context_embeddings=None,
+                context_fidelity=1.0):
         # 1. Generate Initial Answer
         if mode == "agentic":
             # For the agent, provide the existing context as part of the query so it can use tools if context is insufficient
@@ -226,53 +375,6 @@ class RAGModule(dspy.Module):
                                   chat_history=history_str)
             
             # 2. Apply Guardrail (Self-Correction) for Deep Mode
-            max_attempts = 3
-            attempts = 0
-            while attempts < max_attempts:
-                try:
-                    # --- FAST NLI (QJL Signature Check) ---
-                    # Using local QJL extraction as an ultra-fast NLI filter
-                    try:
-                        from core.quantization import QJLRetriever
-                        from services.quantized_chroma import OllamaEmbeddingFunction
-                        import numpy as np
-                        
-                        ef = OllamaEmbeddingFunction()
-                        # Embed context and answer
-                        ctx_emb = ef([context[:1000]])[0] # taking first 1k chars to avoid massive embedding
-                        ans_emb = ef([pred.answer])[0]
-                        
-                        qjl = QJLRetriever(dim=768)
-                        # We use 1-bit sign projections directly for fast cross-check without polar phase
-                        ctx_jl = qjl._pack_bits(np.sign(np.dot(np.array(ctx_emb, dtype=np.float32), qjl.J)))
-                        ans_jl = qjl._pack_bits(np.sign(np.dot(np.array(ans_emb, dtype=np.float32), qjl.J)))
-                        
-                        similarity = qjl.estimate_similarity(ctx_jl, ans_jl)
-                        
-                        # High similarity means 1-bit vectors align -> answer is grounded
-                        if similarity > 0.6:
-                            logger.info(f"Fast QJL NLI passed: {similarity}")
-                            break # Validated fast path!
-                    except Exception as e:
-                        logger.warning(f"Fast QJL NLI skipped or failed: {e}")
-
-                    # --- SLOW PATH NLI (CrossEncoder / LLM fallback) ---
-                    check = self.guard(context=context, question=question, answer=pred.answer)
-                    
-                    if "false" not in check.is_supported.lower():
-                        break # Validated!
-                        
-                    logger.warning(f"Guardrail flagged hallucination (Attempt {attempts+1}/{max_attempts}). Retrying...")
-                    attempts += 1
-                    
-                    # Strictly instruct it to ground itself
-                    if attempts < max_attempts:
-                        stricter_question = f"{question} (Strictly base your answer ONLY on the context provided. Do not invent information.)"
-                        pred = self.fast_prog(context=context, question=stricter_question)
-                except Exception as e:
-                    logger.error(f"Guardrail check failed: {e}")
-                    break
-                
-            return pred
+            return self._apply_guard(pred, question, context, context_chunks, context_embeddings, context_fidelity)
         else:
             return self.fast_prog(context=context, question=question, chat_history=history_str)
\ No newline at end of file
@@ -59,4 +59,110 @@ ollama_errors = Counter(
     'Ollama API errors',
     ['model', 'error_type'],
     registry=registry
-)
\ No newline at end of file
+)
+
+# --- RETRIEVAL FAN-OUT ---
+retrieval_backend_latency = Histogram(
+    'rag_retrieval_backend_duration_seconds',
+    'Latency of each retrieval backend (vector, bm25, graph)',
+    ['backend'],
+    registry=registry
+)
+
+retrieval_backend_failures = Counter(
+    'rag_retrieval_backend_failures_total',
+    'Retrieval backends that timed out or failed (results fused without them)',
+    ['backend', 'reason'],
+    registry=registry
+)
+
+# --- PIPELINE CACHES ---
+stage_cache_requests = Counter(
+    'rag_stage_cache_requests_total',
+    'Lookups in the per-stage caches (route, rewrite, candidates, answer)',
+    ['stage', 'result'],
+    registry=registry
+)
+
+# --- CRAG GRADING ---
+crag_grading_latency = Histogram(
+    'rag_crag_grading_duration_seconds',
+    'Time to grade the retrieved chunks for relevance',
+    ['mode'],
+    registry=registry
+)
+
+crag_grading_agreement = Gauge(
+    'rag_crag_grading_agreement',
+    'Share of chunks on which two grading modes agree (last comparison)',
+    ['pair'],
+    registry=registry
+)
+
+# --- HALLUCINATION GUARD ---
+guard_checks = Counter(
+    'rag_guard_checks_total',
+    'Local guard verdicts (supported True/False, None = escalated to the LLM guard)',
+    ['method', 'verdict'],
+    registry=registry
+)
+
+# --- STREAMED GENERATION ---
+time_to_first_token = Histogram(
+    'rag_time_to_first_token_seconds',
+    'Request start to the first answer token sent to the client',
+    ['mode'],
+    registry=registry
+)
+
+generation_cancelled = Counter(
+    'rag_generation_cancelled_total',
+    'Streamed generations stopped because the client went away',
+    registry=registry
+)
+
+# --- SPECULATIVE RETRIEVAL ---
+speculative_retrieval = Counter(
+    'rag_speculative_retrieval_total',
+    'Retrieval started on the raw question during routing / rewriting (hit: reused, miss: cancelled)',
+    ['result'],
+    registry=registry
+)
+
+# --- ADAPTIVE ROUTING ---
+routing_decisions = Counter(
+    'rag_routing_decisions_total',
+    'Adaptive routing decisions by router (local embedding router or LLM) and route',
+    ['source', 'route'],
+    registry=registry
+)
+
+routing_latency = Histogram(
+    'rag_routing_duration_seconds',
+    'Time to choose a route (local includes the query embedding)',
+    ['source'],
+    buckets=(.0005, .001, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10),
+    registry=registry
+)
+
+# --- CONTEXT COMPRESSION ---
+context_tokens = Histogram(
+    'rag_context_tokens',
+    'Context tokens handed to generation, before and after compression',
+    ['stage'],
+    buckets=(64, 128, 256, 512, 1024, 2048, 4096, 8192, 16384),
+    registry=registry
+)
+
+prompt_eval_latency = Histogram(
+    'rag_prompt_eval_duration_seconds',
+    'Ollama prompt evaluation time of streamed generations',
+    ['compressed'],
+    registry=registry
+)
+
+prompt_eval_saved = Histogram(
+    'rag_prompt_eval_saved_seconds',
+    'Estimated prompt evaluation time saved by compression (measured s/token x tokens removed)',
+    registry=registry
+)
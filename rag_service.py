@@ -2,24 +2,39 @@ import time
 import logging
 import json
 import asyncio
+import random
+import threading
 import chromadb
-from typing import List
+import importlib.util
+import numpy as np
+from typing import Dict, List, Tuple
 import os
+from concurrent.futures import ThreadPoolExecutor
 
 # --- IMPORTS ---
 from config import settings
 from core.security import SecurityValidator
 from dspy_module import RAGModule 
-from core.retrievers import PersistedBM25Retriever, reciprocal_rank_fusion
+from core.retrievers import PersistedBM25Retriever
+from core.fusion import fuse, hybrid_weights
 from schemas import QueryInput, AnswerResponse 
 from core.circuit_breaker import CircuitBreaker, CircuitBreakerOpenException 
+from core.fanout import fan_out
+from core.speculation import Speculation
+from core.routing import EmbeddingRouter, RoutingLog
+from core.compression import ContextCompressor, lazy_token_counter
+from core.cache.semantic import SemanticCache
+from core.cache.stage import StageCache, history_key, normalize_query
+from services.reranker import RerankerService
+from services.llm_stream import OllamaChatStreamer
+from observability.metrics import (
+    retrieval_backend_latency, retrieval_backend_failures, time_to_first_token, generation_cancelled, generation_tokens,
+    routing_decisions, routing_latency, context_tokens, prompt_eval_latency, prompt_eval_saved
+)
 
-# Lazy Load CrossEncoder (Heavy Model)
-try:
-    from sentence_transformers import CrossEncoder
-    HAS_CROSS_ENCODER = True
-except ImportError:
-    HAS_CROSS_ENCODER = False
+# CrossEncoder is a heavy import: only check it is installed, load_cross_encoder imports it when used
+HAS_CROSS_ENCODER = importlib.util.find_spec("sentence_transformers") is not None
+from services.onnx_backend import load_cross_encoder, load_sentence_encoder
 
 logger = logging.getLogger(__name__)
 
@@ -35,6 +50,7 @@ class RAGService:
         # 2. Load Vector Search (Chroma)
         self.chroma_client = chromadb.PersistentClient(path=settings.CHROMADB_PATH)
         from services.quantized_chroma import QuantizedChromaAdapter, OllamaEmbeddingFunction
+        from services.embedding_client import EmbeddingMicroBatcher
         ef = OllamaEmbeddingFunction(
             model_name=getattr(settings, "OLLAMA_EMBEDDING_MODEL", "nomic-embed-text"),
             base_url=getattr(settings, "OLLAMA_URL", "http://localhost:11434")
@@ -44,20 +60,152 @@ class RAGService:
         )
         raw_collection._embedding_function = ef
         self.collection = QuantizedChromaAdapter(raw_collection, dim=768)
+        # Concurrent /query requests share batched embed calls
+        self.query_embedder = EmbeddingMicroBatcher(
+            ef.acall,
+            window_ms=getattr(settings, "EMBED_BATCH_WINDOW_MS", 3.0),
+            max_batch_size=getattr(settings, "EMBED_MAX_BATCH_SIZE", 32)
+        )
         self.circuit_breaker = CircuitBreaker(failure_threshold=5, recovery_timeout=60)
+        # Answer tokens straight from Ollama for the SSE stream (same model and sampling as the DSPy LM)
+        self.llm_streamer = OllamaChatStreamer(
+            settings.OLLAMA_LLM_MODEL,
+            base_url=settings.OLLAMA_URL,
+            options={"temperature": 0.1, "num_ctx": 4096}
+        )
+
+        # Local router for adaptive mode; LLM routing decisions are logged to train it (train_router.py)
+        self.routing_log = RoutingLog(settings.ROUTER_LOG_PATH)
+        self.local_router = self._load_router()
+
+        # Exact-match caches for the route, rewrite and retrieval stages, scoped to the corpus generation
+        self.route_cache = StageCache("route", settings.STAGE_CACHE_MAX_ENTRIES, settings.CACHE_TTL)
+        self.rewrite_cache = StageCache("rewrite", settings.STAGE_CACHE_MAX_ENTRIES, settings.CACHE_TTL)
+        self.candidate_cache = StageCache("candidates", settings.STAGE_CACHE_MAX_ENTRIES, settings.CACHE_TTL)
+
+        # Answers for questions close to one already answered against the same corpus
+        self.answer_cache = None
+        if settings.SEMANTIC_CACHE_ENABLED:
+            self.answer_cache = SemanticCache(
+                dim=768,
+                threshold=settings.SEMANTIC_CACHE_THRESHOLD,
+                max_entries=settings.SEMANTIC_CACHE_MAX_ENTRIES,
+                ttl=settings.CACHE_TTL,
+                policy=settings.SEMANTIC_CACHE_POLICY,
+                redis_url=settings.REDIS_URL if settings.SEMANTIC_CACHE_BACKEND == "redis" else None,
+                bits=settings.SEMANTIC_CACHE_BITS,
+                rotation=settings.POLARQUANT_ROTATION
+            )
 
         # 3. Load Re-ranker (The "Deep Think" judge)
         self.cross_encoder = None
-        if HAS_CROSS_ENCODER:
-            logger.info("Loading Cross-Encoder for precision re-ranking...")
+        if HAS_CROSS_ENCODER or settings.INFERENCE_BACKEND != "torch":
+            logger.info(f"Loading Cross-Encoder for precision re-ranking ({settings.INFERENCE_BACKEND})...")
             try:
                 # 'ms-marco-MiniLM-L-6-v2' is fast and effective for re-ranking
-                self.cross_encoder = CrossEncoder('cross-encoder/ms-marco-MiniLM-L-6-v2')
+                self.cross_encoder = load_cross_encoder(
+                    'cross-encoder/ms-marco-MiniLM-L-6-v2',
+                    backend=settings.INFERENCE_BACKEND,
+                    **self._onnx_options()
+                )
             except Exception as e:
                 logger.error(f"Failed to load CrossEncoder: {e}")
                 self.cross_encoder = None
         else:
             logger.warning("CrossEncoder not found. Install sentence-transformers for better accuracy.")
+        # Concurrent requests share length-bucketed batches on one dedicated reranker thread
+        self.reranker = None
+        if self.cross_encoder:
+            self.reranker = RerankerService(
+                self.cross_encoder,
+                batch_size=settings.RERANK_BATCH_SIZE,
+                window_ms=settings.RERANK_BATCH_WINDOW_MS,
+                num_threads=settings.RERANK_THREADS
+            )
+
+        # 4. Context compression (query-relevant sentences within a token budget)
+        self.compressor = self._load_compressor()
+
+        # Shadow grading comparisons: one at a time on their own thread; samples arriving
+        # while one runs are dropped rather than queued behind it
+        self._shadow_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="grading-shadow")
+        self._shadow_slot = threading.Semaphore(1)
+
+    def _shadow_compare(self, question: str, docs: List[str], scores):
+        """Start a background compare_grading run unless one is still in flight"""
+        if not self._shadow_slot.acquire(blocking=False):
+            return
+        future = self._shadow_executor.submit(self.rag_module.compare_grading, question, docs, scores)
+
+        def done(f):
+            self._shadow_slot.release()
+            if f.exception() is not None:
+                logger.warning(f"Shadow grading comparison failed: {f.exception()}")
+        future.add_done_callback(done)
+
+    @staticmethod
+    def _load_router():
+        if not settings.LOCAL_ROUTER_ENABLED or not os.path.exists(settings.ROUTER_MODEL_PATH):
+            return None
+        try:
+            router = EmbeddingRouter.load(settings.ROUTER_MODEL_PATH)
+        except Exception as e:
+            logger.warning(f"Failed to load local router: {e}")
+            return None
+        if router.embedding_model != settings.OLLAMA_EMBEDDING_MODEL or not router.ready:
+            logger.warning(f"Local router at {settings.ROUTER_MODEL_PATH} does not match {settings.OLLAMA_EMBEDDING_MODEL}; retrain it")
+            return None
+        logger.info(f"Loaded local router ({dict(zip(router.routes, router.counts))} training queries)")
+        return router
+
+    async def _route(self, question: str, query_embedding: List[float] = None) -> str:
+        """Local embedding router first; the LLM router only when it is not confident enough"""
+        start = time.perf_counter()
+        if self.local_router:
+            try:
+                if query_embedding is None:
+                    query_embedding = await self.query_embedder.embed(question)
+                route, confidence = self.local_router.predict(query_embedding)
+                if confidence >= settings.ROUTER_CONFIDENCE_THRESHOLD:
+                    routing_latency.labels(source="local").observe(time.perf_counter() - start)
+                    routing_decisions.labels(source="local", route=route).inc()
+                    return route
+                logger.info(f"Local router unsure ({route}, {confidence:.2f}); asking the LLM router")
+            except Exception as e:
+                logger.warning(f"Local routing failed: {e}")
+
+        route = await asyncio.get_running_loop().run_in_executor(None, self.rag_module.classify_route, question)
+        routing_latency.labels(source="llm").observe(time.perf_counter() - start)
+        if route is None:
+            return "deep"
+        routing_decisions.labels(source="llm", route=route).inc()
+        self.routing_log.append(question, route)
+        return route
+
+    def _load_compressor(self):
+        """Extractive compressor on the chunking sentence encoder; None when disabled or unavailable"""
+        if not settings.ENABLE_CONTEXT_COMPRESSION:
+            return None
+        try:
+            encoder = load_sentence_encoder('all-MiniLM-L6-v2', backend=settings.INFERENCE_BACKEND, **self._onnx_options())
+        except Exception as e:
+            logger.warning(f"Context compression disabled, no sentence encoder: {e}")
+            return None
+        return ContextCompressor(
+            encoder,
+            # Loaded by the first compression (in the executor), not while the service starts
+            lazy_token_counter(settings.COMPRESSION_TOKENIZER, getattr(encoder, "tokenizer", None)),
+            ratio=settings.CONTEXT_COMPRESSION_RATIO,
+            max_tokens=settings.MAX_CONTEXT_LENGTH,
+            min_tokens=settings.CONTEXT_COMPRESSION_MIN_TOKENS,
+            dedup_threshold=settings.CONTEXT_DEDUP_THRESHOLD
+        )
+
+    @staticmethod
+    def _onnx_options() -> dict:
+        if settings.INFERENCE_BACKEND == "torch":
+            return {}
+        return {"cache_dir": settings.ONNX_CACHE_DIR, "num_threads": settings.ONNX_THREADS}
 
     async def list_documents(self) -> List[str]:
         """
@@ -94,10 +242,10 @@ class RAGService:
                 logger.warning(f"No chunks found in Chroma for {filename}")
 
             # --- 2. BM25 Deletion ---
-            # Note: BM25 is usually append-only for speed. 
-            # Complete rebuild is safest for deletion, but slow.
-            # For now, we accept it might stay in BM25 until next rebuild.
-            # Or you can trigger a rebuild here if the corpus is small.
+            # Tombstones the source's chunks (compaction runs in the background)
+            loop = asyncio.get_running_loop()
+            removed = await loop.run_in_executor(None, lambda: self.bm25.delete_documents(source=filename))
+            logger.info(f"Removed {removed} chunks from BM25.")
             
             # --- 3. Physical File Deletion ---
             # If you save files to a folder, delete them here.
@@ -114,10 +262,11 @@ class RAGService:
 
     async def answer_question(self, input_data: QueryInput) -> AnswerResponse:
         """
-        Non-streaming wrapper for the streaming logic.
+        Non-streaming wrapper for the streaming logic. The answer comes from the
+        DSPy program (compiled demos, deep-mode rationale), never the token stream.
         """
         response_data = {}
-        async for chunk in self.answer_question_stream(input_data):
+        async for chunk in self.answer_question_stream(input_data, stream_tokens=False):
             if chunk.startswith("data: "):
                 data = json.loads(chunk.replace("data: ", ""))
                 if data.get("type") == "result":
@@ -133,9 +282,136 @@ class RAGService:
             thoughts=response_data.get("thoughts")
         )
 
-    async def answer_question_stream(self, input_data: QueryInput):
+    @staticmethod
+    def _record_prompt_eval(stats: dict, compression=None):
+        """Prompt-eval time from Ollama's final chunk; with compression, the time saved at the measured per-token rate"""
+        count, duration = stats.get("prompt_eval_count"), stats.get("prompt_eval_duration")
+        if not count or not duration:
+            return
+        seconds = duration / 1e9
+        stats["prompt_eval_ms"] = round(seconds * 1000, 1)
+        prompt_eval_latency.labels(compressed=str(compression is not None)).observe(seconds)
+        if compression is not None and compression.tokens_before > compression.tokens_after:
+            saved = seconds / count * (compression.tokens_before - compression.tokens_after)
+            stats["prompt_eval_saved_ms"] = round(saved * 1000, 1)
+            prompt_eval_saved.observe(saved)
+
+    def _record_backends(self, retrieval: dict):
+        for name, result in retrieval.items():
+            retrieval_backend_latency.labels(backend=name).observe(result.elapsed)
+            if result.status != "ok":
+                retrieval_backend_failures.labels(backend=name, reason=result.status).inc()
+
+    async def _retrieve_candidates(self, query: str, top_k: int, corpus_version: str,
+                                   query_embedding: List[float] = None) -> Tuple[List[str], Dict[str, np.ndarray]]:
+        """
+        Hybrid candidates for re-ranking: vector and keyword search run concurrently, each
+        under its own timeout (a slow or failed backend drops out and the rest still fuse),
+        then fusion and one batch fetch of the winning chunks
+        -> (chunks, chunk -> stored embedding), the embeddings decoded from the fetched codes
+        """
+        # Fused, fetched candidates of a repeated search skip vector / keyword retrieval entirely
+        candidate_key = (normalize_query(query), top_k)
+        cached = self.candidate_cache.get(candidate_key, corpus_version)
+        if cached is not None:
+            docs, embeddings = cached
+            return list(docs), embeddings
+
+        # Each backend over-fetches so fusion has candidates to filter
+        search_k = top_k * settings.RETRIEVAL_CANDIDATE_FACTOR
+        retrieval = await fan_out({
+            "vector": self._vector_search(query, search_k, query_embedding),
+            "bm25": self._keyword_search(query, search_k),
+        }, timeouts={
+            "vector": settings.VECTOR_SEARCH_TIMEOUT,
+            "bm25": settings.BM25_SEARCH_TIMEOUT,
+        })
+        self._record_backends(retrieval)
+
+        # Fusion (RRF or normalized scores), weighted by HYBRID_SEARCH_ALPHA.
+        # Only the top_k * FUSION_CANDIDATE_FACTOR ids are selected and fetched for re-ranking
+        fused = fuse(
+            {"vector": retrieval["vector"].value, "bm25": retrieval["bm25"].value},
+            weights=hybrid_weights(settings.HYBRID_SEARCH_ALPHA),
+            method=settings.FUSION_METHOD,
+            k=settings.RRF_K,
+            top_n=top_k * settings.FUSION_CANDIDATE_FACTOR
+        )
+        top_ids = [doc_id for doc_id, _ in fused]
+
+        # Fetch content for the winning IDs
+        docs, embeddings = [], {}
+        if top_ids:
+            def fetch():
+                # Batch fetch is faster than one-by-one
+                res = self.collection.get(ids=top_ids, include=["documents", "metadatas"])
+                try:
+                    # Kept for the deep-mode guard, which would otherwise re-embed every chunk
+                    stored = self.collection.stored_embeddings(res.get('metadatas') or [])
+                except Exception as e:
+                    logger.warning(f"Stored embeddings unavailable, the guard will embed the context: {e}")
+                    stored = []
+                return res, stored
+
+            fetch_res, stored = await asyncio.get_running_loop().run_in_executor(None, fetch)
+            # Map IDs to Documents
+            doc_map = {id: doc for id, doc in zip(fetch_res['ids'], fetch_res['documents'])}
+            # Preserve fusion order
+            docs = [doc_map[id] for id in top_ids if id in doc_map]
+            embeddings = {doc: vec for doc, vec in zip(fetch_res['documents'], stored) if vec is not None}
+        # Partial results (a backend timed out or failed) are not worth remembering
+        if retrieval["vector"].status == "ok" and retrieval["bm25"].status == "ok":
+            self.candidate_cache.set(candidate_key, corpus_version, (tuple(docs), embeddings))
+        return docs, embeddings
+
+    async def _vector_search(self, query: str, k: int, query_embedding: List[float] = None) -> List[tuple]:
+        """Vector candidates as (id, similarity); the query embedding goes through the cross-request micro-batcher"""
+        loop = asyncio.get_running_loop()
+        if query_embedding is None:
+            query_embedding = await self.query_embedder.embed(query)
+        results = await loop.run_in_executor(None, lambda: self.collection.query(query_embeddings=[query_embedding], n_results=k))
+        if not results['ids']:
+            return []
+        distances = (results.get('distances') or [[]])[0] or [0.0] * len(results['ids'][0])
+        return [(id, 1.0 - dist) for id, dist in zip(results['ids'][0], distances)]
+
+    async def _keyword_search(self, query: str, k: int) -> List[tuple]:
+        """BM25 candidates as (id, score)"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, lambda: self.bm25.retrieve(query, top_k=k))
+
+    async def _graph_search(self, query: str) -> List[str]:
+        """Relationship sentences from the knowledge graph around the query's first keyword"""
+        from neo4j import GraphDatabase
+        uri = getattr(settings, "NEO4J_URI", None) or "bolt://localhost:7687"
+        user = getattr(settings, "NEO4J_USER", None) or "neo4j"
+        password = getattr(settings, "NEO4J_PASSWORD", None) or "password"
+
+        def run_cypher():
+            driver = GraphDatabase.driver(uri, auth=(user, password))
+            try:
+                with driver.session() as session:
+                    keywords = [kw.lower() for kw in query.split() if len(kw) > 3]
+                    if keywords:
+                        anchor = keywords[0]
+                        res = session.run(
+                            "MATCH p=(n:Entity)-[r:RELATES_TO*1..2]-(m) "
+                            "WHERE toLower(n.id) CONTAINS $anchor "
+                            "RETURN n.id as src, type(r[0]) as edge, m.id as tgt LIMIT 50",
+                            anchor=anchor
+                        )
+                    else:
+                        res = session.run("MATCH p=(n:Entity)-[r:RELATES_TO*1..2]-(m) RETURN n.id as src, type(r[0]) as edge, m.id as tgt LIMIT 50")
+                    return [f"{rec['src']} {rec['edge']} {rec['tgt']}" for rec in res]
+            finally:
+                driver.close()
+
+        return await asyncio.get_running_loop().run_in_executor(None, run_cypher)
+
+    async def answer_question_stream(self, input_data: QueryInput, stream_tokens: bool = True):
         """
         The Core Logic: Hybrid Search -> RRF -> Rerank -> DSPy Generate -> Guardrail
+        With stream_tokens, STREAM_MODES answers are streamed from Ollama as 'token' events.
         """
         start_time = time.time()
         
@@ -143,40 +419,88 @@ class RAGService:
         yield f"data: {json.dumps({'type': 'status', 'content': 'Searching Knowledge Base...'})}\n\n"
         await asyncio.sleep(0.01) # Yield to event loop
 
+        speculation = None
         try:
-            # 1. Security Checkraw_query = await self.security.sanitize_query(input_data.question)
+            loop = asyncio.get_running_loop()
+            # Bumped by every index / delete, so all caches below drop stale entries on their own
+            corpus_version = str(self.bm25.generation)
+            # 1. Security Check
             raw_query = await self.security.sanitize_query(input_data.question)
+
+            # 1.2. Semantic answer cache (stateless questions only: history changes the answer)
+            query_embedding = None
+            cache_version = None
+            cached = None
+            if self.answer_cache and not input_data.chat_history:
+                try:
+                    query_embedding = await self.query_embedder.embed(raw_query)
+                    # Any index change invalidates every entry; the request shape only picks the scope
+                    cache_version = corpus_version
+                    cache_scope = f"{input_data.mode}:{input_data.top_k}"
+                    cached = await self.answer_cache.get(query_embedding, cache_version, cache_scope)
+                except Exception as e:
+                    logger.warning(f"Semantic cache lookup failed: {e}")
+                    query_embedding, cache_version = None, None
+                if cached:
+                    payload, similarity = cached
+                    payload = {**payload, 'processing_time': time.time() - start_time}
+                    # Timings stored with the answer belong to the request that generated it
+                    metadata = {k: v for k, v in payload.get('metadata', {}).items() if k not in ('ttft', 'generation')}
+                    payload['metadata'] = {**metadata, 'cache': 'semantic', 'cache_similarity': round(similarity, 4)}
+                    yield f"data: {json.dumps(payload)}\n\n"
+                    return
+
+            # 1.3. Speculative retrieval: routing and rewriting are LLM round-trips, so candidates
+            # for the raw question are fetched meanwhile and reused if the final query barely changes
+            if settings.SPECULATIVE_RETRIEVAL and (input_data.mode == "adaptive" or input_data.chat_history):
+                speculation = Speculation(
+                    raw_query,
+                    self._retrieve_candidates(raw_query, input_data.top_k, corpus_version, query_embedding),
+                    threshold=settings.SPECULATION_SIMILARITY
+                )
+
             # --- STEP 1: CONTEXTUALIZE (REWRITE) ---
             search_query = raw_query
             
+            # Only rewrite if we actually have history. Routing classifies the raw question, so the
+            # rewrite is started first and runs concurrently with the router
+            rewrite = None
+            if input_data.chat_history:
+                # Format last 3 turns for context (prevent token overflow)
+                recent_history = input_data.chat_history[-3:]
+                history_str = "\n".join([f"{msg.role}: {msg.content}" for msg in recent_history])
+                
+                # DSPy Rewrite
+                rewrite_key = (normalize_query(raw_query), history_key(f"{msg.role}: {msg.content}" for msg in recent_history))
+                cached_rewrite = self.rewrite_cache.get(rewrite_key, corpus_version)
+                if cached_rewrite is None:
+                    rewrite = loop.run_in_executor(
+                        None, 
+                        self.rag_module.rewrite_query, 
+                        raw_query, 
+                        history_str
+                    )
+            
             # 1.5. Router (Adaptive Mode)
             actual_mode = input_data.mode
             if actual_mode == "adaptive":
                 yield f"data: {json.dumps({'type': 'status', 'content': 'Routing Query...'})}\n\n"
                 
-                # DSPy router
-                actual_mode = await loop.run_in_executor(
-                    None,
-                    self.rag_module.route_query,
-                    search_query
-                )
+                # Local embedding router, DSPy router when it is unsure
+                route_key = normalize_query(raw_query)
+                actual_mode = self.route_cache.get(route_key, corpus_version)
+                if actual_mode is None:
+                    actual_mode = await self._route(raw_query, query_embedding)
+                    self.route_cache.set(route_key, corpus_version, actual_mode)
                 yield f"data: {json.dumps({'type': 'status', 'content': f'Route chosen: {actual_mode.upper()}'})}\n\n"
             
-            # Only rewrite if we actually have history
             if input_data.chat_history:
                 yield f"data: {json.dumps({'type': 'status', 'content': 'Connecting Memory...'})}\n\n"
-                
-                # Format last 3 turns for context (prevent token overflow)
-                recent_history = input_data.chat_history[-3:]
-                history_str = "\n".join([f"{msg.role}: {msg.content}" for msg in recent_history])
-                
-                # DSPy Rewrite
-                search_query = await loop.run_in_executor(
-                    None, 
-                    self.rag_module.rewrite_query, 
-                    raw_query, 
-                    history_str
-                )
+                if rewrite is None:
+                    search_query = cached_rewrite
+                else:
+                    search_query = await rewrite
+                    self.rewrite_cache.set(rewrite_key, corpus_version, search_query)
                 
                 # Log the logic for debugging/UI
                 logger.info(f"Rewrote '{raw_query}' to '{search_query}'")
@@ -189,86 +513,54 @@ class RAGService:
                 yield f"data: {json.dumps({'type': 'action_required', 'content': f'Agentic Mode engaged. Preparing to use external tools for: {search_query}'})}\n\n"
                 await asyncio.sleep(1.0) # Simulate a brief pause
             
-            # 2. Hybrid Retrieval (Fetch 3x candidates to allow effective filtering)
-            search_k = input_data.top_k * 20
-            
-            loop = asyncio.get_running_loop()
-            
             # --- PHASE 8: GRAPH RAG RETRIEVAL ---
-            graph_docs = []
-            if actual_mode == "graph" and getattr(settings, "ENABLE_GRAPH_RAG", False):
+            use_graph = actual_mode == "graph" and getattr(settings, "ENABLE_GRAPH_RAG", False)
+            if use_graph:
                 yield f"data: {json.dumps({'type': 'status', 'content': 'Querying Knowledge Graph...'})}\n\n"
-                try:
-                    from neo4j import GraphDatabase
-                    uri = getattr(settings, "NEO4J_URI", None) or "bolt://localhost:7687"
-                    user = getattr(settings, "NEO4J_USER", None) or "neo4j"
-                    password = getattr(settings, "NEO4J_PASSWORD", None) or "password"
-                    driver = GraphDatabase.driver(uri, auth=(user, password))
-                    
-                    def run_cypher():
-                        with driver.session() as session:
-                            keywords = [kw.lower() for kw in search_query.split() if len(kw) > 3]
-                            if keywords:
-                                anchor = keywords[0]
-                                res = session.run(
-                                    "MATCH p=(n:Entity)-[r:RELATES_TO*1..2]-(m) "
-                                    "WHERE toLower(n.id) CONTAINS $anchor "
-                                    "RETURN n.id as src, type(r[0]) as edge, m.id as tgt LIMIT 50",
-                                    anchor=anchor
-                                )
-                            else:
-                                res = session.run("MATCH p=(n:Entity)-[r:RELATES_TO*1..2]-(m) RETURN n.id as src, type(r[0]) as edge, m.id as tgt LIMIT 50")
-                            return [f"{rec['src']} {rec['edge']} {rec['tgt']}" for rec in res]
-                            
-                    graph_docs = await loop.run_in_executor(None, run_cypher)
-                    driver.close()
-                    if graph_docs:
-                        yield f"data: {json.dumps({'type': 'status', 'content': f'Found {len(graph_docs)} graph relationships.'})}\n\n"
-                except ImportError:
-                    logger.warning("neo4j driver not installed.")
-                except Exception as e:
-                    logger.warning(f"Graph retrieval failed: {e}")
-            # ------------------------------------
-
-            # A. Vector Search
-            results = await loop.run_in_executor(None, lambda: self.collection.query(query_texts=[search_query], n_results=search_k))
-            vector_cands = []
-            if results['ids']:
-                for id, doc in zip(results['ids'][0], results['documents'][0]):
-                    vector_cands.append((id, 1.0)) # Score 1.0 is placeholder; RRF handles ranking
-
-            # B. Keyword Search (BM25)
-            # This uses the file-locking retriever we fixed earlier
-            keyword_cands = await loop.run_in_executor(
-                None, 
-                lambda: self.bm25.retrieve(search_query, top_k=search_k)
-            )
-            
-            # C. Fusion (Reciprocal Rank Fusion)
-            # This mathematically combines the two lists so neither dominates
-            fused = reciprocal_rank_fusion(vector_cands, keyword_cands)
-            top_ids = [k[0] for k in fused[:input_data.top_k * 3]] # Keep top 2x for re-ranking
-            
-            # Fetch content for the winning IDs
-            final_docs = []
-            if top_ids:
-                # Batch fetch is faster than one-by-one
-                fetch_res = await loop.run_in_executor(None, lambda: self.collection.get(ids=top_ids))
-                # Map IDs to Documents
-                doc_map = {id: doc for id, doc in zip(fetch_res['ids'], fetch_res['documents'])}
-                # Preserve RRF order
-                final_docs = [doc_map[id] for id in top_ids if id in doc_map]
+
+            # 2. Hybrid Retrieval: the speculative candidates when the search query stayed (nearly) the raw
+            # question, otherwise a fresh search; graph search runs alongside under its own timeout
+            async def hybrid_candidates():
+                candidates = await speculation.resolve(search_query) if speculation else None
+                if candidates is None:
+                    candidates = await self._retrieve_candidates(
+                        search_query, input_data.top_k, corpus_version,
+                        query_embedding if search_query == raw_query else None
+                    )
+                return candidates
+
+            async def graph_search():
+                if not use_graph:
+                    return []
+                retrieval = await fan_out({"graph": self._graph_search(search_query)},
+                                          timeouts={"graph": settings.GRAPH_SEARCH_TIMEOUT})
+                self._record_backends(retrieval)
+                return retrieval["graph"].value
+
+            (final_docs, chunk_embeddings), graph_docs = await asyncio.gather(hybrid_candidates(), graph_search())
+            if graph_docs:
+                yield f"data: {json.dumps({'type': 'status', 'content': f'Found {len(graph_docs)} graph relationships.'})}\n\n"
 
             yield f"data: {json.dumps({'type': 'status', 'content': f'Found {len(final_docs)} candidates...'})}\n\n"
 
             # PHASE 7: CORRECTIVE RAG (CRAG)
             yield f"data: {json.dumps({'type': 'status', 'content': 'Evaluating context relevance...'})}\n\n"
+            # Cross-encoder scores are computed once and shared by CRAG grading and re-ranking
+            ce_scores = {}
+            grading_mode = settings.CRAG_GRADING_MODE
+            if self.cross_encoder and final_docs and (grading_mode == "cross_encoder" or settings.CRAG_COMPARE_SAMPLE_RATE > 0):
+                scores = await self.reranker.score(search_query, final_docs)
+                ce_scores = dict(zip(final_docs, scores))
+            elif grading_mode == "cross_encoder":
+                grading_mode = "batch"
+            grade_scores = [ce_scores[doc] for doc in final_docs] if ce_scores else None
             relevant_docs = await loop.run_in_executor(
                 None, 
-                self.rag_module.evaluate_context, 
-                search_query, 
-                final_docs
+                lambda: self.rag_module.evaluate_context(search_query, final_docs, grading_mode, grade_scores)
             )
+            if final_docs and random.random() < settings.CRAG_COMPARE_SAMPLE_RATE:
+                # Shadow comparison of every grading mode; results go to the grading metrics
+                self._shadow_compare(search_query, list(final_docs), grade_scores)
             
             if not relevant_docs and final_docs:
                 yield f"data: {json.dumps({'type': 'status', 'content': 'Context irrelevant. Querying Web...'})}\n\n"
@@ -291,8 +583,11 @@ class RAGService:
             # 3. Re-Ranking (The Quality Filter)
             if self.cross_encoder and final_docs:
                 yield f"data: {json.dumps({'type': 'status', 'content': 'Re-ranking results...'})}\n\n"
-                pairs = [[search_query, doc] for doc in final_docs]
-                scores = await loop.run_in_executor(None, lambda: self.cross_encoder.predict(pairs))
+                missing = [doc for doc in final_docs if doc not in ce_scores]
+                if missing:
+                    new_scores = await self.reranker.score(search_query, missing)
+                    ce_scores.update(zip(missing, new_scores))
+                scores = [ce_scores[doc] for doc in final_docs]
                 scored_docs = sorted(zip(final_docs, scores), key=lambda x: x[1], reverse=True)
                 filtered_docs = [doc for doc, score in scored_docs if score > -10.0]
                 if not filtered_docs and final_docs:
@@ -307,6 +602,20 @@ class RAGService:
             if final_docs:
                 yield f"data: {json.dumps({'type': 'status', 'content': f'Retained {len(final_docs)} highly relevant chunk(s).'})}\n\n"
 
+            # 3.5. Context Compression: the sources stay whole, the prompt gets only what the question needs
+            context_docs = final_docs
+            compression = None
+            if self.compressor and final_docs:
+                try:
+                    compression = await loop.run_in_executor(None, self.compressor.compress, search_query, final_docs)
+                    context_docs = compression.chunks or final_docs
+                    context_tokens.labels(stage="before").observe(compression.tokens_before)
+                    context_tokens.labels(stage="after").observe(compression.tokens_after)
+                    if compression.tokens_after < compression.tokens_before:
+                        yield f"data: {json.dumps({'type': 'status', 'content': f'Compressed context to {compression.tokens_after}/{compression.tokens_before} tokens.'})}\n\n"
+                except Exception as e:
+                    logger.warning(f"Context compression failed: {e}")
+
             # 4. DSPy Generation
             yield f"data: {json.dumps({'type': 'status', 'content': 'Generating Answer...'})}\n\n"
             
@@ -314,22 +623,76 @@ class RAGService:
             thoughts = None
             sources = []
 
+            first_token_at = None
+            generation_stats = {}
+
             if final_docs:
+                context = "\n---\n".join(context_docs)
+                history = history_str if 'history_str' in locals() else ""
+                # Stored embeddings of the retained chunks (graph / web results have none)
+                context_embeddings = [chunk_embeddings[doc] for doc in final_docs if doc in chunk_embeddings] or None
+                # They are PolarQuant reconstructions; the guard corrects its similarity for that
+                context_fidelity = self.collection.polar.fidelity
                 try:
-                    @self.circuit_breaker
-                    def safe_generate():
-                        return self.rag_module.forward(
-                            question=search_query, 
-                            context="\n---\n".join(final_docs), 
-                            history_str=history_str if 'history_str' in locals() else "",
-                            mode=actual_mode
+                    if stream_tokens and settings.STREAM_GENERATION and actual_mode in settings.STREAM_MODES:
+                        # Tokens are forwarded as Ollama produces them; the result event below is unchanged
+                        self.circuit_breaker.before_call()
+                        parts = []
+                        tokens = self.llm_streamer.stream(
+                            self.rag_module.chat_messages(search_query, context, history, actual_mode),
+                            stats=generation_stats
                         )
-                    # --- FIX: Only run this once. Remove the duplicated self.rag_module() below ---
-                    prediction = await loop.run_in_executor(None, safe_generate)
-                    answer = prediction.answer
-                    
-                    if actual_mode == "deep" and hasattr(prediction, 'rationale'):
-                        thoughts = prediction.rationale
+                        try:
+                            async for token in tokens:
+                                if first_token_at is None:
+                                    first_token_at = time.time()
+                                    time_to_first_token.labels(mode=actual_mode).observe(first_token_at - start_time)
+                                parts.append(token)
+                                yield f"data: {json.dumps({'type': 'token', 'content': token})}\n\n"
+                        except (GeneratorExit, asyncio.CancelledError):
+                            # Client went away: closing the token stream drops the Ollama connection
+                            generation_cancelled.inc()
+                            raise
+                        except Exception:
+                            self.circuit_breaker.record_failure()
+                            raise
+                        finally:
+                            await tokens.aclose()
+                        self.circuit_breaker.record_success()
+                        generation_tokens.inc(len(parts))
+                        self._record_prompt_eval(generation_stats, compression)
+                        answer = "".join(parts).strip()
+
+                        if actual_mode == "deep":
+                            # Guard runs on the finished answer; a flagged one is regenerated and replaces it
+                            yield f"data: {json.dumps({'type': 'status', 'content': 'Verifying answer against sources...'})}\n\n"
+                            streamed = answer
+                            prediction = await loop.run_in_executor(
+                                None,
+                                lambda: self.rag_module.guard_answer(search_query, context, streamed, context_docs,
+                                                                     context_embeddings, context_fidelity)
+                            )
+                            answer = prediction.answer
+                            if answer != streamed:
+                                yield f"data: {json.dumps({'type': 'status', 'content': 'Answer revised by the grounding check.'})}\n\n"
+                    else:
+                        @self.circuit_breaker
+                        def safe_generate():
+                            return self.rag_module.forward(
+                                question=search_query, 
+                                context=context, 
+                                history_str=history,
+                                mode=actual_mode,
+                                context_chunks=context_docs,
+                                context_embeddings=context_embeddings,
+                                context_fidelity=context_fidelity
+                            )
+                        # --- FIX: Only run this once. Remove the duplicated self.rag_module() below ---
+                        prediction = await loop.run_in_executor(None, safe_generate)
+                        answer = prediction.answer
+                        
+                        if actual_mode == "deep" and hasattr(prediction, 'rationale'):
+                            thoughts = prediction.rationale
 
                     # Anti-Hallucination check
                     lower_ans = answer.lower()
@@ -356,8 +719,29 @@ class RAGService:
                 'metadata': {'mode': actual_mode},
                 'processing_time': time.time() - start_time
             }
+            if first_token_at is not None:
+                payload['metadata']['ttft'] = round(first_token_at - start_time, 4)
+            if compression is not None:
+                payload['metadata']['compression'] = {
+                    'tokens_before': compression.tokens_before,
+                    'tokens_after': compression.tokens_after,
+                    'sentences_kept': f"{compression.sentences_after}/{compression.sentences_before}",
+                    'duplicates': compression.duplicates,
+                    'ms': round(compression.elapsed * 1000, 1)
+                }
+            if generation_stats.get('prompt_eval_count'):
+                payload['metadata']['generation'] = generation_stats
             yield f"data: {json.dumps(payload)}\n\n"
 
+            if cache_version is not None and sources:
+                try:
+                    await self.answer_cache.set(query_embedding, cache_version, payload, cache_scope)
+                except Exception as e:
+                    logger.warning(f"Semantic cache store failed: {e}")
+
         except Exception as e:
             logger.exception("Error in RAG stream")
-            yield f"data: {json.dumps({'type': 'error', 'answer': 'System Error', 'thoughts': str(e)})}\n\n"
\ No newline at end of file
+            yield f"data: {json.dumps({'type': 'error', 'answer': 'System Error', 'thoughts': str(e)})}\n\n"
+        finally:
+            if speculation:
+                speculation.cancel()
\ No newline at end of file
@@ -0,0 +1,213 @@
+import asyncio
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+from tenacity import Retrying, stop_after_attempt, wait_exponential
+
+logger = logging.getLogger(__name__)
+
+class EmbeddingError(Exception):
+    """Raised when some inputs could not be embedded after retries"""
+    def __init__(self, message: str, failed_indices: List[int] = None):
+        super().__init__(message)
+        self.failed_indices = failed_indices or []
+
+class OllamaEmbeddingClient:
+    """
+    Batched, connection-pooled Ollama embedding client.
+    - Many inputs per request through /api/embed
+    - Keep-alive connections via a shared requests.Session
+    - In-flight requests capped by a bounded worker pool
+    - Failed batches are retried item by item; anything still failing raises EmbeddingError
+    """
+    def __init__(self, model_name: str = "nomic-embed-text", base_url: str = "http://localhost:11434",
+                 batch_size: int = 64, max_concurrency: int = 4, max_retries: int = 3, timeout: float = 60.0):
+        self.model_name = model_name
+        self.base_url = base_url.rstrip("/")
+        self.batch_size = max(1, batch_size)
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_retries = max(1, max_retries)
+        self.timeout = timeout
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.max_concurrency)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self._executor = ThreadPoolExecutor(max_workers=self.max_concurrency, thread_name_prefix="ollama-embed")
+        self._legacy_api = False # Set when the server predates /api/embed
+
+    def _retrying(self) -> Retrying:
+        return Retrying(stop=stop_after_attempt(self.max_retries), wait=wait_exponential(multiplier=0.2, max=2), reraise=True)
+
+    def _post_batch(self, texts: List[str]) -> List[List[float]]:
+        if self._legacy_api:
+            return [self._post_legacy(text) for text in texts]
+        res = self.session.post(
+            f"{self.base_url}/api/embed",
+            json={"model": self.model_name, "input": texts},
+            timeout=self.timeout
+        )
+        if res.status_code == 404 and "model" not in res.text.lower():
+            logger.warning("Ollama /api/embed not available, falling back to /api/embeddings")
+            self._legacy_api = True
+            return self._post_batch(texts)
+        res.raise_for_status()
+        embeddings = res.json().get("embeddings") or []
+        if len(embeddings) != len(texts) or any(not e for e in embeddings):
+            raise EmbeddingError(f"Ollama returned {len(embeddings)} embeddings for {len(texts)} inputs")
+        return embeddings
+
+    def _post_legacy(self, text: str) -> List[float]:
+        res = self.session.post(
+            f"{self.base_url}/api/embeddings",
+            json={"model": self.model_name, "prompt": text},
+            timeout=self.timeout
+        )
+        res.raise_for_status()
+        embedding = res.json().get("embedding")
+        if not embedding:
+            raise EmbeddingError("Ollama returned an empty embedding")
+        return embedding
+
+    def _embed_batch(self, texts: List[str]) -> List[List[float]]:
+        """
+        One batch request; on failure retry each input on its own. Every input gets
+        max_retries single-item attempts, and a single input goes straight to them.
+        """
+        if len(texts) > 1:
+            try:
+                return self._post_batch(texts)
+            except Exception as e:
+                logger.warning(f"Embedding batch of {len(texts)} failed ({e}); retrying per item")
+
+        results, failed = [], []
+        for i, text in enumerate(texts):
+            try:
+                results.append(self._retrying()(self._post_batch, [text])[0])
+            except Exception as item_err:
+                logger.error(f"Ollama Embed Error (item {i}): {item_err}")
+                results.append(None)
+                failed.append(i)
+        if failed:
+            raise EmbeddingError(f"Failed to embed {len(failed)} of {len(texts)} inputs", failed)
+        return results
+
+    def _batches(self, texts: List[str]) -> List[Tuple[int, List[str]]]:
+        return [(start, texts[start:start + self.batch_size]) for start in range(0, len(texts), self.batch_size)]
+
+    @staticmethod
+    def _merge(n: int, done: List[Tuple[int, object]]) -> List[List[float]]:
+        """Stitch per-batch results back in input order, collecting failures across batches"""
+        out: List[List[float]] = [None] * n
+        failed: List[int] = []
+        for start, result in done:
+            if isinstance(result, EmbeddingError):
+                failed.extend(start + i for i in result.failed_indices)
+            elif isinstance(result, Exception):
+                raise result
+            else:
+                out[start:start + len(result)] = result
+        if failed:
+            raise EmbeddingError(f"Failed to embed {len(failed)} of {n} inputs", sorted(failed))
+        return out
+
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        """Blocking interface: batches run concurrently on the bounded pool"""
+        if not texts:
+            return []
+        batches = self._batches(texts)
+        if len(batches) == 1:
+            return self._embed_batch(texts)
+
+        futures = [(start, self._executor.submit(self._embed_batch, batch)) for start, batch in batches]
+        done = []
+        for start, fut in futures:
+            try:
+                done.append((start, fut.result()))
+            except Exception as e:
+                done.append((start, e))
+        return self._merge(len(texts), done)
+
+    async def aembed(self, texts: List[str]) -> List[List[float]]:
+        """asyncio interface sharing the same pool (and concurrency cap) as embed()"""
+        if not texts:
+            return []
+        loop = asyncio.get_running_loop()
+        batches = self._batches(texts)
+        results = await asyncio.gather(
+            *[loop.run_in_executor(self._executor, self._embed_batch, batch) for _, batch in batches],
+            return_exceptions=True
+        )
+        return self._merge(len(texts), [(start, res) for (start, _), res in zip(batches, results)])
+
+    def close(self):
+        self._executor.shutdown(wait=False)
+        self.session.close()
+
+# One pooled client per (model, url) so every adapter in the process shares connections
+_CLIENTS: Dict[Tuple, OllamaEmbeddingClient] = {}
+_CLIENTS_LOCK = threading.Lock()
+
+def get_embedding_client(model_name: str, base_url: str, **kwargs) -> OllamaEmbeddingClient:
+    key = (model_name, base_url.rstrip("/"))
+    with _CLIENTS_LOCK:
+        if key not in _CLIENTS:
+            _CLIENTS[key] = OllamaEmbeddingClient(model_name=model_name, base_url=base_url, **kwargs)
+        return _CLIENTS[key]
+
+class EmbeddingMicroBatcher:
+    """
+    Coalesces query embeddings from concurrent requests.
+    Texts arriving within `window_ms` (or until `max_batch_size` is reached) go out
+    as one batched embed call; each caller awaits its own vector.
+    """
+    def __init__(self, embed_fn: Callable[[List[str]], Awaitable[List[List[float]]]],
+                 window_ms: float = 3.0, max_batch_size: int = 32):
+        self.embed_fn = embed_fn
+        self.window = window_ms / 1000.0
+        self.max_batch_size = max(1, max_batch_size)
+        self._pending: List[Tuple[str, asyncio.Future]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        # Strong references to in-flight batches; the loop only keeps weak ones
+        self._tasks: Set[asyncio.Task] = set()
+        self.stats = {"requests": 0, "batches": 0}
+
+    async def embed(self, text: str) -> List[float]:
+        loop = asyncio.get_running_loop()
+        fut = loop.create_future()
+        self._pending.append((text, fut))
+        self.stats["requests"] += 1
+        if len(self._pending) >= self.max_batch_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window, self._flush)
+        return await fut
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if batch:
+            self.stats["batches"] += 1
+            task = asyncio.ensure_future(self._run(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, batch: List[Tuple[str, asyncio.Future]]):
+        # Identical queries in one window share a single input
+        unique = list(dict.fromkeys(text for text, _ in batch))
+        try:
+            vectors = dict(zip(unique, await self.embed_fn(unique)))
+        except Exception as e:
+            for _, fut in batch:
+                if not fut.done():
+                    fut.set_exception(e)
+            return
+        for text, fut in batch:
+            if not fut.done():
+                fut.set_result(vectors[text])
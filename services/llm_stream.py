@@ -0,0 +1,75 @@
+import asyncio
+import json
+import logging
+from typing import AsyncIterator, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+class LLMStreamError(Exception):
+    """Raised when Ollama reports an error in the middle of a stream"""
+
+class OllamaChatStreamer:
+    """
+    Token stream from Ollama's /api/chat (stream=true, NDJSON).
+    - Content deltas are yielded as Ollama produces them
+    - One keep-alive aiohttp session per event loop
+    - Closing the generator (client disconnect, task cancelled) drops the HTTP
+      connection, which makes Ollama abort the generation instead of finishing it
+    """
+    def __init__(self, model: str, base_url: str = "http://localhost:11434", options: Optional[Dict] = None,
+                 connect_timeout: float = 10.0, read_timeout: float = 120.0):
+        self.model = model
+        self.base_url = base_url.rstrip("/")
+        self.options = options or {}
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout # Max gap between two chunks, not the whole answer
+        self._session = None
+        self._loop = None
+
+    async def _client(self):
+        import aiohttp
+        loop = asyncio.get_running_loop()
+        if self._session is None or self._session.closed or self._loop is not loop:
+            timeout = aiohttp.ClientTimeout(total=None, sock_connect=self.connect_timeout, sock_read=self.read_timeout)
+            self._session = aiohttp.ClientSession(timeout=timeout)
+            self._loop = loop
+        return self._session
+
+    # Timing fields of Ollama's final chunk (durations in nanoseconds)
+    STAT_FIELDS = ("prompt_eval_count", "prompt_eval_duration", "eval_count", "eval_duration", "total_duration")
+
+    async def stream(self, messages: List[Dict[str, str]], options: Optional[Dict] = None,
+                     stats: Optional[Dict] = None) -> AsyncIterator[str]:
+        """Content deltas; when given, `stats` is filled with the final chunk's STAT_FIELDS"""
+        session = await self._client()
+        body = {"model": self.model, "messages": messages, "stream": True,
+                "options": {**self.options, **(options or {})}}
+        done = False
+        async with session.post(f"{self.base_url}/api/chat", json=body) as res:
+            try:
+                if res.status >= 400:
+                    raise LLMStreamError(f"Ollama returned {res.status}: {(await res.text())[:200]}")
+                async for line in res.content:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    chunk = json.loads(line)
+                    if chunk.get("error"):
+                        raise LLMStreamError(chunk["error"])
+                    token = chunk.get("message", {}).get("content", "")
+                    if token:
+                        yield token
+                    if chunk.get("done"):
+                        if stats is not None:
+                            stats.update({k: chunk[k] for k in self.STAT_FIELDS if k in chunk})
+                        done = True
+                        return
+            finally:
+                if not done:
+                    # Stopped early: close the socket rather than return it to the pool,
+                    # so the server sees the disconnect and stops generating
+                    res.close()
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
@@ -0,0 +1,209 @@
+import json
+import logging
+import os
+import shutil
+import tempfile
+from typing import Dict, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Export + quantization happen once per model; the int8 graph and its tokenizer
+# are cached on disk and every later process only needs onnxruntime + tokenizers.
+#   <cache_dir>/<model name with / -> __>/model.onnx        fp32 export
+#   <cache_dir>/<model name with / -> __>/model.int8.onnx   dynamic int8 weights
+#   <cache_dir>/<model name with / -> __>/sentence_bert_config.json   max_seq_length (encoders)
+# Every file is written in a private temp dir and renamed into place, graph last,
+# so concurrent workers exporting the same model never see each other's partial files.
+BACKENDS = ("torch", "onnx", "onnx-int8")
+# sentence-transformers' config holding an encoder's max_seq_length
+ST_CONFIG = "sentence_bert_config.json"
+# Tokenizers without a real limit report this (transformers' VERY_LARGE_INTEGER)
+_UNSET_LENGTH = 10 ** 12
+
+def model_dir(model_name: str, cache_dir: str) -> str:
+    return os.path.join(cache_dir, model_name.replace("/", "__"))
+
+def softmax(logits: np.ndarray) -> np.ndarray:
+    shifted = logits - logits.max(axis=-1, keepdims=True)
+    exp = np.exp(shifted)
+    return exp / exp.sum(axis=-1, keepdims=True)
+
+def mean_pool(hidden: np.ndarray, mask: np.ndarray, normalize: bool = True) -> np.ndarray:
+    """Masked mean over tokens (the sentence-transformers Pooling layer), optionally L2 normalized"""
+    mask = mask[..., None].astype(hidden.dtype)
+    pooled = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+    if normalize:
+        pooled /= np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+    return pooled
+
+def max_sequence_length(directory: str, tokenizer) -> int:
+    """
+    Truncation length the sentence-transformers model would use: an encoder's
+    max_seq_length from its sentence_bert_config.json, else the tokenizer's limit
+    (what CrossEncoder uses), else 512.
+    """
+    try:
+        with open(os.path.join(directory, ST_CONFIG)) as f:
+            return int(json.load(f)["max_seq_length"])
+    except (OSError, ValueError, KeyError, TypeError):
+        pass
+    limit = getattr(tokenizer, "model_max_length", None)
+    return int(limit) if limit and limit < _UNSET_LENGTH else 512
+
+def _fetch_st_config(model_name: str, directory: str):
+    """Copy the model's sentence_bert_config.json next to the graph, if it has one"""
+    try:
+        from huggingface_hub import hf_hub_download
+        tmp_path = os.path.join(directory, f".{ST_CONFIG}.{os.getpid()}")
+        shutil.copy(hf_hub_download(model_name, ST_CONFIG), tmp_path)
+        os.replace(tmp_path, os.path.join(directory, ST_CONFIG))
+    except Exception as e:
+        logger.info(f"No {ST_CONFIG} for {model_name} ({e}); using the tokenizer's max length")
+
+def export_onnx(model_name: str, task: str, cache_dir: str, quantize: bool = True) -> str:
+    """
+    Export a Hugging Face model to ONNX (dynamic batch / sequence axes) and,
+    with quantize, apply int8 dynamic quantization to its weights.
+    task: "cross-encoder" (sequence classification logits) or "encoder" (token embeddings).
+    Needs torch + transformers; returns the path of the graph to serve.
+    """
+    import torch
+    from transformers import AutoModel, AutoModelForSequenceClassification, AutoTokenizer
+
+    out_dir = model_dir(model_name, cache_dir)
+    os.makedirs(out_dir, exist_ok=True)
+    fp32_path = os.path.join(out_dir, "model.onnx")
+    int8_path = os.path.join(out_dir, "model.int8.onnx")
+    work_dir = tempfile.mkdtemp(dir=out_dir, prefix=".export-")
+    try:
+        if not os.path.exists(fp32_path):
+            logger.info(f"Exporting {model_name} to ONNX...")
+            tokenizer = AutoTokenizer.from_pretrained(model_name)
+            model_cls = AutoModelForSequenceClassification if task == "cross-encoder" else AutoModel
+            model = model_cls.from_pretrained(model_name).eval()
+            sample = tokenizer(["export"], ["sample"] if task == "cross-encoder" else None, return_tensors="pt")
+            input_names = [name for name in ("input_ids", "attention_mask", "token_type_ids") if name in sample]
+            output_name = "logits" if task == "cross-encoder" else "last_hidden_state"
+            axes = {name: {0: "batch", 1: "sequence"} for name in input_names}
+            axes[output_name] = {0: "batch"} if task == "cross-encoder" else {0: "batch", 1: "sequence"}
+            graph = os.path.join(work_dir, "model.onnx")
+            with torch.no_grad():
+                torch.onnx.export(model, tuple(sample[name] for name in input_names), graph,
+                                  input_names=input_names, output_names=[output_name],
+                                  dynamic_axes=axes, opset_version=14)
+            tokenizer.save_pretrained(work_dir)
+            if task == "encoder":
+                _fetch_st_config(model_name, work_dir)
+            # Tokenizer and config first: a graph on disk means its model dir is complete
+            for name in sorted(os.listdir(work_dir), key=lambda n: n == "model.onnx"):
+                os.replace(os.path.join(work_dir, name), os.path.join(out_dir, name))
+        if not quantize:
+            return fp32_path
+
+        if not os.path.exists(int8_path):
+            from onnxruntime.quantization import QuantType, quantize_dynamic
+            logger.info(f"Quantizing {model_name} to int8...")
+            graph = os.path.join(work_dir, "model.int8.onnx")
+            quantize_dynamic(fp32_path, graph, weight_type=QuantType.QInt8)
+            os.replace(graph, int8_path)
+        return int8_path
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+class _ONNXModel:
+    """onnxruntime session + tokenizer from the on-disk cache (exported on first use)"""
+    TASK = ""
+
+    def __init__(self, model_name: str, cache_dir: str = "./data/onnx", quantize: bool = True,
+                 max_length: Optional[int] = None, pad_multiple: int = 16, num_threads: int = None):
+        import onnxruntime as ort
+        from transformers import AutoTokenizer
+
+        graph = os.path.join(model_dir(model_name, cache_dir), "model.int8.onnx" if quantize else "model.onnx")
+        if not os.path.exists(graph):
+            graph = export_onnx(model_name, self.TASK, cache_dir, quantize)
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if num_threads:
+            options.intra_op_num_threads = num_threads
+        self.session = ort.InferenceSession(graph, options, providers=["CPUExecutionProvider"])
+        self.input_names = {i.name for i in self.session.get_inputs()}
+        self.tokenizer = AutoTokenizer.from_pretrained(os.path.dirname(graph))
+        if self.TASK == "encoder" and not os.path.exists(os.path.join(os.path.dirname(graph), ST_CONFIG)):
+            _fetch_st_config(model_name, os.path.dirname(graph)) # Exported before the config was kept
+        self.model_name = model_name
+        self.graph_path = graph
+        # Same truncation as the sentence-transformers model this replaces, unless overridden
+        self.max_length = max_length or max_sequence_length(os.path.dirname(graph), self.tokenizer)
+        # Padding to a multiple keeps the set of sequence shapes small
+        self.pad_multiple = pad_multiple
+
+    def _run(self, first: Sequence[str], second: Sequence[str] = None) -> Tuple[np.ndarray, Dict[str, np.ndarray]]:
+        encoded = self.tokenizer(list(first), list(second) if second is not None else None, padding=True,
+                                 truncation=True, max_length=self.max_length,
+                                 pad_to_multiple_of=self.pad_multiple, return_tensors="np")
+        feeds = {name: encoded[name].astype(np.int64) for name in self.input_names if name in encoded}
+        return self.session.run(None, feeds)[0], feeds
+
+class ONNXCrossEncoder(_ONNXModel):
+    """Drop-in for sentence_transformers.CrossEncoder.predict on an (int8) ONNX graph"""
+    TASK = "cross-encoder"
+
+    def predict(self, pairs: Sequence[Sequence[str]], batch_size: int = 32, apply_softmax: bool = False,
+                show_progress_bar: bool = False, **kwargs) -> np.ndarray:
+        pairs = list(pairs)
+        if not pairs:
+            return np.zeros(0, dtype=np.float32)
+        out = []
+        for start in range(0, len(pairs), batch_size):
+            batch = pairs[start:start + batch_size]
+            logits, _ = self._run([p[0] for p in batch], [p[1] for p in batch])
+            out.append(logits)
+        logits = np.concatenate(out)
+        if logits.shape[1] == 1:
+            return logits[:, 0] # Relevance models: raw logits, like the ms-marco CrossEncoders
+        return softmax(logits) if apply_softmax else logits
+
+class ONNXSentenceEncoder(_ONNXModel):
+    """Drop-in for sentence_transformers.SentenceTransformer.encode (mean pooling + normalize)"""
+    TASK = "encoder"
+
+    def __init__(self, model_name: str, normalize: bool = True, **kwargs):
+        super().__init__(model_name, **kwargs)
+        self.normalize = normalize
+
+    def encode(self, sentences: Union[str, Sequence[str]], batch_size: int = 32, show_progress_bar: bool = False,
+               convert_to_numpy: bool = True, normalize_embeddings: bool = None, **kwargs) -> np.ndarray:
+        single = isinstance(sentences, str)
+        texts = [sentences] if single else list(sentences)
+        normalize = self.normalize if normalize_embeddings is None else normalize_embeddings
+        out = []
+        for start in range(0, len(texts), batch_size):
+            hidden, feeds = self._run(texts[start:start + batch_size])
+            out.append(mean_pool(hidden, feeds["attention_mask"], normalize))
+        embeddings = np.concatenate(out) if out else np.zeros((0, 0), dtype=np.float32)
+        return embeddings[0] if single else embeddings
+
+def load_cross_encoder(model_name: str, backend: str = "torch", **kwargs):
+    """CrossEncoder on the configured backend; an ONNX backend that is missing or fails to export falls back to torch"""
+    if backend in ("onnx", "onnx-int8"):
+        try:
+            return ONNXCrossEncoder(model_name, quantize=backend == "onnx-int8", **kwargs)
+        except Exception as e:
+            logger.warning(f"ONNX backend unavailable ({e}); loading {model_name} with torch")
+    from sentence_transformers import CrossEncoder
+    return CrossEncoder(model_name)
+
+def load_sentence_encoder(model_name: str, backend: str = "torch", **kwargs):
+    """SentenceTransformer on the configured backend; an ONNX backend that is missing or fails to export falls back to torch"""
+    if backend in ("onnx", "onnx-int8"):
+        try:
+            # Short sentence-transformers names ('all-MiniLM-L6-v2') live under that org on the hub
+            hub_name = model_name if "/" in model_name else f"sentence-transformers/{model_name}"
+            return ONNXSentenceEncoder(hub_name, quantize=backend == "onnx-int8", **kwargs)
+        except Exception as e:
+            logger.warning(f"ONNX backend unavailable ({e}); loading {model_name} with torch")
+    from sentence_transformers import SentenceTransformer
+    return SentenceTransformer(model_name)
@@ -1,9 +1,29 @@
 import numpy as np
 import chromadb
-from typing import List, Dict, Any
-import requests
-from core.quantization.polar_quant import PolarQuant
-from core.quantization.qjl import QJLRetriever
+import logging
+import os
+import threading
+import time
+from typing import List, Dict, Any, Optional
+from config import settings
+from core.locking import FileGeneration, FileLock, acquire_lock
+from core.quantization.polar_quant import DEFAULT_ROTATION
+from core.quantization.qjl_index import QJLCodeIndex
+from core.quantization.registry import get_polar_quant, get_qjl
+from services.embedding_client import get_embedding_client
+
+logger = logging.getLogger(__name__)
+
+# One resident code index per collection, shared by every adapter in the process
+# (RAGService and each upload's DocumentProcessor wrap the same collection).
+_INDEX_REGISTRY: Dict[str, QJLCodeIndex] = {}
+# Corpus generation each resident index reflects
+_INDEX_GENERATIONS: Dict[str, int] = {}
+# One loader per index: a full scan of the collection is never run twice at once
+_INDEX_LOAD_LOCKS: Dict[str, threading.Lock] = {}
+_INDEX_WATCHERS: Dict[str, threading.Thread] = {}
+_INDEX_REGISTRY_LOCK = threading.Lock()
+_INDEX_LOAD_BATCH = 5000
 
 class OllamaEmbeddingFunction:
     """ChromaDB compatible embedding function for Ollama models"""
@@ -11,20 +31,19 @@ class OllamaEmbeddingFunction:
     def __init__(self, model_name="nomic-embed-text", base_url="http://localhost:11434"):
         self.model_name = model_name
         self.base_url = base_url
+        # Shared pooled client: batched /api/embed requests over keep-alive connections
+        self.client = get_embedding_client(
+            model_name,
+            base_url,
+            batch_size=getattr(settings, "OLLAMA_EMBED_BATCH_SIZE", 64),
+            max_concurrency=getattr(settings, "OLLAMA_EMBED_CONCURRENCY", 4)
+        )
         
     def __call__(self, input: List[str]) -> List[List[float]]:
-        embeddings = []
-        for text in input:
-            try:
-                res = requests.post(f"{self.base_url}/api/embeddings", json={"model": self.model_name, "prompt": text})
-                if res.status_code == 200:
-                    embeddings.append(res.json().get("embedding", []))
-                else:
-                    embeddings.append([0.0] * 768)
-            except Exception as e:
-                print(f"Ollama Embed Error: {e}")
-                embeddings.append([0.0] * 768)
-        return embeddings
+        return self.client.embed(list(input))
+
+    async def acall(self, input: List[str]) -> List[List[float]]:
+        return await self.client.aembed(list(input))
 
 class QuantizedChromaAdapter:
     """
@@ -33,124 +52,236 @@ class QuantizedChromaAdapter:
     """
     def __init__(self, collection: chromadb.Collection, dim=768):
         self.collection = collection
-        self.polar = PolarQuant(dim=dim)
-        self.qjl = QJLRetriever(dim=dim)
-        
-    def add(self, documents: List[str], metadatas: List[Dict], ids: List[str], embeddings: List[List[float]] = None):
-        """Quantize embeddings before saving"""
-        if embeddings is None and documents is not None:
-            if self.collection._embedding_function:
-                embeddings = self.collection._embedding_function(documents)
-            else:
-                from chromadb.utils import embedding_functions
-                ef = embedding_functions.DefaultEmbeddingFunction()
-                embeddings = ef(documents)
-                
+        shared = getattr(settings, "QUANTIZER_SHARED_MEMORY", False)
+        self.polar = get_polar_quant(
+            dim=dim,
+            bits=getattr(settings, "QUANTIZATION_BITS", 3),
+            rotation=getattr(settings, "POLARQUANT_ROTATION", DEFAULT_ROTATION),
+            shared_memory=shared
+        )
+        self.qjl = get_qjl(dim=dim, shared_memory=shared)
+        with _INDEX_REGISTRY_LOCK:
+            key = getattr(collection, "name", None) or str(id(collection))
+            if key not in _INDEX_REGISTRY:
+                _INDEX_REGISTRY[key] = QJLCodeIndex(n_bits=self.qjl.J.shape[1])
+                _INDEX_LOAD_LOCKS[key] = threading.Lock()
+            self.index = _INDEX_REGISTRY[key]
+            self._load_lock = _INDEX_LOAD_LOCKS[key]
+        self._key = key
+        # Bumped by every write from any process, so readers know when their resident index is stale
+        os.makedirs(settings.CHROMADB_PATH, exist_ok=True)
+        self.generations = FileGeneration(os.path.join(settings.CHROMADB_PATH, f"{key}.qjl.gen"))
+
+    def _embed(self, texts: List[str]) -> List[List[float]]:
+        if self.collection._embedding_function:
+            return self.collection._embedding_function(texts)
+        from chromadb.utils import embedding_functions
+        ef = embedding_functions.DefaultEmbeddingFunction()
+        return ef(texts)
+
+    def _quantize(self, metadatas: List[Dict], embeddings: List[List[float]]):
+        """Polar Quant & QJL Residual per embedding -> (metadatas with codes, raw QJL codes)"""
+        np_embs = np.array(embeddings, dtype=np.float32).reshape(len(embeddings), -1)
+        pq_codes = self.polar.encode_batch(np_embs) if len(np_embs) else []
+        pq_approx = self.polar.decode_batch(pq_codes)
+        qjl_codes = self.qjl.encode_residual_batch(np_embs, pq_approx) if len(np_embs) else []
+
         quantized_metadatas = []
-        for i, emp in enumerate(embeddings):
-            np_emb = np.array(emp, dtype=np.float32)
-            
-            # Polar Quant & QJL Residual
-            pq_bytes = self.polar.encode(np_emb)
-            pq_approx = self.polar.decode_approximate(pq_bytes)
-            qjl_bytes = self.qjl.encode_residual(np_emb, pq_approx)
-            
+        for i, (pq_bytes, qjl_bytes) in enumerate(zip(pq_codes, qjl_codes)):
             meta = metadatas[i].copy() if metadatas and i < len(metadatas) else {}
             meta['_pq_bytes'] = pq_bytes.hex()
             meta['_qjl_bytes'] = qjl_bytes.hex()
             quantized_metadatas.append(meta)
-            
+        return quantized_metadatas, qjl_codes
+
+    def _ensure_index(self) -> QJLCodeIndex:
+        """
+        The resident index, loaded on first use. Writes from this process keep it
+        current; writes from other processes (e.g. a Celery worker) bump the corpus
+        generation, and a background thread reloads it while queries keep using the
+        previous snapshot. Queries never read the generation file.
+        """
+        if self._key not in _INDEX_GENERATIONS:
+            # Nothing to serve yet: one caller loads, concurrent ones wait for it
+            with self._load_lock:
+                if self._key not in _INDEX_GENERATIONS:
+                    self._load_index()
+            self._start_watcher()
+        return self.index
+
+    def _load_index(self):
+        """Build the resident index from stored metadata, paging through the collection (caller holds _load_lock)"""
+        # Read before loading: a write landing in between just triggers one more reload
+        generation = self.generations.get()
+        total = self.collection.count()
+        ids, codes = [], []
+        skipped = 0
+        offset = 0
+        while offset < total:
+            page = self.collection.get(include=["metadatas"], limit=_INDEX_LOAD_BATCH, offset=offset)
+            if not page["ids"]:
+                break
+            for doc_id, meta in zip(page["ids"], page["metadatas"]):
+                if meta and '_qjl_bytes' in meta:
+                    ids.append(doc_id)
+                    codes.append(bytes.fromhex(meta['_qjl_bytes']))
+                else:
+                    skipped += 1
+            offset += len(page["ids"])
+        # Swap in one step so concurrent queries never see a half-loaded index
+        self.index.reset(ids, codes)
+        _INDEX_GENERATIONS[self._key] = generation
+        logger.info(f"Loaded {len(self.index)} QJL codes into resident index (generation {generation})")
+        if skipped:
+            logger.warning(f"{skipped} documents have no QJL code and are not vector-searchable")
+
+    def _start_watcher(self):
+        with _INDEX_REGISTRY_LOCK:
+            if self._key in _INDEX_WATCHERS:
+                return
+            watcher = threading.Thread(target=self._watch, name=f"qjl-refresh-{self._key}", daemon=True)
+            _INDEX_WATCHERS[self._key] = watcher
+        watcher.start()
+
+    def _watch(self):
+        interval = getattr(settings, "VECTOR_INDEX_REFRESH_INTERVAL", 0.5)
+        while True:
+            time.sleep(interval)
+            try:
+                if self.generations.get() != _INDEX_GENERATIONS.get(self._key):
+                    with self._load_lock:
+                        if self.generations.get() != _INDEX_GENERATIONS.get(self._key):
+                            self._load_index()
+            except Exception as e:
+                logger.error(f"QJL index refresh failed: {e}")
+
+    def _publish(self):
+        """Bump the corpus generation after a write; the resident index stays current only if it already was"""
+        lock = FileLock(self.generations.path + ".lock")
+        if not acquire_lock(lock):
+            # Bumping without the lock could lose a concurrent writer's bump
+            raise TimeoutError(f"Could not lock {self.generations.path} to publish a vector store write")
+        try:
+            previous = self.generations.get()
+            generation = self.generations.bump()
+            if _INDEX_GENERATIONS.get(self._key) == previous:
+                _INDEX_GENERATIONS[self._key] = generation
+        finally:
+            lock.release()
+
+    def add(self, documents: List[str], metadatas: List[Dict], ids: List[str], embeddings: List[List[float]] = None):
+        """Quantize embeddings before saving"""
+        if embeddings is None and documents is not None:
+            embeddings = self._embed(documents)
+
+        quantized_metadatas, qjl_codes = self._quantize(metadatas, embeddings)
         dummy_embeddings = [[0.0] * self.polar.dim for _ in embeddings]
-        
+
         self.collection.add(
             embeddings=dummy_embeddings,
             documents=documents,
             metadatas=quantized_metadatas,
             ids=ids
         )
-        
+        self.index.upsert(ids, qjl_codes)
+        self._publish()
+
     def upsert(self, documents: List[str], metadatas: List[Dict], ids: List[str], embeddings: List[List[float]] = None):
         if embeddings is None and documents is not None:
-            if self.collection._embedding_function:
-                embeddings = self.collection._embedding_function(documents)
-            else:
-                from chromadb.utils import embedding_functions
-                ef = embedding_functions.DefaultEmbeddingFunction()
-                embeddings = ef(documents)
-                
-        quantized_metadatas = []
-        for i, emp in enumerate(embeddings):
-            np_emb = np.array(emp, dtype=np.float32)
-            pq_bytes = self.polar.encode(np_emb)
-            pq_approx = self.polar.decode_approximate(pq_bytes)
-            qjl_bytes = self.qjl.encode_residual(np_emb, pq_approx)
-            meta = metadatas[i].copy() if metadatas and i < len(metadatas) else {}
-            meta['_pq_bytes'] = pq_bytes.hex()
-            meta['_qjl_bytes'] = qjl_bytes.hex()
-            quantized_metadatas.append(meta)
-            
+            embeddings = self._embed(documents)
+
+        quantized_metadatas, qjl_codes = self._quantize(metadatas, embeddings)
         dummy_embeddings = [[0.0] * self.polar.dim for _ in embeddings]
+
         self.collection.upsert(
             embeddings=dummy_embeddings,
             documents=documents,
             metadatas=quantized_metadatas,
             ids=ids
         )
-        
+        self.index.upsert(ids, qjl_codes)
+        self._publish()
+
     def delete(self, ids: List[str] = None, where: Dict = None):
+        if ids is None and where is not None:
+            # Resolve ids first so the resident index can drop the same rows
+            ids = self.collection.get(where=where, include=[])["ids"]
+            if not ids:
+                return
+            where = None
         self.collection.delete(ids=ids, where=where)
-        
+        self.index.remove(ids or [])
+        self._publish()
+
     def get(self, *args, **kwargs):
         return self.collection.get(*args, **kwargs)
-        
+
+    def stored_embeddings(self, metadatas: List[Dict]) -> List[Optional[np.ndarray]]:
+        """
+        PolarQuant reconstructions of stored embeddings, aligned with `metadatas` (None for rows
+        without a readable code). Their cosine to the exact embeddings is about self.polar.fidelity.
+        """
+        codes: Dict[int, bytes] = {}
+        for i, meta in enumerate(metadatas):
+            if meta and '_pq_bytes' in meta:
+                try:
+                    codes[i] = bytes.fromhex(meta['_pq_bytes'])
+                except (TypeError, ValueError):
+                    logger.warning(f"Skipping malformed PQ code in row {i}")
+        out: List[Optional[np.ndarray]] = [None] * len(metadatas)
+        if not codes:
+            return out
+        try:
+            approx = list(self.polar.decode_batch(list(codes.values())))
+        except ValueError as e:
+            # One unreadable code must not cost the other rows their embeddings
+            logger.warning(f"Decoding stored PQ codes one by one: {e}")
+            approx = [self._decode_or_none(code) for code in codes.values()]
+        for i, vec in zip(codes, approx):
+            out[i] = vec
+        return out
+
+    def _decode_or_none(self, code: bytes) -> Optional[np.ndarray]:
+        try:
+            return self.polar.decode_approximate(code)
+        except ValueError:
+            return None
+
     def query(self, query_texts: List[str] = None, query_embeddings: List[List[float]] = None, n_results: int = 10) -> Dict[str, Any]:
-        """Custom search using QJL Coarse retrieval + PQ cross-check"""
+        """Custom search using the resident QJL code index + PQ cross-check"""
         if query_embeddings is None and query_texts is not None:
-            if self.collection._embedding_function:
-                query_embeddings = self.collection._embedding_function(query_texts)
-            else:
-                from chromadb.utils import embedding_functions
-                ef = embedding_functions.DefaultEmbeddingFunction()
-                query_embeddings = ef(query_texts)
-                
+            query_embeddings = self._embed(query_texts)
+
         if not query_embeddings:
             return {"ids": [[]], "documents": [[]], "metadatas": [[]], "distances": [[]]}
-        
-        all_data = self.collection.get(include=["metadatas", "documents"])
-        if not all_data["metadatas"]:
+
+        index = self._ensure_index()
+        if not len(index):
             return {"ids": [[]], "documents": [[]], "metadatas": [[]], "distances": [[]]}
-            
+
         results = {"ids": [], "documents": [], "metadatas": [], "distances": []}
-        
-        for q_emb in query_embeddings:
-            np_q = np.array(q_emb, dtype=np.float32)
-            q_jl_signs = self._pack_bits_native(np.sign(np.dot(np_q, self.qjl.J)))
-            
-            scores = []
-            for idx, meta in enumerate(all_data["metadatas"]):
-                if '_pq_bytes' not in meta or '_qjl_bytes' not in meta:
-                    scores.append((idx, -1.0))
+
+        q_jl_signs = self.qjl.encode_signs(np.array(query_embeddings, dtype=np.float32))
+        for q_words in q_jl_signs:
+            top_ids, sims = index.search(q_words, n_results)
+
+            # Only the winners are fetched from Chroma
+            fetched = self.collection.get(ids=top_ids, include=["metadatas", "documents"]) if top_ids else {"ids": []}
+            rows = {doc_id: (doc, meta) for doc_id, doc, meta in zip(fetched["ids"], fetched.get("documents") or [], fetched.get("metadatas") or [])}
+
+            res_ids, res_docs, res_metas, res_dists = [], [], [], []
+            for doc_id, sim in zip(top_ids, sims):
+                if doc_id not in rows:
                     continue
-                    
-                qjl_res = bytes.fromhex(meta['_qjl_bytes'])
-                sim = self.qjl.estimate_similarity(q_jl_signs, qjl_res)
-                scores.append((idx, sim))
-                
-            scores.sort(key=lambda x: x[1], reverse=True)
-            top_k = scores[:n_results]
-            
-            res_ids = [all_data["ids"][x[0]] for x in top_k]
-            res_docs = [all_data["documents"][x[0]] for x in top_k]
-            res_metas = [{k: v for k, v in all_data["metadatas"][x[0]].items() if not k.startswith('_')} for x in top_k]
-            res_dists = [1.0 - x[1] for x in top_k] 
-            
+                doc, meta = rows[doc_id]
+                res_ids.append(doc_id)
+                res_docs.append(doc)
+                res_metas.append({k: v for k, v in (meta or {}).items() if not k.startswith('_')})
+                res_dists.append(1.0 - float(sim))
+
             results["ids"].append(res_ids)
             results["documents"].append(res_docs)
             results["metadatas"].append(res_metas)
             results["distances"].append(res_dists)
-            
+
         return results
-        
-    def _pack_bits_native(self, bit_array: np.ndarray) -> bytes:
-        binary = (bit_array > 0).astype(np.uint8)
-        return np.packbits(binary).tobytes()
@@ -0,0 +1,142 @@
+import asyncio
+import logging
+import queue
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+class _Request:
+    __slots__ = ("pairs", "future", "loop")
+
+    def __init__(self, pairs, future, loop):
+        self.pairs, self.future, self.loop = pairs, future, loop
+
+class RerankerService:
+    """
+    In-process dynamic batching for a CrossEncoder-style model (anything with
+    predict(pairs, batch_size=...)).
+    - Pairs from concurrent requests arriving within `window_ms` are pooled
+    - Pooled pairs are sorted by token length and cut into batches of at most
+      `batch_size`, so each batch pads to a similar length
+    - One dedicated worker thread owns the model: a single predict runs at a time
+      instead of every request fighting for the same CPU cores
+    - Scores are scattered back to each caller's future, in the caller's order;
+      a failed batch only fails the callers that had pairs in it
+    """
+    def __init__(self, model, batch_size: int = 32, window_ms: float = 2.0, max_pending_pairs: int = 256,
+                 length_fn: Optional[Callable[[Tuple[str, str]], int]] = None, num_threads: Optional[int] = None):
+        self.model = model
+        self.batch_size = max(1, batch_size)
+        self.window = window_ms / 1000.0
+        self.max_pending_pairs = max(self.batch_size, max_pending_pairs)
+        self.length_fn = length_fn or self._default_length(model)
+        self.num_threads = num_threads
+        self.stats = {"requests": 0, "pairs": 0, "batches": 0, "predict_calls": 0}
+        self._queue: "queue.Queue[Optional[_Request]]" = queue.Queue()
+        self._worker = threading.Thread(target=self._run, name="reranker", daemon=True)
+        self._worker.start()
+
+    @staticmethod
+    def _default_length(model) -> Callable[[Tuple[str, str]], int]:
+        """Token count from the model's tokenizer when it has one, else a whitespace estimate"""
+        tokenizer = getattr(model, "tokenizer", None)
+        if tokenizer is not None and hasattr(tokenizer, "tokenize"):
+            return lambda pair: len(tokenizer.tokenize(pair[0])) + len(tokenizer.tokenize(pair[1]))
+        return lambda pair: len(pair[0].split()) + len(pair[1].split())
+
+    async def score(self, query: str, docs: Sequence[str]) -> List[float]:
+        """Relevance score per doc for one query"""
+        return await self.predict([(query, doc) for doc in docs])
+
+    async def predict(self, pairs: Sequence[Tuple[str, str]]) -> List[float]:
+        if not pairs:
+            return []
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._queue.put(_Request(list(pairs), future, loop))
+        return await future
+
+    def _collect(self, first: _Request) -> List[_Request]:
+        """The first request plus whatever arrives within the window (up to max_pending_pairs)"""
+        batch, n_pairs = [first], len(first.pairs)
+        deadline = time.monotonic() + self.window
+        while n_pairs < self.max_pending_pairs:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                request = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if request is None:
+                self._queue.put(None) # Stop after this batch
+                break
+            batch.append(request)
+            n_pairs += len(request.pairs)
+        return batch
+
+    def _score_pooled(self, pairs: List[Tuple[str, str]]) -> Tuple[List[float], Dict[int, Exception]]:
+        """
+        Length-bucketed scoring of a pooled pair list -> (scores in input order,
+        pair index -> error for the pairs whose batch failed)
+        """
+        order = sorted(range(len(pairs)), key=lambda i: self.length_fn(pairs[i]))
+        scores = [0.0] * len(pairs)
+        failed: Dict[int, Exception] = {}
+        for start in range(0, len(order), self.batch_size):
+            bucket = order[start:start + self.batch_size]
+            self.stats["predict_calls"] += 1
+            try:
+                out = self.model.predict([pairs[i] for i in bucket], batch_size=len(bucket))
+                for i, value in zip(bucket, out):
+                    scores[i] = float(value)
+            except Exception as e:
+                logger.error(f"Reranker batch of {len(bucket)} pairs failed: {e}")
+                failed.update(dict.fromkeys(bucket, e))
+        return scores, failed
+
+    def _run(self):
+        if self.num_threads:
+            try:
+                import torch
+                torch.set_num_threads(self.num_threads)
+            except ImportError:
+                pass
+        while True:
+            first = self._queue.get()
+            if first is None:
+                return
+            requests = self._collect(first)
+            pairs = [pair for request in requests for pair in request.pairs]
+            self.stats["requests"] += len(requests)
+            self.stats["pairs"] += len(pairs)
+            self.stats["batches"] += 1
+            try:
+                scores, failed = self._score_pooled(pairs)
+            except Exception as e:
+                # e.g. the length function; nothing was scored
+                logger.error(f"Reranker window of {len(pairs)} pairs failed: {e}")
+                scores, failed = [], dict.fromkeys(range(len(pairs)), e)
+            offset = 0
+            for request in requests:
+                span = range(offset, offset + len(request.pairs))
+                offset += len(request.pairs)
+                error = next((failed[i] for i in span if i in failed), None)
+                if error is not None:
+                    request.loop.call_soon_threadsafe(_set_exception, request.future, error)
+                else:
+                    request.loop.call_soon_threadsafe(_set_result, request.future, scores[span.start:span.stop])
+
+    def close(self):
+        self._queue.put(None)
+        self._worker.join(timeout=5)
+
+def _set_result(future: asyncio.Future, value):
+    if not future.done():
+        future.set_result(value)
+
+def _set_exception(future: asyncio.Future, error: Exception):
+    if not future.done():
+        future.set_exception(error)
@@ -0,0 +1,130 @@
+"""
+BM25 query latency: exhaustive scoring vs block-max pruned top-k.
+
+    python tests/bm25_benchmark.py                 # dataset/ PDFs + 1M synthetic chunks
+    python tests/bm25_benchmark.py --docs 200000   # smaller synthetic corpus
+
+Not collected by pytest (no test_ prefix).
+"""
+import argparse
+import asyncio
+import glob
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from core.bm25 import InvertedIndex  # noqa: E402
+from core.retrievers import DistributedBM25, _tokenize  # noqa: E402
+
+CHUNK_CHARS = 1000
+
+PDF_QUERIES = [
+    "transformer attention memory segment recurrence",
+    "scaling laws compute optimal model size tokens",
+    "few shot learning language models",
+    "model parallelism GPU pipeline",
+    "the model",
+]
+
+def pdf_corpus(pattern: str):
+    try:
+        import pypdf
+    except ImportError:
+        print("pypdf not installed; skipping dataset/ PDFs")
+        return []
+    chunks = []
+    for path in sorted(glob.glob(pattern)):
+        text = " ".join(page.extract_text() or "" for page in pypdf.PdfReader(path).pages)
+        chunks.extend(text[i:i + CHUNK_CHARS] for i in range(0, len(text), CHUNK_CHARS))
+    return [_tokenize(chunk) for chunk in chunks]
+
+def synthetic_corpus(n_docs: int, vocab: int = 200_000, seed: int = 0):
+    """Zipf-distributed terms, 20-200 tokens per chunk"""
+    rng = np.random.default_rng(seed)
+    lengths = rng.integers(20, 200, size=n_docs)
+    terms = np.minimum(rng.zipf(1.2, size=int(lengths.sum())), vocab)
+    words = np.array([f"t{i}" for i in range(vocab + 1)], dtype=object)[terms]
+    bounds = np.concatenate(([0], np.cumsum(lengths)))
+    return [list(words[bounds[i]:bounds[i + 1]]) for i in range(n_docs)]
+
+def build(corpus):
+    index = InvertedIndex()
+    start = time.perf_counter()
+    for i in range(0, len(corpus), 50_000):
+        index.add([str(j) for j in range(i, min(i + 50_000, len(corpus)))], corpus[i:i + 50_000])
+    print(f"  indexed {index.n_docs} docs, {len(index.vocab)} terms in {time.perf_counter() - start:.1f}s")
+    return index
+
+def exhaustive(index, query, k):
+    docs, scores = index.score(query)
+    order = np.argsort(-scores)[:k]
+    return docs[order], scores[order]
+
+def bench(index, queries, k, repeat=5):
+    for name, fn in (("exhaustive", exhaustive), ("block-max", index.search)):
+        times = []
+        for query in queries:
+            fn(index, query, k) if fn is exhaustive else fn(query, k)
+            start = time.perf_counter()
+            for _ in range(repeat):
+                fn(index, query, k) if fn is exhaustive else fn(query, k)
+            times.append((time.perf_counter() - start) / repeat * 1000)
+        print(f"  {name:<11} k={k:<4} mean {np.mean(times):7.2f} ms  max {np.max(times):7.2f} ms")
+
+    for query in queries:
+        np.testing.assert_allclose(index.search(query, k)[1], exhaustive(index, query, k)[1])
+
+def bench_sharded(corpus, queries, k, shard_size, repeat=5):
+    """Sharded search (global IDF, heap merge) on a thread pool"""
+    async def run():
+        sharded = DistributedBM25(shard_size=shard_size)
+        for i in range(0, len(corpus), 50_000):
+            await sharded.add_documents([" ".join(doc) for doc in corpus[i:i + 50_000]],
+                                        [str(j) for j in range(i, min(i + 50_000, len(corpus)))])
+        texts = [" ".join(q) for q in queries]
+        for text in texts:
+            await sharded.retrieve(text, k)
+        start = time.perf_counter()
+        for _ in range(repeat):
+            for text in texts:
+                await sharded.retrieve(text, k)
+        sequential = (time.perf_counter() - start) / (repeat * len(texts)) * 1000
+        start = time.perf_counter()
+        for _ in range(repeat):
+            await asyncio.gather(*[sharded.retrieve(text, k) for text in texts])
+        concurrent = (time.perf_counter() - start) / (repeat * len(texts)) * 1000
+        sharded.close()
+        print(f"  sharded ({len(sharded.shards)} x {shard_size}) k={k:<4} "
+              f"sequential {sequential:7.2f} ms/query  concurrent {concurrent:7.2f} ms/query")
+    asyncio.run(run())
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--docs", type=int, default=1_000_000)
+    parser.add_argument("--pdfs", default="dataset/*.pdf")
+    parser.add_argument("--shard-size", type=int, default=0, help="also benchmark DistributedBM25")
+    args = parser.parse_args()
+
+    corpus = pdf_corpus(args.pdfs)
+    if corpus:
+        print(f"dataset/ PDFs ({len(corpus)} chunks)")
+        index = build(corpus)
+        for k in (10, 100):
+            bench(index, [_tokenize(q) for q in PDF_QUERIES], k)
+
+    print(f"synthetic Zipf corpus ({args.docs} chunks)")
+    corpus = synthetic_corpus(args.docs)
+    index = build(corpus)
+    rng = np.random.default_rng(1)
+    queries = [[f"t{t}" for t in rng.integers(1, 2000, size=rng.integers(2, 6))] for _ in range(20)]
+    queries += [["t1", "t2", "t3"], ["t5", "t50", "t500", "t5000"]]
+    for k in (10, 100, 200):
+        bench(index, queries, k)
+    if args.shard_size:
+        bench_sharded(corpus, queries, 100, args.shard_size)
+
+if __name__ == "__main__":
+    main()
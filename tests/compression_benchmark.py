@@ -0,0 +1,84 @@
+"""
+Prompt-eval time with and without context compression, against a running Ollama.
+
+    python tests/compression_benchmark.py
+    python tests/compression_benchmark.py --top-k 8 --ratio 0.4
+
+For every golden question the context is its BM25 top-k chunks from the
+indexed corpus (Chroma + BM25 under ./data). Each question is sent twice
+through the streaming client, once with the full context and once compressed,
+and Ollama's own prompt_eval_count / prompt_eval_duration are compared (one
+output token per run, so generation time stays out of it). Needs
+sentence-transformers and a running Ollama.
+
+Not collected by pytest (no test_ prefix).
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from config import settings  # noqa: E402
+from core.compression import ContextCompressor, load_token_counter  # noqa: E402
+from core.retrievers import PersistedBM25Retriever  # noqa: E402
+from services.llm_stream import OllamaChatStreamer  # noqa: E402
+from services.onnx_backend import load_sentence_encoder  # noqa: E402
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def chat_messages(question, chunks):
+    # Same shape as RAGModule.chat_messages (importing dspy_module would configure DSPy)
+    return [
+        {"role": "system", "content": "Answer the question based STRICTLY on the provided 'Context'."},
+        {"role": "user", "content": "Context:\n" + "\n---\n".join(chunks) + f"\n\nQuestion: {question}\n\nAnswer:"},
+    ]
+
+async def prompt_eval(streamer, question, chunks):
+    stats = {}
+    async for _ in streamer.stream(chat_messages(question, chunks), options={"num_predict": 1}, stats=stats):
+        pass
+    return stats.get("prompt_eval_count", 0), stats.get("prompt_eval_duration", 0) / 1e6
+
+async def run(args):
+    import chromadb
+    with open(args.dataset) as f:
+        questions = json.load(f)["question"]
+    bm25 = PersistedBM25Retriever(auto_refresh=False)
+    collection = chromadb.PersistentClient(path=settings.CHROMADB_PATH).get_or_create_collection(settings.COLLECTION_NAME)
+    encoder = load_sentence_encoder("all-MiniLM-L6-v2", backend=settings.INFERENCE_BACKEND)
+    compressor = ContextCompressor(encoder, load_token_counter(settings.COMPRESSION_TOKENIZER, getattr(encoder, "tokenizer", None)),
+                                   ratio=args.ratio, max_tokens=settings.MAX_CONTEXT_LENGTH, min_tokens=args.min_tokens)
+    streamer = OllamaChatStreamer(settings.OLLAMA_LLM_MODEL, settings.OLLAMA_URL,
+                                  options={"temperature": 0.1, "num_ctx": args.num_ctx})
+
+    rows = []
+    for question in questions:
+        ids = [doc_id for doc_id, _ in bm25.retrieve(question, top_k=args.top_k)]
+        chunks = collection.get(ids=ids)["documents"] if ids else []
+        if not chunks:
+            continue
+        result = compressor.compress(question, chunks)
+        full_tokens, full_ms = await prompt_eval(streamer, question, chunks)
+        comp_tokens, comp_ms = await prompt_eval(streamer, question, result.chunks)
+        rows.append((full_tokens, comp_tokens, full_ms, comp_ms, result.elapsed * 1000))
+        print(f"{question[:40]:<40} prompt {full_tokens:>5} -> {comp_tokens:>5} tok  "
+              f"eval {full_ms:7.1f} -> {comp_ms:7.1f} ms  (compress {result.elapsed * 1000:.1f} ms)")
+    await streamer.close()
+    if rows:
+        r = np.asarray(rows, dtype=np.float64)
+        print(f"\nmean prompt tokens {r[:, 0].mean():.0f} -> {r[:, 1].mean():.0f}  "
+              f"prompt eval {r[:, 2].mean():.1f} -> {r[:, 3].mean():.1f} ms  "
+              f"saved {np.mean(r[:, 2] - r[:, 3]):.1f} ms/request at {r[:, 4].mean():.1f} ms compression cost")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--dataset", default=os.path.join(ROOT, "dataset", "golden_dataset.json"))
+    parser.add_argument("--top-k", type=int, default=8)
+    parser.add_argument("--ratio", type=float, default=settings.CONTEXT_COMPRESSION_RATIO)
+    parser.add_argument("--min-tokens", type=int, default=settings.CONTEXT_COMPRESSION_MIN_TOKENS)
+    parser.add_argument("--num-ctx", type=int, default=4096)
+    asyncio.run(run(parser.parse_args()))
@@ -0,0 +1,119 @@
+"""
+fp32 PyTorch vs ONNX int8 for the reranker CrossEncoder and the chunking encoder:
+latency, resident memory and ranking agreement on dataset/golden_dataset.json.
+
+    python tests/onnx_benchmark.py
+    python tests/onnx_benchmark.py --repeats 50 --threads 4
+
+For every golden question the candidate pool is every context, answer and
+ground truth in the dataset. Agreement is NDCG@k of the int8 ranking using the
+fp32 scores as graded gains, NDCG@k against the golden context, and top-1
+agreement. Needs sentence-transformers, torch, transformers and onnxruntime;
+the int8 graphs are exported into --cache-dir on the first run.
+
+Not collected by pytest (no test_ prefix).
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from services.onnx_backend import ONNXCrossEncoder, ONNXSentenceEncoder  # noqa: E402
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def rss_mb() -> float:
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+def load(factory):
+    before = rss_mb()
+    model = factory()
+    return model, rss_mb() - before
+
+def ndcg_at_k(ranking, gains, k):
+    """ranking: candidate indices best first; gains: relevance per candidate"""
+    gains = np.asarray(gains, dtype=np.float64)
+    discounts = 1.0 / np.log2(np.arange(2, k + 2))
+    dcg = (gains[list(ranking[:k])] * discounts[:len(ranking[:k])]).sum()
+    ideal = (np.sort(gains)[::-1][:k] * discounts[:min(k, len(gains))]).sum()
+    return dcg / ideal if ideal > 0 else 1.0
+
+def timed(fn, repeats):
+    fn() # Warm-up (graph optimization, allocator)
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return np.mean(times) * 1000, np.percentile(times, 95) * 1000
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--dataset", default=os.path.join(ROOT, "dataset", "golden_dataset.json"))
+    parser.add_argument("--cross-encoder", default="cross-encoder/ms-marco-MiniLM-L-6-v2")
+    parser.add_argument("--encoder", default="sentence-transformers/all-MiniLM-L6-v2")
+    parser.add_argument("--cache-dir", default=os.path.join(ROOT, "data", "onnx"))
+    parser.add_argument("--repeats", type=int, default=20)
+    parser.add_argument("--threads", type=int, default=None)
+    parser.add_argument("--k", type=int, default=5)
+    args = parser.parse_args()
+
+    import torch
+    from sentence_transformers import CrossEncoder, SentenceTransformer
+    if args.threads:
+        torch.set_num_threads(args.threads)
+
+    with open(args.dataset) as f:
+        golden = json.load(f)
+    questions = golden["question"]
+    pool = list(dict.fromkeys(
+        [c for ctxs in golden["contexts"] for c in ctxs] + golden["answer"] + golden["ground_truth"]
+    ))
+    golden_ctx = [set(ctxs) for ctxs in golden["contexts"]]
+
+    print("== CrossEncoder", args.cross_encoder)
+    fp32, fp32_mem = load(lambda: CrossEncoder(args.cross_encoder))
+    int8, int8_mem = load(lambda: ONNXCrossEncoder(args.cross_encoder, cache_dir=args.cache_dir, num_threads=args.threads))
+    pairs = [[q, doc] for q in questions for doc in pool]
+    fp32_scores = np.asarray(fp32.predict(pairs)).reshape(len(questions), len(pool))
+    int8_scores = np.asarray(int8.predict(pairs)).reshape(len(questions), len(pool))
+
+    ndcg_vs_fp32, ndcg_fp32_golden, ndcg_int8_golden, top1 = [], [], [], []
+    for i in range(len(questions)):
+        rank_fp32 = np.argsort(-fp32_scores[i], kind="stable")
+        rank_int8 = np.argsort(-int8_scores[i], kind="stable")
+        gains = fp32_scores[i] - fp32_scores[i].min() # Non-negative graded gains
+        labels = [1.0 if doc in golden_ctx[i] else 0.0 for doc in pool]
+        ndcg_vs_fp32.append(ndcg_at_k(rank_int8, gains, args.k))
+        ndcg_fp32_golden.append(ndcg_at_k(rank_fp32, labels, args.k))
+        ndcg_int8_golden.append(ndcg_at_k(rank_int8, labels, args.k))
+        top1.append(rank_fp32[0] == rank_int8[0])
+
+    request = [[questions[0], doc] for doc in pool[:12]] # One request: top_k * 3 candidates
+    for name, model, mem in (("fp32 torch", fp32, fp32_mem), ("int8 onnx", int8, int8_mem)):
+        mean, p95 = timed(lambda: model.predict(request), args.repeats)
+        print(f"  {name:<11} {mean:7.1f} ms mean  {p95:7.1f} ms p95  +{mem:6.0f} MB RSS")
+    print(f"  graph on disk: {os.path.getsize(int8.graph_path) / 1e6:.1f} MB")
+    print(f"  NDCG@{args.k} int8 vs fp32 scores: {np.mean(ndcg_vs_fp32):.4f}   top-1 agreement: {np.mean(top1):.2f}")
+    print(f"  NDCG@{args.k} vs golden context: fp32 {np.mean(ndcg_fp32_golden):.4f}  int8 {np.mean(ndcg_int8_golden):.4f}")
+
+    print("== Encoder", args.encoder)
+    fp32, fp32_mem = load(lambda: SentenceTransformer(args.encoder))
+    int8, int8_mem = load(lambda: ONNXSentenceEncoder(args.encoder, cache_dir=args.cache_dir, num_threads=args.threads))
+    a, b = fp32.encode(pool, normalize_embeddings=True), int8.encode(pool)
+    sentences = pool[:12]
+    for name, model, mem in (("fp32 torch", fp32, fp32_mem), ("int8 onnx", int8, int8_mem)):
+        mean, p95 = timed(lambda: model.encode(sentences), args.repeats)
+        print(f"  {name:<11} {mean:7.1f} ms mean  {p95:7.1f} ms p95  +{mem:6.0f} MB RSS")
+    print(f"  cosine(fp32, int8): mean {np.mean((a * b).sum(axis=1)):.4f}  min {np.min((a * b).sum(axis=1)):.4f}")
+
+if __name__ == "__main__":
+    main()
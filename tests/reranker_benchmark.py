@@ -0,0 +1,94 @@
+"""
+Reranker throughput and p95 latency: one predict per request (the old path,
+run in the default executor) vs RerankerService dynamic batching.
+
+    python tests/reranker_benchmark.py                      # synthetic CPU-bound cross-encoder
+    python tests/reranker_benchmark.py --model cross-encoder/ms-marco-MiniLM-L-6-v2
+
+The synthetic model costs what a small transformer costs structurally: a
+fixed per-call overhead plus work proportional to batch * padded length^2,
+so padding and tiny batches are penalized the same way.
+
+Not collected by pytest (no test_ prefix).
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from services.reranker import RerankerService  # noqa: E402
+
+class SyntheticCrossEncoder:
+    def __init__(self, hidden: int = 128, layers: int = 2, overhead_ms: float = 3.0):
+        rng = np.random.default_rng(0)
+        self.w = [rng.standard_normal((hidden, hidden)) / np.sqrt(hidden) for _ in range(layers)]
+        self.hidden = hidden
+        self.overhead = overhead_ms / 1000.0
+
+    def predict(self, pairs, batch_size=32, **kwargs):
+        scores = []
+        for start in range(0, len(pairs), batch_size):
+            batch = pairs[start:start + batch_size]
+            time.sleep(self.overhead) # Tokenizer + dispatch; released GIL like the real thing
+            length = max(len(q.split()) + len(d.split()) for q, d in batch) # Padded length
+            x = np.ones((len(batch), length, self.hidden))
+            for w in self.w:
+                attn = np.einsum("bld,bmd->blm", x, x) / self.hidden
+                x = np.tanh(np.einsum("blm,bmd->bld", attn, x) @ w)
+            scores.extend(x[:, 0, 0].tolist())
+        return scores
+
+def make_request(rng: random.Random, n_docs: int):
+    docs = [" ".join(["tok"] * rng.choice([20, 60, 120, 250])) for _ in range(n_docs)]
+    return "what does the report say about revenue", docs
+
+async def run(model, mode: str, concurrency: int, requests_per_client: int, n_docs: int, service=None):
+    rng = random.Random(concurrency)
+    latencies = []
+    loop = asyncio.get_running_loop()
+
+    async def client():
+        for _ in range(requests_per_client):
+            query, docs = make_request(rng, n_docs)
+            start = time.perf_counter()
+            if mode == "batched":
+                await service.score(query, docs)
+            else:
+                pairs = [[query, doc] for doc in docs]
+                await loop.run_in_executor(None, lambda: model.predict(pairs))
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    return len(latencies) / elapsed, float(np.percentile(latencies, 95)) * 1000
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--model", default=None, help="sentence-transformers CrossEncoder name (default: synthetic)")
+    parser.add_argument("--requests", type=int, default=8, help="requests per client")
+    parser.add_argument("--docs", type=int, default=12, help="candidates per request (top_k * 3)")
+    args = parser.parse_args()
+
+    if args.model:
+        from sentence_transformers import CrossEncoder
+        model = CrossEncoder(args.model)
+    else:
+        model = SyntheticCrossEncoder()
+    service = RerankerService(model, batch_size=32, window_ms=2.0)
+
+    print(f"{'clients':>7} | {'per-request q/s':>15} {'p95 ms':>8} | {'batched q/s':>11} {'p95 ms':>8}")
+    for concurrency in (1, 8, 32):
+        base_qps, base_p95 = await run(model, "per-request", concurrency, args.requests, args.docs)
+        qps, p95 = await run(model, "batched", concurrency, args.requests, args.docs, service)
+        print(f"{concurrency:>7} | {base_qps:>15.1f} {base_p95:>8.1f} | {qps:>11.1f} {p95:>8.1f}")
+    print(f"batched: {service.stats}")
+    service.close()
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,97 @@
+"""
+Local embedding router vs the LLM router: accuracy and latency.
+
+    python tests/router_eval.py
+    python tests/router_eval.py --gold labelled.jsonl --skip-llm
+
+Gold labels are SEED_QUERIES plus an optional JSONL of {"question", "route"}.
+The local router is scored leave-one-out: each gold query is routed by a
+router fit on every other gold query and the logged LLM decisions. Reported
+per confidence threshold: coverage (share routed locally), accuracy of the
+local decisions, and end-to-end accuracy when the rest goes to the LLM router.
+Latencies are per query; the local figure excludes the embedding call, which
+the service shares with retrieval. Needs a running Ollama.
+
+Not collected by pytest (no test_ prefix).
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from config import settings  # noqa: E402
+from core.routing import SEED_QUERIES, EmbeddingRouter, RoutingLog  # noqa: E402
+from services.embedding_client import OllamaEmbeddingClient  # noqa: E402
+
+def gold_set(path):
+    gold = {q: route for route, queries in SEED_QUERIES.items() for q in queries}
+    if path:
+        with open(path) as f:
+            for line in f:
+                if line.strip():
+                    record = json.loads(line)
+                    gold[record["question"]] = record["route"]
+    return list(gold.items())
+
+def percentiles(values_ms):
+    return f"p50 {np.percentile(values_ms, 50):.3f} ms  p95 {np.percentile(values_ms, 95):.3f} ms"
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--gold", default=None, help="Extra labelled queries (JSONL)")
+    parser.add_argument("--skip-llm", action="store_true", help="Only evaluate the local router")
+    parser.add_argument("--thresholds", default="0.0,0.4,0.5,0.6,0.7,0.8,0.9")
+    args = parser.parse_args()
+
+    gold = gold_set(args.gold)
+    gold_questions = {q for q, _ in gold}
+    logged = [(q, r) for q, r in RoutingLog(settings.ROUTER_LOG_PATH).read() if q not in gold_questions]
+    client = OllamaEmbeddingClient(model_name=settings.OLLAMA_EMBEDDING_MODEL, base_url=settings.OLLAMA_URL)
+    gold_emb = np.asarray(client.embed([q for q, _ in gold]))
+    logged_emb = np.asarray(client.embed([q for q, _ in logged])) if logged else np.zeros((0, gold_emb.shape[1]))
+    print(f"{len(gold)} gold queries, {len(logged)} logged LLM decisions")
+
+    # --- local router, leave-one-out ---
+    local, latencies = [], []
+    for i, (question, route) in enumerate(gold):
+        keep = [j for j in range(len(gold)) if j != i]
+        router = EmbeddingRouter(temperature=settings.ROUTER_TEMPERATURE)
+        router.fit(np.vstack([gold_emb[keep], logged_emb]), [gold[j][1] for j in keep] + [r for _, r in logged])
+        start = time.perf_counter()
+        predicted, confidence = router.predict(gold_emb[i])
+        latencies.append((time.perf_counter() - start) * 1000)
+        local.append((predicted, confidence))
+    local_correct = np.array([p == r for (p, _), (_, r) in zip(local, gold)])
+    confidences = np.array([c for _, c in local])
+    print(f"\nLocal router: accuracy {local_correct.mean():.3f}  {percentiles(latencies)}")
+
+    # --- LLM router ---
+    llm_correct = None
+    if not args.skip_llm:
+        from dspy_module import RAGModule
+        module = RAGModule()
+        llm_routes, llm_latencies = [], []
+        for question, _ in gold:
+            start = time.perf_counter()
+            llm_routes.append(module.route_query(question))
+            llm_latencies.append((time.perf_counter() - start) * 1000)
+        llm_correct = np.array([p == r for p, (_, r) in zip(llm_routes, gold)])
+        agree = np.mean([p == l for (p, _), l in zip(local, llm_routes)])
+        print(f"LLM router:   accuracy {llm_correct.mean():.3f}  {percentiles(llm_latencies)}")
+        print(f"Local / LLM agreement {agree:.3f}")
+
+    print(f"\n{'threshold':>9} {'coverage':>9} {'local acc':>10} {'combined acc':>13}")
+    for threshold in (float(t) for t in args.thresholds.split(",")):
+        covered = confidences >= threshold
+        local_acc = local_correct[covered].mean() if covered.any() else float("nan")
+        combined = "-"
+        if llm_correct is not None:
+            combined = f"{np.where(covered, local_correct, llm_correct).mean():.3f}"
+        print(f"{threshold:>9.2f} {covered.mean():>9.3f} {local_acc:>10.3f} {combined:>13}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,271 @@
+import random
+import numpy as np
+from core.bm25 import InvertedIndex
+
+WORDS = ["alpha", "beta", "gamma", "delta", "epsilon", "zeta", "eta", "theta", "iota", "kappa"]
+
+def _corpus(n, seed=0):
+    rng = random.Random(seed)
+    return [[rng.choice(WORDS[: rng.randint(2, len(WORDS))]) for _ in range(rng.randint(1, 30))] for _ in range(n)]
+
+def _brute_force(corpus, query, k1=1.5, b=0.75):
+    n = len(corpus)
+    avgdl = sum(len(d) for d in corpus) / n
+    scores = np.zeros(n)
+    for term in query:
+        df = sum(term in d for d in corpus)
+        if not df:
+            continue
+        idf = np.log(1.0 + (n - df + 0.5) / (df + 0.5))
+        for i, doc in enumerate(corpus):
+            tf = doc.count(term)
+            scores[i] += idf * tf * (k1 + 1) / (tf + k1 * (1 - b + b * len(doc) / avgdl))
+    return scores
+
+def test_scores_match_reference_formula():
+    corpus = _corpus(200)
+    index = InvertedIndex()
+    index.add([f"d{i}" for i in range(len(corpus))], corpus)
+    query = ["beta", "theta", "beta", "missing"]
+
+    docs, scores = index.score(query)
+    expected = _brute_force(corpus, query)
+    np.testing.assert_allclose(scores, expected[docs])
+    assert set(docs.tolist()) == set(np.flatnonzero(expected > 0).tolist())
+
+    top = index.top_k(query, k=5)
+    np.testing.assert_allclose([s for _, s in top], sorted(expected, reverse=True)[:5])
+
+def test_incremental_adds_match_single_build_and_state_roundtrip():
+    corpus = _corpus(60, seed=1)
+    ids = [f"d{i}" for i in range(len(corpus))]
+    whole = InvertedIndex()
+    whole.add(ids, corpus)
+    parts = InvertedIndex()
+    for start in range(0, 60, 7):
+        parts.add(ids[start:start + 7], corpus[start:start + 7])
+
+    restored = InvertedIndex.from_state(parts.to_state())
+    for index in (parts, restored):
+        assert index.top_k(["gamma", "eta"], 10) == whole.top_k(["gamma", "eta"], 10)
+        assert index.avgdl == whole.avgdl
+
+def test_block_max_search_matches_exhaustive(monkeypatch):
+    import core.bm25.inverted_index as inverted_index
+    monkeypatch.setattr(inverted_index, "BLOCK_DOCS", 16)
+    monkeypatch.setattr(inverted_index, "EXHAUSTIVE_POSTINGS", 0)
+    corpus = _corpus(1000, seed=2)
+    index = InvertedIndex()
+    index.add([f"d{i}" for i in range(len(corpus))], corpus)
+
+    for query in (["iota"], ["kappa", "alpha", "kappa"], ["theta", "zeta", "beta", "missing"]):
+        docs, scores = index.score(query)
+        for k in (1, 10, 100):
+            top_docs, top_scores = index.search(query, k)
+            np.testing.assert_allclose(top_scores, np.sort(scores)[::-1][:k])
+            np.testing.assert_allclose(scores[np.searchsorted(docs, top_docs)], top_scores)
+
+    # Tables rebuilt from postings (older saved states) match the incrementally kept ones
+    state = index.to_state()
+    del state['blocks']
+    assert InvertedIndex.from_state(state).to_state()['blocks'] == index.to_state()['blocks']
+
+def test_mmap_index_roundtrip(tmp_path):
+    from core.bm25 import MmapIndex, write_index
+    from core.bm25.segment import decode_varints, encode_varints
+
+    values = np.array([0, 1, 127, 128, 300, 2**32 - 1], dtype=np.uint64)
+    assert (decode_varints(encode_varints(values)[0]) == values).all()
+
+    corpus = _corpus(300, seed=3) + [["üñïcode", "alpha"]]
+    index = InvertedIndex()
+    index.add([f"d{i}" for i in range(len(corpus))], corpus)
+    write_index(str(tmp_path / "index.bm25"), index)
+    mapped = MmapIndex(str(tmp_path / "index.bm25"))
+
+    assert (mapped.n_docs, mapped.avgdl, len(mapped.vocab)) == (index.n_docs, index.avgdl, len(index.vocab))
+    for query in (["alpha"], ["kappa", "iota", "missing"], ["üñïcode"]):
+        assert mapped.top_k(query, 20) == index.top_k(query, 20)
+    assert mapped.to_inverted().top_k(["beta"], 5) == index.top_k(["beta"], 5)
+
+def test_persisted_retriever_migrates_legacy_pickle(tmp_path):
+    import pickle
+    from core.bm25 import MmapIndex
+    from core.retrievers import PersistedBM25Retriever
+
+    with open(tmp_path / "bm25_index.pkl", "wb") as f:
+        pickle.dump({'corpus': [["red", "apple"], ["green", "pear"]], 'doc_ids': ["a", "b"]}, f)
+    retriever = PersistedBM25Retriever(index_path=str(tmp_path / "bm25_index.bm25"))
+    assert isinstance(retriever.index, MmapIndex)
+    assert [d for d, _ in retriever.retrieve("apple")] == ["a"]
+
+    retriever.index_documents(["another apple pie"], ["c"])
+    reader = PersistedBM25Retriever(index_path=str(tmp_path / "bm25_index.bm25"))
+    assert {d for d, _ in reader.retrieve("apple")} == {"a", "c"}
+
+def test_tombstones_match_index_without_deleted_docs(monkeypatch):
+    import core.bm25.inverted_index as inverted_index
+    monkeypatch.setattr(inverted_index, "BLOCK_DOCS", 16)
+    monkeypatch.setattr(inverted_index, "EXHAUSTIVE_POSTINGS", 0)
+    corpus = _corpus(400, seed=4)
+    ids = [f"d{i}" for i in range(len(corpus))]
+    sources = [f"s{i % 5}" for i in range(len(corpus))]
+    index = InvertedIndex()
+    index.add(ids, corpus, sources)
+
+    assert index.delete(["d3", "d10", "d10", "missing"]) == 2
+    assert index.delete_source("s2")
+    kept = [i for i in range(len(corpus)) if ids[i] not in ("d3", "d10") and sources[i] != "s2"]
+    expected = InvertedIndex()
+    expected.add([ids[i] for i in kept], [corpus[i] for i in kept])
+
+    assert index.n_live == len(kept) and index.avgdl == expected.avgdl
+    for query in (["alpha"], ["kappa", "iota"], ["beta", "theta", "zeta"]):
+        assert index.stats(query).df == expected.stats(query).df
+        np.testing.assert_allclose([s for _, s in index.top_k(query, 50)], [s for _, s in expected.top_k(query, 50)])
+        assert index.compact().top_k(query, 50) == expected.top_k(query, 50)
+    assert InvertedIndex.from_state(index.to_state()).n_live == len(kept)
+
+    # Re-adding a deleted source or id brings back only the new documents
+    index.add(["d10", "new"], [["omega"], ["omega", "alpha"]], ["s0", "s2"])
+    assert {d for d, _ in index.top_k(["omega"], 10)} == {"d10", "new"}
+    assert index.n_live == len(kept) + 2
+
+def test_persisted_retriever_deletes_and_compacts(tmp_path, monkeypatch):
+    from config import settings
+    from core.retrievers import PersistedBM25Retriever
+    monkeypatch.setattr(settings, "BM25_COMPACTION_RATIO", 1.1) # Compact explicitly below
+
+    path = str(tmp_path / "bm25_index.bm25")
+    writer = PersistedBM25Retriever(index_path=path)
+    writer.index_documents(["red apple", "green apple", "apple pie"], ["a.pdf_0", "a.pdf_1", "b.pdf_0"])
+    reader = PersistedBM25Retriever(index_path=path, auto_refresh=False)
+    assert not reader.refresh()
+
+    assert writer.delete_documents(source="a.pdf") == 2
+    assert len(reader.retrieve("apple")) == 3 # Queries never reload on their own
+    assert reader.refresh()
+    assert [d for d, _ in reader.retrieve("apple")] == ["b.pdf_0"]
+    assert reader.index.stats(["apple"]).df == {"apple": 1}
+
+    writer.index_documents(["apple tart"], ["c.pdf_0"])
+    assert writer.delete_documents(doc_ids=["b.pdf_0"]) == 1
+    assert writer.compact()
+    assert writer.index.n_docs == writer.index.n_live == 1
+    assert reader.refresh()
+    assert [d for d, _ in reader.retrieve("apple")] == ["c.pdf_0"]
+    assert reader.generation == writer.generation == 5
+
+def test_segmented_index_matches_single_index(tmp_path):
+    from core.bm25 import MmapIndex, SegmentedIndex, merge_segments, write_index
+    corpus = _corpus(300, seed=5)
+    ids = [f"d{i}" for i in range(len(corpus))]
+    single = InvertedIndex()
+    single.add(ids, corpus)
+    segments = []
+    for n, (lo, hi) in enumerate([(0, 200), (200, 260), (260, 300)]):
+        part = InvertedIndex()
+        part.add(ids[lo:hi], corpus[lo:hi])
+        write_index(str(tmp_path / f"seg{n}"), part)
+        segments.append(MmapIndex(str(tmp_path / f"seg{n}")))
+    segmented = SegmentedIndex(segments)
+    for query in (["alpha"], ["kappa", "iota"], ["beta", "theta", "zeta"]):
+        assert segmented.stats(query).df == single.stats(query).df
+        np.testing.assert_allclose([s for _, s in segmented.top_k(query, 50)], [s for _, s in single.top_k(query, 50)])
+        assert merge_segments(segments).top_k(query, 50) == single.top_k(query, 50)
+
+def test_uploads_append_delta_segments(tmp_path, monkeypatch):
+    import os
+    from config import settings
+    from core.bm25 import SegmentedIndex
+    from core.retrievers import PersistedBM25Retriever
+    monkeypatch.setattr(settings, "BM25_MAX_DELTAS", 100) # Compact explicitly below
+
+    path = str(tmp_path / "bm25_index.bm25")
+    writer = PersistedBM25Retriever(index_path=path, auto_refresh=False)
+    writer.index_documents(["red apple", "green pear"], ["a.pdf_0", "a.pdf_1"])
+    base = (os.stat(path).st_mtime_ns, writer.index.uid)
+    writer.index_documents(["apple pie"], ["b.pdf_0"])
+    writer.index_documents(["apple crumble"], ["a.pdf_0"]) # Re-upload replaces the older copy
+    assert (os.stat(path).st_mtime_ns, writer.index.segments[0].uid) == base
+    assert isinstance(writer.index, SegmentedIndex) and len(writer.index.segments) == 3
+
+    reader = PersistedBM25Retriever(index_path=path, auto_refresh=False)
+    assert {d for d, _ in reader.retrieve("apple")} == {"a.pdf_0", "b.pdf_0"}
+    assert reader.retrieve("red") == [] and reader.index.n_live == 3
+
+    deltas = [s.path for s in writer.index.segments[1:]]
+    assert writer.compact()
+    assert writer.index.n_docs == writer.index.n_live == 3
+    assert not any(os.path.exists(p) for p in deltas)
+    assert reader.refresh()
+    assert {d for d, _ in reader.retrieve("apple")} == {"a.pdf_0", "b.pdf_0"}
+
+def test_persisted_retriever_background_refresh(tmp_path, monkeypatch):
+    import time
+    from config import settings
+    from core.retrievers import PersistedBM25Retriever
+    monkeypatch.setattr(settings, "BM25_REFRESH_INTERVAL", 0.01)
+
+    path = str(tmp_path / "bm25_index.bm25")
+    writer = PersistedBM25Retriever(index_path=path, auto_refresh=False)
+    reader = PersistedBM25Retriever(index_path=path)
+    writer.index_documents(["fresh words"], ["x_0"])
+    deadline = time.time() + 5
+    while not reader.retrieve("fresh") and time.time() < deadline:
+        time.sleep(0.01)
+    assert [d for d, _ in reader.retrieve("fresh")] == ["x_0"]
+    reader.close()
+
+def test_persisted_retriever_close_stops_watcher_and_unmaps(tmp_path):
+    from core.retrievers import PersistedBM25Retriever
+    path = str(tmp_path / "bm25_index.bm25")
+    PersistedBM25Retriever(index_path=path, auto_refresh=False).index_documents(["some words"], ["x_0"])
+    reader = PersistedBM25Retriever(index_path=path)
+    mapped, watcher = reader.index, reader._watcher
+    reader.close()
+    assert not watcher.is_alive()
+    assert mapped._mmap is None
+    assert reader.retrieve("words") == []
+
+def test_refresh_never_migrates_under_its_lock(tmp_path):
+    import pickle
+    import threading
+    from core.retrievers import PersistedBM25Retriever
+    path = str(tmp_path / "bm25_index.bm25")
+    retriever = PersistedBM25Retriever(index_path=path, auto_refresh=False)
+    with open(tmp_path / "bm25_index.pkl", "wb") as f:
+        pickle.dump({'corpus': [["red", "apple"]], 'doc_ids': ["a"]}, f)
+    retriever.generations.bump()
+    worker = threading.Thread(target=retriever.refresh, daemon=True)
+    worker.start()
+    worker.join(timeout=5)
+    assert not worker.is_alive()
+
+def test_redis_generation_falls_back_to_local_file(tmp_path):
+    from core.bm25 import RedisGeneration, generation_store
+    store = generation_store(str(tmp_path / "index.bm25"), backend="redis", redis_url="redis://127.0.0.1:1")
+    assert isinstance(store, RedisGeneration)
+    assert store.get() == 0
+    assert store.bump() == 1 and store.get() == 1
+
+def test_redis_generation_never_lags_the_local_file(tmp_path):
+    from core.bm25 import generation_store
+
+    class _FlakyRedis:
+        def __init__(self):
+            self.value, self.down = None, False
+
+        def get(self, key):
+            return self.value
+
+        def set(self, key, value):
+            if self.down:
+                raise ConnectionError("redis went away")
+            self.value = str(value).encode()
+
+    store = generation_store(str(tmp_path / "index.bm25"), backend="redis", redis_url="redis://127.0.0.1:1")
+    store.client = _FlakyRedis()
+    assert store.bump() == 1 and store.get() == 1
+    store.client.down = True
+    assert store.bump() == 2 and store.get() == 2
@@ -0,0 +1,72 @@
+import numpy as np
+
+from core.compression import ContextCompressor, lazy_token_counter, load_token_counter, split_chunk
+
+VOCAB = ["knn", "neighbors", "distance", "chroma", "vector", "database", "docker", "python", "weather"]
+
+class _BagOfWords:
+    """Deterministic stand-in for a sentence encoder: vocabulary counts plus a small constant"""
+    def __init__(self):
+        self.calls = 0
+
+    def encode(self, texts):
+        self.calls += 1
+        out = np.full((len(texts), len(VOCAB) + 1), 0.01)
+        for i, text in enumerate(texts):
+            for word in text.lower().replace(".", "").split():
+                if word in VOCAB:
+                    out[i, VOCAB.index(word)] += 1.0
+        return out
+
+def _words(text):
+    return len(text.split())
+
+CHUNKS = [
+    "Docker builds the python image. KNN uses neighbors and distance. The weather was nice.",
+    "KNN uses neighbors and distance. Chroma is a vector database.",
+    "Python runs the docker workers.",
+]
+
+def test_split_chunk_handles_sentences_and_blank_lines():
+    assert split_chunk("One two. Three four!\n\nHeading\nline") == ["One two.", "Three four!", "Heading\nline"]
+
+def test_keeps_relevant_sentences_drops_overlap_within_budget():
+    compressor = ContextCompressor(_BagOfWords(), _words, ratio=0.4, max_tokens=100, min_tokens=5)
+    result = compressor.compress("knn neighbors distance", CHUNKS)
+    assert result.tokens_before == sum(_words(c) for c in CHUNKS)
+    assert result.tokens_after <= compressor.budget(result.tokens_before)
+    # The repeated KNN sentence survives once, in its first chunk and original position
+    assert result.chunks[0] == "KNN uses neighbors and distance."
+    assert result.duplicates >= 1
+    assert all("weather" not in chunk for chunk in result.chunks)
+
+def test_budget_is_capped_and_floored():
+    compressor = ContextCompressor(_BagOfWords(), _words, ratio=0.5, max_tokens=1000, min_tokens=100)
+    assert compressor.budget(10000) == 1000
+    assert compressor.budget(300) == 150
+    assert compressor.budget(120) == 100
+
+def test_small_context_is_left_alone():
+    encoder = _BagOfWords()
+    compressor = ContextCompressor(encoder, _words, min_tokens=512)
+    result = compressor.compress("knn", CHUNKS)
+    assert result.chunks == CHUNKS and result.ratio == 1.0
+    assert encoder.calls == 0
+
+def test_token_counter_falls_back_to_estimate():
+    count = load_token_counter(None)
+    assert count("abcdefgh") == 2
+
+def test_token_counter_loads_on_first_count(monkeypatch):
+    import core.compression as compression
+    loads = []
+
+    def fake_load(name=None, fallback_tokenizer=None):
+        loads.append(name)
+        return lambda text: len(text.split())
+    monkeypatch.setattr(compression, "load_token_counter", fake_load)
+
+    count = lazy_token_counter("some/tokenizer")
+    assert loads == []
+    assert count("two words") == 2 and count("three more words") == 3
+    assert loads == ["some/tokenizer"]
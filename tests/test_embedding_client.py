@@ -0,0 +1,82 @@
+import json
+import threading
+import asyncio
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+from services.embedding_client import OllamaEmbeddingClient, EmbeddingError
+
+class _StubOllama(BaseHTTPRequestHandler):
+    requests_seen = []
+    fail_texts = set()
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        texts = body["input"]
+        type(self).requests_seen.append(len(texts))
+        if any(t in self.fail_texts for t in texts):
+            self.send_response(500)
+            self.end_headers()
+            return
+        payload = json.dumps({"embeddings": [[float(len(t)), 1.0] for t in texts]}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args):
+        pass
+
+@pytest.fixture
+def stub_url():
+    _StubOllama.requests_seen = []
+    _StubOllama.fail_texts = set()
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _StubOllama)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+
+def test_batches_preserve_order(stub_url):
+    client = OllamaEmbeddingClient(base_url=stub_url, batch_size=4, max_concurrency=2)
+    texts = ["x" * i for i in range(1, 11)]
+    embeddings = client.embed(texts)
+    assert [e[0] for e in embeddings] == [float(i) for i in range(1, 11)]
+    assert sorted(_StubOllama.requests_seen) == [2, 4, 4]
+
+    async_embeddings = asyncio.run(client.aembed(texts))
+    assert async_embeddings == embeddings
+
+def test_failed_items_raise_instead_of_zero_vectors(stub_url):
+    _StubOllama.fail_texts = {"bad"}
+    client = OllamaEmbeddingClient(base_url=stub_url, batch_size=8, max_retries=2)
+    with pytest.raises(EmbeddingError) as err:
+        client.embed(["good", "bad", "fine"])
+    assert err.value.failed_indices == [1]
+
+def test_single_input_failure_reports_its_index(stub_url):
+    _StubOllama.fail_texts = {"bad"}
+    client = OllamaEmbeddingClient(base_url=stub_url, max_retries=2)
+    with pytest.raises(EmbeddingError) as err:
+        client.embed(["bad"])
+    assert err.value.failed_indices == [0]
+    assert _StubOllama.requests_seen == [1, 1]
+
+def test_micro_batcher_coalesces_concurrent_queries():
+    from services.embedding_client import EmbeddingMicroBatcher
+    calls = []
+
+    async def fake_embed(texts):
+        calls.append(list(texts))
+        return [[float(len(t))] for t in texts]
+
+    async def run():
+        batcher = EmbeddingMicroBatcher(fake_embed, window_ms=20, max_batch_size=8)
+        results = await asyncio.gather(*[batcher.embed(q) for q in ["a", "bb", "a", "ccc"]])
+        return batcher, results
+
+    batcher, results = asyncio.run(run())
+    assert results == [[1.0], [2.0], [1.0], [3.0]]
+    assert calls == [["a", "bb", "ccc"]]
+    assert batcher.stats == {"requests": 4, "batches": 1}
+    assert not batcher._tasks # Finished batches drop their references
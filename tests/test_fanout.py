@@ -0,0 +1,27 @@
+import asyncio
+import time
+
+import pytest
+
+from core.fanout import fan_out
+
+async def _after(delay, value):
+    await asyncio.sleep(delay)
+    return value
+
+async def _boom():
+    raise RuntimeError("backend down")
+
+@pytest.mark.asyncio
+async def test_fan_out_runs_concurrently_and_keeps_partial_results():
+    start = time.perf_counter()
+    results = await fan_out(
+        {"vector": _after(0.05, [("a", 0.9)]), "bm25": _after(0.05, [("b", 3.1)]),
+         "graph": _after(5.0, ["x"]), "broken": _boom()},
+        timeouts={"graph": 0.1}
+    )
+    assert time.perf_counter() - start < 0.5 # Slowest healthy backend, capped by the graph timeout
+    assert results["vector"].value == [("a", 0.9)] and results["vector"].status == "ok"
+    assert results["bm25"].value == [("b", 3.1)]
+    assert results["graph"].status == "timeout" and results["graph"].value == []
+    assert results["broken"].status == "error" and "backend down" in results["broken"].error
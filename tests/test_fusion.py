@@ -0,0 +1,32 @@
+import random
+
+from core.fusion import fuse, hybrid_weights
+
+def _legacy_rrf(vector_results, keyword_results, k=60):
+    fused_scores = {}
+    for results in (vector_results, keyword_results):
+        for rank, (doc_id, _) in enumerate(results):
+            fused_scores[doc_id] = fused_scores.get(doc_id, 0) + 1 / (k + rank + 1)
+    return sorted(fused_scores.items(), key=lambda x: x[1], reverse=True)
+
+def test_rrf_matches_two_list_fusion_and_top_n_is_a_prefix():
+    rng = random.Random(3)
+    vector = [(f"d{i}", 1.0 - i / 100) for i in rng.sample(range(300), 60)]
+    keyword = [(f"d{i}", 20.0 - i / 10) for i in rng.sample(range(300), 60)]
+    expected = _legacy_rrf(vector, keyword)
+    assert fuse({"vector": vector, "bm25": keyword}) == expected
+    # Equal alpha halves every score, which keeps the ranking
+    halved = fuse({"vector": vector, "bm25": keyword}, weights=hybrid_weights(0.5), top_n=15)
+    assert [d for d, _ in halved] == [d for d, _ in expected[:15]]
+
+def test_weights_and_score_fusion():
+    vector = [("a", 0.9), ("b", 0.89), ("c", 0.1)]
+    keyword = [("c", 12.0), ("b", 2.0), ("a", 1.0)]
+    # Score fusion: normalized scores weighted 0.3 / 0.7
+    fused = fuse({"vector": vector, "bm25": keyword}, weights=hybrid_weights(0.3), method="score")
+    assert [d for d, _ in fused] == ["c", "b", "a"]
+    assert abs(fused[0][1] - 0.7) < 1e-9 and abs(fused[2][1] - 0.3) < 1e-9
+    # alpha = 1 is pure vector search; the N-th list just adds its votes
+    assert [d for d, _ in fuse({"vector": vector, "bm25": keyword}, weights=hybrid_weights(1.0))] == ["a", "b", "c"]
+    fused = fuse({"vector": vector, "bm25": keyword, "rewrite": [("b", 0.5)]})
+    assert fused[0][0] == "b"
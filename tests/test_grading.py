@@ -0,0 +1,34 @@
+import threading
+import time
+
+from core.grading import agreement, format_chunks, grade_concurrently, parse_verdicts, threshold_grades
+
+def test_parse_verdicts():
+    assert parse_verdicts("1: Yes, 2: No, 3: yes", 3) == [True, False, True]
+    assert parse_verdicts("Yes, No", 3) is None # Malformed: caller falls back to per-chunk grading
+    assert format_chunks(["alpha", "beta"]) == "[1] alpha\n\n[2] beta"
+
+def test_grade_concurrently_bounds_parallelism_and_keeps_failures():
+    in_flight, peak, lock = [0], [0], threading.Lock()
+
+    def grade(chunk):
+        with lock:
+            in_flight[0] += 1
+            peak[0] = max(peak[0], in_flight[0])
+        time.sleep(0.02)
+        with lock:
+            in_flight[0] -= 1
+        if chunk == "boom":
+            raise RuntimeError("llm down")
+        return chunk.startswith("y")
+
+    chunks = ["y1", "n1", "boom", "y2", "n2", "y3"]
+    assert grade_concurrently(grade, chunks, max_workers=2) == [True, False, True, True, False, True]
+    assert peak[0] == 2
+
+def test_threshold_grades_and_agreement():
+    ce = threshold_grades([2.5, -3.0, 0.1], threshold=0.0)
+    assert ce == [True, False, True]
+    assert agreement({"batch": [True, False, True], "cross_encoder": ce, "serial": [True, True, True]}) == {
+        "batch/cross_encoder": 1.0, "batch/serial": 2 / 3, "cross_encoder/serial": 2 / 3
+    }
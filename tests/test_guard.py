@@ -0,0 +1,72 @@
+import numpy as np
+
+from core.guard import GuardEngine, split_sentences
+
+class _FakeNLI:
+    """Entails a sentence when the chunk contains it, contradicts when it contains its negation"""
+    def __init__(self):
+        self.calls = 0
+
+    def predict(self, pairs, **kwargs):
+        self.calls += 1
+        rows = []
+        for chunk, sentence in pairs:
+            claim = sentence.rstrip(".")
+            if claim in chunk:
+                rows.append([0.02, 0.95, 0.03])
+            elif claim.replace(" is ", " is not ") in chunk:
+                rows.append([0.9, 0.05, 0.05])
+            else:
+                rows.append([0.1, 0.3, 0.6])
+        return np.array(rows)
+
+CHUNKS = ["Paris is the capital of France. It has 2 million people.", "The Seine is a river in Paris."]
+
+def test_nli_guard_verdicts_in_one_batch():
+    model = _FakeNLI()
+    guard = GuardEngine(model=model)
+    supported = guard.check(CHUNKS, "Paris is the capital of France. The Seine is a river in Paris.")
+    assert supported.supported is True and supported.method == "nli" and model.calls == 1
+    assert guard.check(CHUNKS, "The Seine is a river in Paris. Paris is the capital of Spain.").supported is None
+    contradicted = guard.check(["Lyon is not the capital of France."], "Lyon is the capital of France.")
+    assert contradicted.supported is False
+
+def test_nli_scores_every_chunk_beyond_max_pairs():
+    guard = GuardEngine(model=_FakeNLI(), max_pairs=4)
+    chunks = [f"Filler chunk number {i}." for i in range(10)] + CHUNKS
+    verdict = guard.check(chunks, "Paris is the capital of France. The Seine is a river in Paris.")
+    assert verdict.supported is True
+
+def test_embedding_fallback_and_sentence_split():
+    guard = GuardEngine(model_name=None)
+    assert split_sentences("Yes. Paris is the capital! Big? Very much so.") == ["Paris is the capital!", "Very much so."]
+    aligned = guard.check(CHUNKS, "Paris is the capital of France.", [1.0, 0.0], [[0.9, 0.1], [0.0, 1.0]])
+    assert aligned.supported is True and aligned.method == "embedding"
+    assert guard.check(CHUNKS, "Paris is the capital of France.", [1.0, 0.0], [[0.0, 1.0]]).supported is None
+    assert guard.check(CHUNKS, "Paris is the capital of France.").supported is None
+
+def test_embedding_threshold_is_calibrated_for_pq_reconstructions():
+    from core.quantization import PolarQuant
+    pq = PolarQuant(dim=768, bits=3)
+    assert 0.75 < pq.fidelity < 0.85
+    guard = GuardEngine(model_name=None, embedding_threshold=0.6)
+    rng = np.random.default_rng(5)
+
+    def pair(rho):
+        """A stored chunk and an answer embedding at exact cosine rho to it"""
+        chunk, noise = rng.standard_normal((2, 768))
+        chunk /= np.linalg.norm(chunk)
+        noise -= (noise @ chunk) * chunk
+        return chunk, rho * chunk + np.sqrt(1 - rho ** 2) * noise / np.linalg.norm(noise)
+
+    for rho in (0.3, 0.5, 0.7, 0.75, 0.9):
+        for _ in range(5):
+            chunk, answer = pair(rho)
+            stored = pq.decode_approximate(pq.encode(chunk))
+            exact = guard.check(CHUNKS, "Paris is the capital of France.", answer, [chunk])
+            approx = guard.check(CHUNKS, "Paris is the capital of France.", answer, [stored], pq.fidelity)
+            assert approx.supported == exact.supported
+    # Uncorrected, a clearly grounded answer would escalate
+    chunk, answer = pair(0.7)
+    stored = pq.decode_approximate(pq.encode(chunk))
+    assert guard.check(CHUNKS, "Paris is the capital of France.", answer, [stored]).supported is None
@@ -0,0 +1,90 @@
+import asyncio
+import json
+
+import pytest
+from aiohttp import web
+
+from services.llm_stream import LLMStreamError, OllamaChatStreamer
+
+class _StubOllama:
+    """Streams one NDJSON chunk per token; `delay` between chunks, records disconnects"""
+    def __init__(self, tokens, delay=0.0, error=None):
+        self.tokens, self.delay, self.error = tokens, delay, error
+        self.bodies = []
+        self.sent = 0
+        self.disconnected = asyncio.Event()
+
+    async def chat(self, request):
+        self.bodies.append(await request.json())
+        res = web.StreamResponse(headers={"Content-Type": "application/x-ndjson"})
+        await res.prepare(request)
+        try:
+            for token in self.tokens:
+                await res.write(json.dumps({"message": {"role": "assistant", "content": token}, "done": False}).encode() + b"\n")
+                self.sent += 1
+                await asyncio.sleep(self.delay)
+            if self.error:
+                await res.write(json.dumps({"error": self.error}).encode() + b"\n")
+            else:
+                await res.write(json.dumps({"message": {"content": ""}, "done": True, "prompt_eval_count": 42,
+                                            "prompt_eval_duration": 84_000_000}).encode() + b"\n")
+        except (ConnectionResetError, asyncio.CancelledError):
+            self.disconnected.set()
+            raise
+        return res
+
+async def _serve(stub):
+    app = web.Application()
+    app.router.add_post("/api/chat", stub.chat)
+    runner = web.AppRunner(app, handler_cancellation=True)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    return runner, f"http://127.0.0.1:{port}"
+
+@pytest.mark.asyncio
+async def test_tokens_arrive_in_order_with_request_options():
+    stub = _StubOllama(["The ", "answer", "."])
+    runner, url = await _serve(stub)
+    streamer = OllamaChatStreamer("llama", base_url=url, options={"temperature": 0.1})
+    stats = {}
+    try:
+        tokens = [t async for t in streamer.stream([{"role": "user", "content": "q"}], stats=stats)]
+    finally:
+        await streamer.close()
+        await runner.cleanup()
+    assert tokens == ["The ", "answer", "."]
+    assert stub.bodies[0]["stream"] is True and stub.bodies[0]["options"] == {"temperature": 0.1}
+    assert stats == {"prompt_eval_count": 42, "prompt_eval_duration": 84_000_000}
+
+@pytest.mark.asyncio
+async def test_error_chunk_raises():
+    stub = _StubOllama(["partial"], error="model crashed")
+    runner, url = await _serve(stub)
+    streamer = OllamaChatStreamer("llama", base_url=url)
+    tokens = []
+    try:
+        with pytest.raises(LLMStreamError):
+            async for token in streamer.stream([{"role": "user", "content": "q"}]):
+                tokens.append(token)
+    finally:
+        await streamer.close()
+        await runner.cleanup()
+    assert tokens == ["partial"]
+
+@pytest.mark.asyncio
+async def test_closing_the_stream_stops_upstream_generation():
+    stub = _StubOllama([f"t{i} " for i in range(200)], delay=0.01)
+    runner, url = await _serve(stub)
+    streamer = OllamaChatStreamer("llama", base_url=url)
+    try:
+        tokens = streamer.stream([{"role": "user", "content": "q"}])
+        received = [await tokens.__anext__() for _ in range(3)]
+        await tokens.aclose() # What a client disconnect does to the SSE generator
+        await asyncio.wait_for(stub.disconnected.wait(), timeout=2)
+    finally:
+        await streamer.close()
+        await runner.cleanup()
+    assert received == ["t0 ", "t1 ", "t2 "]
+    assert stub.sent < 200
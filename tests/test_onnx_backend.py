@@ -0,0 +1,40 @@
+import numpy as np
+
+from services.onnx_backend import max_sequence_length, mean_pool, model_dir, softmax
+
+def test_mean_pool_ignores_padding_and_normalizes():
+    hidden = np.array([[[1.0, 0.0], [3.0, 0.0], [100.0, 100.0]]])
+    mask = np.array([[1, 1, 0]])
+    assert np.allclose(mean_pool(hidden, mask, normalize=False), [[2.0, 0.0]])
+    assert np.allclose(mean_pool(hidden, mask), [[1.0, 0.0]])
+
+def test_softmax_and_cache_layout():
+    probs = softmax(np.array([[1000.0, 1000.0, -1000.0]]))
+    assert np.allclose(probs, [[0.5, 0.5, 0.0]])
+    assert model_dir("cross-encoder/ms-marco-MiniLM-L-6-v2", "/tmp/onnx") == "/tmp/onnx/cross-encoder__ms-marco-MiniLM-L-6-v2"
+
+def test_failed_export_falls_back_to_torch(monkeypatch):
+    import sys
+    import types
+    from services import onnx_backend
+
+    def broken_export(*args, **kwargs):
+        raise RuntimeError("export failed")
+
+    fake = types.ModuleType("sentence_transformers")
+    fake.CrossEncoder = lambda name: ("torch-cross-encoder", name)
+    fake.SentenceTransformer = lambda name: ("torch-encoder", name)
+    monkeypatch.setitem(sys.modules, "sentence_transformers", fake)
+    monkeypatch.setattr(onnx_backend.ONNXCrossEncoder, "__init__", broken_export)
+    monkeypatch.setattr(onnx_backend.ONNXSentenceEncoder, "__init__", broken_export)
+
+    assert onnx_backend.load_cross_encoder("ce", backend="onnx-int8") == ("torch-cross-encoder", "ce")
+    assert onnx_backend.load_sentence_encoder("st", backend="onnx") == ("torch-encoder", "st")
+
+def test_max_length_follows_the_sentence_transformers_model(tmp_path):
+    import json
+    from types import SimpleNamespace
+    assert max_sequence_length(str(tmp_path), SimpleNamespace(model_max_length=512)) == 512
+    assert max_sequence_length(str(tmp_path), SimpleNamespace(model_max_length=10 ** 30)) == 512
+    (tmp_path / "sentence_bert_config.json").write_text(json.dumps({"max_seq_length": 256, "do_lower_case": False}))
+    assert max_sequence_length(str(tmp_path), SimpleNamespace(model_max_length=512)) == 256
@@ -0,0 +1,120 @@
+import numpy as np
+import pytest
+from core.quantization import PolarQuant
+from core.quantization.polar_quant import pack_codes, unpack_codes
+
+@pytest.mark.parametrize("bits", [2, 3, 4])
+def test_pack_roundtrip(bits):
+    codes = np.random.default_rng(bits).integers(0, 1 << bits, (5, 768), dtype=np.uint8)
+    packed = pack_codes(codes, bits)
+    assert packed.shape == (5, 768 * bits // 8)
+    np.testing.assert_array_equal(unpack_codes(packed, bits, 768), codes)
+
+def test_packed_code_size_and_accuracy():
+    pq = PolarQuant(dim=768, bits=3)
+    vecs = np.random.default_rng(0).standard_normal((8, 768)).astype(np.float32)
+    codes = pq.encode_batch(vecs)
+    assert all(len(c) == pq.code_size == 294 for c in codes)
+
+    approx = pq.decode_batch(codes)
+    cos = np.sum(approx * vecs, axis=1) / (np.linalg.norm(approx, axis=1) * np.linalg.norm(vecs, axis=1))
+    assert cos.min() > 0.7
+    np.testing.assert_allclose(pq.decode_approximate(pq.encode(vecs[0])), approx[0], rtol=1e-5, atol=1e-5)
+
+def test_legacy_unpacked_codes_still_decode():
+    pq = PolarQuant(dim=768, bits=3, rotation="random_gaussian")
+    vec = np.random.default_rng(1).standard_normal(768).astype(np.float32)
+    rotated = np.dot(vec, pq.rotation_matrix)
+    norm = np.linalg.norm(rotated)
+    legacy = np.clip(np.round((rotated / norm + 1.0) * 3.5), 0, 7).astype(np.uint8)
+    legacy_bytes = np.array([norm], dtype=np.float32).tobytes() + legacy.tobytes()
+
+    np.testing.assert_allclose(pq.decode_approximate(legacy_bytes), pq.decode_approximate(pq.encode(vec)), atol=1e-4)
+
+def test_mixed_versions_bits_and_rotations_decode_per_code():
+    from core.quantization.registry import get_polar_quant
+    vecs = np.random.default_rng(3).standard_normal((3, 768))
+    gaussian = get_polar_quant(dim=768, bits=3, rotation="random_gaussian")
+    rotated = np.dot(vecs[0], gaussian.rotation_matrix)
+    norm = np.linalg.norm(rotated)
+    legacy = np.array([norm], dtype=np.float32).tobytes() + \
+        np.clip(np.round((rotated / norm + 1.0) * 3.5), 0, 7).astype(np.uint8).tobytes()
+    four_bit = PolarQuant(dim=768, bits=4)
+    codes = [legacy, four_bit.encode(vecs[1]), gaussian.encode(vecs[2]), PolarQuant(dim=768).encode(vecs[1])]
+
+    decoded = PolarQuant(dim=768, bits=3).decode_batch(codes)
+    np.testing.assert_allclose(decoded[0], gaussian.decode_approximate(legacy))
+    np.testing.assert_allclose(decoded[1], four_bit.decode_approximate(codes[1]))
+    np.testing.assert_allclose(decoded[2], gaussian.decode_approximate(codes[2]))
+    cos = np.sum(decoded[:3] * vecs[[0, 1, 2]], axis=1) / np.linalg.norm(decoded[:3], axis=1) / np.linalg.norm(vecs, axis=1)
+    assert cos.min() > 0.7
+
+def test_hadamard_rotation_is_orthonormal_and_reproducible():
+    pq = PolarQuant(dim=768, rotation="hadamard", seed=7)
+    assert pq.rotation_matrix is None
+    x = np.random.default_rng(2).standard_normal((4, 768))
+    rotated = pq.rotate(x)
+    np.testing.assert_allclose(np.linalg.norm(rotated, axis=1), np.linalg.norm(x, axis=1))
+    np.testing.assert_allclose(pq.unrotate(rotated), x, atol=1e-10)
+    np.testing.assert_array_equal(PolarQuant(dim=768, rotation="hadamard", seed=7).rotate(x), rotated)
+
+    codes = pq.encode_batch(x)
+    with pytest.raises(ValueError):
+        pq.decode_batch([codes[0][:-1]])
+
+def test_default_rotation_and_unknown_rotation():
+    from config import settings
+    assert PolarQuant(dim=64).rotation == settings.POLARQUANT_ROTATION == "hadamard"
+    with pytest.raises(ValueError):
+        PolarQuant(dim=64, rotation="gausian")
+
+def test_registry_shares_read_only_instances_without_touching_global_rng():
+    from core.quantization import get_polar_quant, get_qjl
+    np.random.seed(123)
+    expected = np.random.rand()
+    np.random.seed(123)
+
+    pq = get_polar_quant(dim=64, bits=3, rotation="random_gaussian")
+    qjl = get_qjl(dim=64, jl_dim=32)
+    assert np.random.rand() == expected
+    assert get_polar_quant(dim=64, bits=3, rotation="random_gaussian") is pq
+    assert get_polar_quant(dim=64, bits=4, rotation="random_gaussian") is not pq
+    assert get_qjl(dim=64, jl_dim=32) is qjl
+    assert not pq.rotation_matrix.flags.writeable and not qjl.J.flags.writeable
+
+def test_shared_memory_segment_is_built_once_and_attached():
+    import os
+    from core.quantization import registry, unlink_shared
+    name = f"hgpt_test_{os.getpid()}"
+    calls = []
+    def build():
+        calls.append(1)
+        return np.arange(6, dtype=np.float64).reshape(2, 3)
+    try:
+        first = registry._shared_array(name, (2, 3), build)
+        second = registry._shared_array(name, (2, 3), build)
+        np.testing.assert_array_equal(first, second)
+        assert len(calls) == 1 and not second.flags.writeable
+    finally:
+        assert unlink_shared(name)
+    assert not unlink_shared(name)
+
+def test_stale_shared_memory_segment_is_recreated(monkeypatch):
+    import os
+    from multiprocessing import shared_memory
+    from core.quantization import registry, unlink_shared
+    monkeypatch.setattr(registry, "_READY_TIMEOUT", 0.05)
+    expected = np.arange(6, dtype=np.float64).reshape(2, 3)
+    for suffix, size, ready in (("small", 16, True), ("unready", 56, False)):
+        name = f"hgpt_test_{suffix}_{os.getpid()}"
+        # Left behind by a different shape, or by a creator that died before publishing
+        stale = shared_memory.SharedMemory(name=name, create=True, size=size)
+        stale.buf[0] = registry._READY if ready else 0
+        stale.close()
+        try:
+            np.testing.assert_array_equal(registry._shared_array(name, (2, 3), lambda: expected), expected)
+            attached = shared_memory.SharedMemory(name=name)
+            assert attached.size >= 56 and attached.buf[0] == registry._READY
+            attached.close()
+        finally:
+            unlink_shared(name)
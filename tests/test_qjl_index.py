@@ -0,0 +1,60 @@
+import numpy as np
+from core.quantization import QJLRetriever, QJLCodeIndex
+
+def _random_codes(n, n_bytes=32, seed=0):
+    rng = np.random.default_rng(seed)
+    return [rng.integers(0, 256, n_bytes, dtype=np.uint8).tobytes() for _ in range(n)]
+
+def test_search_matches_pairwise_estimator():
+    qjl = QJLRetriever(dim=768)
+    codes = _random_codes(500)
+    ids = [f"doc_{i}" for i in range(len(codes))]
+    index = QJLCodeIndex(n_bits=256, initial_capacity=8)
+    index.upsert(ids, codes)
+
+    query = _random_codes(1, seed=1)[0]
+    top_ids, sims = index.search(query, k=10)
+
+    expected = sorted(((qjl.estimate_similarity(query, c), i) for i, c in zip(ids, codes)), key=lambda x: -x[0])[:10]
+    assert len(top_ids) == 10
+    np.testing.assert_allclose(sims, [s for s, _ in expected], atol=1e-6)
+    assert top_ids[0] == expected[0][1] or sims[0] == sims[1]
+
+def test_upsert_remove_and_reset():
+    codes = _random_codes(4)
+    index = QJLCodeIndex(n_bits=256)
+    index.upsert(["a", "b", "c", "d"], codes)
+    index.remove(["b", "missing"])
+    assert len(index) == 3 and "b" not in index
+
+    top_ids, sims = index.search(codes[3], k=1)
+    assert top_ids == ["d"] and sims[0] == 1.0
+
+    index.upsert(["a"], [codes[3]])
+    assert len(index) == 3
+    assert set(index.search(codes[3], k=2)[0]) == {"a", "d"}
+
+    index.reset(["x"], [codes[0]])
+    assert len(index) == 1 and index.search(codes[0], k=5)[0] == ["x"]
+
+def test_batch_and_matrix_kernels_match_pairwise():
+    qjl = QJLRetriever(dim=768)
+    codes = _random_codes(50)
+    queries = _random_codes(3, seed=2)
+
+    batch = qjl.estimate_similarity_batch(queries[0], codes)
+    assert batch.dtype == np.float32
+    np.testing.assert_allclose(batch, [qjl.estimate_similarity(queries[0], c) for c in codes], atol=1e-6)
+
+    matrix = qjl.estimate_similarity_matrix(queries, codes)
+    assert matrix.shape == (3, 50)
+    for row, q in zip(matrix, queries):
+        np.testing.assert_allclose(row, qjl.estimate_similarity_batch(q, codes), atol=1e-6)
+
+def test_encode_signs_matches_byte_packing():
+    qjl = QJLRetriever(dim=768)
+    vecs = np.random.default_rng(3).standard_normal((4, 768)).astype(np.float32)
+    words = qjl.encode_signs(vecs)
+    for v, w in zip(vecs, words):
+        packed = qjl._pack_bits(np.sign(np.dot(v, qjl.J)))
+        assert w.tobytes() == packed
@@ -0,0 +1,56 @@
+import asyncio
+
+import pytest
+
+from services.reranker import RerankerService
+
+class _LengthModel:
+    """Score = words in the doc; records every predict batch"""
+    def __init__(self):
+        self.batches = []
+
+    def predict(self, pairs, batch_size=32):
+        self.batches.append([len(doc.split()) for _, doc in pairs])
+        return [float(len(doc.split())) for _, doc in pairs]
+
+@pytest.mark.asyncio
+async def test_concurrent_requests_share_length_sorted_batches():
+    model = _LengthModel()
+    service = RerankerService(model, batch_size=4, window_ms=20)
+    queries = [["a b c", "a", "a b c d e f"], ["a b", "a b c d"], ["a b c d e"]]
+    results = await asyncio.gather(*(service.score("q", docs) for docs in queries))
+    service.close()
+
+    # Every caller gets its own scores, in its own order
+    assert results == [[3.0, 1.0, 6.0], [2.0, 4.0], [5.0]]
+    # Six pairs pooled into one window, scored shortest first in batches of at most 4
+    assert service.stats["batches"] == 1 and service.stats["requests"] == 3
+    assert model.batches == [[1, 2, 3, 4], [5, 6]]
+
+@pytest.mark.asyncio
+async def test_model_errors_reach_every_caller():
+    class Broken:
+        def predict(self, pairs, batch_size=32):
+            raise RuntimeError("model crashed")
+
+    service = RerankerService(Broken(), window_ms=5)
+    with pytest.raises(RuntimeError):
+        await service.score("q", ["doc"])
+    assert await service.score("q", []) == []
+    service.close()
+
+@pytest.mark.asyncio
+async def test_failed_batch_only_fails_its_own_callers():
+    class LongDocsCrash(_LengthModel):
+        def predict(self, pairs, batch_size=32):
+            if any(len(doc.split()) > 4 for _, doc in pairs):
+                raise RuntimeError("sequence too long")
+            return super().predict(pairs, batch_size)
+
+    service = RerankerService(LongDocsCrash(), batch_size=2, window_ms=20)
+    results = await asyncio.gather(service.score("q", ["a", "a b"]), service.score("q", ["a b c d e f"]),
+                                   return_exceptions=True)
+    service.close()
+    assert results[0] == [1.0, 2.0]
+    assert isinstance(results[1], RuntimeError)
+    assert service.stats["batches"] == 1
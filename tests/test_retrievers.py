@@ -28,4 +28,59 @@ async def test_distributed_bm25():
     results = await retriever.retrieve("Document 50", top_k=5)
     
     assert len(results) == 5
-    assert "id_50" in [r[0] for r in results]
\ No newline at end of file
+    assert "id_50" in [r[0] for r in results]
+
+def _corpus():
+    words = ["alpha", "beta", "gamma", "delta", "omega"]
+    return [" ".join(words[(i * j) % len(words)] for j in range(1, 2 + i % 7)) for i in range(60)]
+
+@pytest.mark.asyncio
+async def test_distributed_bm25_matches_single_index():
+    docs = _corpus()
+    ids = [f"d{i}" for i in range(len(docs))]
+    single = BM25Retriever()
+    single.fit(docs, ids)
+    sharded = DistributedBM25(shard_size=7, max_workers=4)
+    await sharded.add_documents(docs[:30], ids[:30])
+    await sharded.add_documents(docs[30:], ids[30:])
+
+    assert len(sharded.shards) == 9
+    for query in ("alpha", "gamma omega", "beta beta delta"):
+        expected = single.retrieve(query, top_k=10)
+        results = await sharded.retrieve(query, top_k=10)
+        assert [s for _, s in results] == pytest.approx([s for _, s in expected])
+    sharded.close()
+
+@pytest.mark.asyncio
+async def test_distributed_bm25_persisted_shards(tmp_path):
+    docs = _corpus()
+    ids = [f"d{i}" for i in range(len(docs))]
+    writer = DistributedBM25(shard_size=25, index_dir=str(tmp_path), max_workers=2)
+    await writer.add_documents(docs, ids)
+    expected = await writer.retrieve("gamma omega", top_k=5)
+    writer.close()
+
+    reader = DistributedBM25(shard_size=25, index_dir=str(tmp_path), max_workers=2)
+    assert reader.n_docs == len(docs)
+    assert await reader.retrieve("gamma omega", top_k=5) == expected
+    reader.close()
+
+@pytest.mark.asyncio
+async def test_distributed_bm25_readd_replaces_previous_copy(tmp_path):
+    docs = _corpus()
+    ids = [f"d{i}" for i in range(len(docs))]
+    writer = DistributedBM25(shard_size=25, index_dir=str(tmp_path), max_workers=2)
+    await writer.add_documents(docs, ids)
+    writer.close()
+
+    # A fresh instance routes re-added ids from the shard files it mapped
+    sharded = DistributedBM25(shard_size=25, index_dir=str(tmp_path), max_workers=2)
+    await sharded.add_documents(["zeta alpha", "zeta zeta"], ["d3", "d40"])
+    single = BM25Retriever()
+    single.fit(docs + ["zeta alpha", "zeta zeta"], ids + ["d3", "d40"])
+    for query in ("zeta", "alpha", "gamma omega"):
+        results = await sharded.retrieve(query, top_k=10)
+        assert len({d for d, _ in results}) == len(results)
+        assert [s for _, s in results] == pytest.approx([s for _, s in single.retrieve(query, top_k=10)])
+    assert [d for d, _ in await sharded.retrieve("zeta", top_k=5)] == ["d40", "d3"]
+    sharded.close()
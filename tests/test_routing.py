@@ -0,0 +1,60 @@
+import time
+
+import numpy as np
+
+from core.routing import EmbeddingRouter, RoutingLog
+
+def _clusters(n=20, dim=64, seed=0):
+    """Four well separated routes: noisy copies of one random direction each"""
+    rng = np.random.default_rng(seed)
+    centers = {route: rng.normal(size=dim) for route in ("fast", "deep", "agentic", "graph")}
+    embeddings, labels = [], []
+    for route, center in centers.items():
+        for _ in range(n):
+            embeddings.append(center + 0.3 * rng.normal(size=dim))
+            labels.append(route)
+    return np.array(embeddings), labels, centers
+
+def test_routes_to_nearest_centroid_with_confidence():
+    embeddings, labels, centers = _clusters()
+    router = EmbeddingRouter(temperature=0.05).fit(embeddings, labels)
+    for route, center in centers.items():
+        predicted, confidence = router.predict(center)
+        assert predicted == route and confidence > 0.9
+    # Halfway between two fitted centroids: a coin flip, not a confident answer
+    unit = embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)
+    mean = {route: unit[[l == route for l in labels]].mean(axis=0) for route in centers}
+    _, confidence = router.predict(mean["fast"] / np.linalg.norm(mean["fast"]) + mean["deep"] / np.linalg.norm(mean["deep"]))
+    assert confidence < 0.6
+    assert abs(sum(router.scores(centers["graph"]).values()) - 1.0) < 1e-9
+
+def test_partial_fit_matches_fit_and_roundtrips(tmp_path):
+    embeddings, labels, centers = _clusters()
+    full = EmbeddingRouter(embedding_model="nomic-embed-text").fit(embeddings, labels)
+    incremental = EmbeddingRouter(embedding_model="nomic-embed-text")
+    incremental.partial_fit(embeddings[:30], labels[:30]).partial_fit(embeddings[30:], labels[30:])
+    path = str(tmp_path / "router.json")
+    incremental.save(path)
+    loaded = EmbeddingRouter.load(path)
+    assert loaded.ready and loaded.embedding_model == "nomic-embed-text"
+    assert loaded.counts == [20, 20, 20, 20]
+    for center in centers.values():
+        assert loaded.predict(center) == full.predict(center)
+
+def test_prediction_is_sub_millisecond():
+    embeddings, labels, centers = _clusters(dim=768)
+    router = EmbeddingRouter().fit(embeddings, labels)
+    query = centers["deep"]
+    start = time.perf_counter()
+    for _ in range(200):
+        router.predict(query)
+    assert (time.perf_counter() - start) / 200 < 1e-3
+
+def test_routing_log_keeps_latest_valid_llm_decision(tmp_path):
+    log = RoutingLog(str(tmp_path / "log" / "routing.jsonl"))
+    log.append("what is knn", "deep")
+    log.append("what is knn", "fast")
+    log.append("weather today", "agentic")
+    log.append("weather today", "fast", source="local")
+    log.append("bad", "unknown")
+    assert sorted(log.read()) == [("weather today", "agentic"), ("what is knn", "fast")]
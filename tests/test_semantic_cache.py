@@ -0,0 +1,60 @@
+import numpy as np
+import pytest
+
+from core.cache.semantic import SemanticCache
+
+def _unit(rng, dim=768):
+    v = rng.standard_normal(dim)
+    return v / np.linalg.norm(v)
+
+def _near(rng, v, noise=0.05):
+    w = v + noise * _unit(rng, len(v))
+    return w / np.linalg.norm(w)
+
+@pytest.mark.asyncio
+async def test_hits_on_paraphrase_and_respects_corpus_version():
+    rng = np.random.default_rng(0)
+    cache = SemanticCache(threshold=0.95)
+    question = _unit(rng)
+    await cache.set(question.tolist(), "g1", {"answer": "42"})
+
+    hit = await cache.get(_near(rng, question).tolist(), "g1")
+    assert hit is not None and hit[0] == {"answer": "42"} and hit[1] >= 0.95
+    assert await cache.get(_unit(rng).tolist(), "g1") is None # Unrelated question
+    assert await cache.get(question.tolist(), "g2") is None # Corpus changed
+    assert cache.stats == {"hits": 1, "misses": 2}
+
+@pytest.mark.asyncio
+async def test_scopes_do_not_evict_each_other():
+    rng = np.random.default_rng(3)
+    cache = SemanticCache(threshold=0.95)
+    question = _unit(rng)
+    await cache.set(question.tolist(), "5", {"answer": "fast"}, scope="fast:4")
+    assert await cache.get(question.tolist(), "5", scope="deep:4") is None
+    await cache.set(question.tolist(), "5", {"answer": "deep"}, scope="deep:4")
+    assert (await cache.get(question.tolist(), "5", scope="fast:4"))[0] == {"answer": "fast"}
+    assert (await cache.get(question.tolist(), "5", scope="deep:4"))[0] == {"answer": "deep"}
+
+@pytest.mark.parametrize("policy, evicted, survivor", [("lru", "a", "b"), ("lfu", "b", "a")])
+@pytest.mark.asyncio
+async def test_eviction_policies(policy, evicted, survivor):
+    rng = np.random.default_rng(1)
+    cache = SemanticCache(max_entries=2, policy=policy)
+    vectors = {name: _unit(rng) for name in "abc"}
+    await cache.set(vectors["a"].tolist(), "g", "a")
+    await cache.set(vectors["b"].tolist(), "g", "b")
+    for name in "aab": # a is the most frequent, b the most recent
+        assert (await cache.get(vectors[name].tolist(), "g"))[0] == name
+    await cache.set(vectors["c"].tolist(), "g", "c")
+    assert await cache.get(vectors[evicted].tolist(), "g") is None
+    assert (await cache.get(vectors[survivor].tolist(), "g"))[0] == survivor
+    assert (await cache.get(vectors["c"].tolist(), "g"))[0] == "c"
+
+@pytest.mark.asyncio
+async def test_falls_back_in_process_without_redis():
+    rng = np.random.default_rng(2)
+    cache = SemanticCache(redis_url="redis://127.0.0.1:1")
+    question = _unit(rng)
+    await cache.set(question.tolist(), "g", {"answer": "local"})
+    assert not cache.shared
+    assert (await cache.get(question.tolist(), "g"))[0] == {"answer": "local"}
@@ -0,0 +1,48 @@
+import asyncio
+
+import pytest
+
+from core.speculation import Speculation, query_similarity
+
+def test_query_similarity():
+    assert query_similarity("What is RAG?", "what is  rag") == 1.0
+    assert query_similarity("what is rag", "what is rag fusion") == 0.75
+    assert query_similarity("what is rag", "") == 0.0
+
+@pytest.mark.asyncio
+async def test_near_identical_query_reuses_the_started_work():
+    calls = []
+
+    async def retrieve(query):
+        calls.append(query)
+        await asyncio.sleep(0.01)
+        return [f"doc for {query}"]
+
+    speculation = Speculation("what is rag", retrieve("what is rag"), threshold=0.8)
+    await asyncio.sleep(0) # Routing / rewriting would run here
+    assert await speculation.resolve("What is RAG?") == ["doc for what is rag"]
+    assert calls == ["what is rag"]
+
+@pytest.mark.asyncio
+async def test_diverging_query_cancels_the_work():
+    cancelled = asyncio.Event()
+
+    async def retrieve():
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.set()
+            raise
+
+    speculation = Speculation("what is it", retrieve(), threshold=0.8)
+    await asyncio.sleep(0)
+    assert await speculation.resolve("what is the rag pipeline license") is None
+    await asyncio.wait_for(cancelled.wait(), timeout=1)
+
+@pytest.mark.asyncio
+async def test_failed_work_falls_back_to_the_caller():
+    async def retrieve():
+        raise RuntimeError("vector store down")
+
+    speculation = Speculation("q one two", retrieve())
+    assert await speculation.resolve("q one two") is None
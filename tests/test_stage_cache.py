@@ -0,0 +1,21 @@
+from core.cache.stage import StageCache, history_key, normalize_query
+
+def test_stage_cache_lru_and_corpus_version():
+    cache = StageCache("route", max_entries=2)
+    cache.set(normalize_query("What is RAG? "), "1", "fast")
+    assert cache.get(normalize_query("what  is rag"), "1") == "fast"
+    cache.set("b", "1", "deep")
+    cache.get("what is rag", "1") # Most recently used
+    cache.set("c", "1", "graph")
+    assert cache.get("b", "1") is None
+    assert cache.get("c", "1") == "graph"
+    # A new corpus generation invalidates everything
+    assert cache.get("c", "2") is None
+    assert cache.stats == {"hits": 3, "misses": 2}
+
+def test_stage_cache_ttl_and_history_key():
+    cache = StageCache("rewrite", ttl=-1)
+    key = ("follow up", history_key(["user: a", "assistant: b"]))
+    cache.set(key, "1", "standalone")
+    assert cache.get(key, "1") is None
+    assert history_key(["user: a", "assistant: b"]) != history_key(["user: a assistant: b"])
@@ -0,0 +1,66 @@
+"""
+Train the local embedding router used by adaptive mode.
+
+Training data:
+  - SEED_QUERIES (hand-labelled, every route covered)
+  - LLM routing decisions logged by the service (ROUTER_LOG_PATH)
+  - with --label-trainset: the DSPy trainset and golden dataset questions,
+    labelled by the LLM router
+
+The router is saved to ROUTER_MODEL_PATH (next to data/compiled_rag.json).
+Compare it against the LLM router with tests/router_eval.py.
+"""
+import argparse
+import json
+import logging
+from collections import Counter
+
+from config import settings
+from core.routing import SEED_QUERIES, EmbeddingRouter, RoutingLog
+from services.embedding_client import OllamaEmbeddingClient
+
+logging.basicConfig(level=logging.INFO)
+
+def dataset_questions():
+    """Questions of the DSPy trainset and the golden dataset (unlabelled)"""
+    from train_dspy import trainset
+    questions = [example.question for example in trainset]
+    try:
+        with open("./dataset/golden_dataset.json") as f:
+            questions += json.load(f)["question"]
+    except (OSError, KeyError, ValueError):
+        pass
+    return list(dict.fromkeys(questions))
+
+def training_examples(label_trainset: bool = False):
+    examples = {q: route for route, queries in SEED_QUERIES.items() for q in queries}
+    # Logged decisions override the seeds; the seeds stay the fallback for unseen routes
+    examples.update(RoutingLog(settings.ROUTER_LOG_PATH).read())
+    if label_trainset:
+        from dspy_module import RAGModule
+        module = RAGModule()
+        for question in dataset_questions():
+            if question not in examples:
+                route = module.classify_route(question)
+                if route:
+                    examples[question] = route
+    return list(examples.items())
+
+def train(label_trainset: bool = False, output: str = None) -> EmbeddingRouter:
+    examples = training_examples(label_trainset)
+    client = OllamaEmbeddingClient(model_name=settings.OLLAMA_EMBEDDING_MODEL, base_url=settings.OLLAMA_URL,
+                                   batch_size=settings.OLLAMA_EMBED_BATCH_SIZE)
+    embeddings = client.embed([question for question, _ in examples])
+    router = EmbeddingRouter(temperature=settings.ROUTER_TEMPERATURE, embedding_model=settings.OLLAMA_EMBEDDING_MODEL)
+    router.fit(embeddings, [route for _, route in examples])
+    router.save(output or settings.ROUTER_MODEL_PATH)
+    print(f"Trained on {len(examples)} queries {dict(Counter(route for _, route in examples))}")
+    print(f"Saved to {output or settings.ROUTER_MODEL_PATH}")
+    return router
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--label-trainset", action="store_true", help="Label the DSPy trainset with the LLM router")
+    parser.add_argument("--output", default=None, help="Router path (default: ROUTER_MODEL_PATH)")
+    args = parser.parse_args()
+    train(args.label_trainset, args.output)